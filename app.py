@@ -1,36 +1,66 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
 from flask_login import LoginManager
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
 
 from models import db, init_db, User
-from routes.auth import auth as auth_blueprint
-from routes.main import main as main_blueprint
-from routes.admin import admin as admin_blueprint
-from routes.doctor import doctor as doctor_blueprint
-from routes.patient import patient as patient_blueprint
-from routes.api import api as api_blueprint
+from services.events import change_feed
+from services.replica import replica
+from services.shards import shard_router
+from services.directory import directory
+from services.admission import admission
+from services.assets import assets
+from services.fragments import fragments
+from services.analytics import analytics
+from cli import register_commands
 
 load_dotenv()
 
-app = Flask(__name__)
-
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS')
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-app.config['DEBUG'] = os.getenv('FLASK_DEBUG')
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+
 
+def env_flag(name, default='False'):
+    # "False" in .env must not turn into a truthy string
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
 
-db.init_app(app)
 
-with app.app_context():
-    init_db()
+def worker_threads():
+    # same defaults as gunicorn.conf.py
+    threaded = os.getenv('GUNICORN_WORKER_CLASS') == 'gthread'
+    return int(os.getenv('GUNICORN_THREADS', 4 if threaded else 1))
+
+
+def engine_options(uri):
+    # one pooled connection per request thread; overflow only absorbs short bursts
+    if not uri or ':memory:' in uri:
+        return {}
+    threads = worker_threads()
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', threads)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 2)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    }
+
+
+def check_pool_size(app, threads, log):
+    opts = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    pool_size = opts.get('pool_size', 5)
+    max_overflow = opts.get('max_overflow', 10)
+    if pool_size + max_overflow < threads:
+        log.warning('DB pool (%s + %s overflow) is smaller than %s threads per worker; requests will queue for '
+                    'connections. Set DB_POOL_SIZE to the thread count.', pool_size, max_overflow, threads)
+    elif pool_size < threads:
+        log.warning('DB pool_size %s is below %s threads per worker; busy workers will churn overflow connections.',
+                    pool_size, threads)
+    elif pool_size > threads * 2:
+        log.warning('DB pool_size %s is far above %s threads per worker; the extra connections are never used.',
+                    pool_size, threads)
 
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -42,17 +72,99 @@ def unauthorized():
         return jsonify({'error': 'Unauthorized'}), 401
     return redirect(url_for('auth.login'))
 
-@app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
-app.register_blueprint(auth_blueprint)
-app.register_blueprint(main_blueprint)
-app.register_blueprint(admin_blueprint)
-app.register_blueprint(doctor_blueprint)
-app.register_blueprint(patient_blueprint)
-app.register_blueprint(api_blueprint)
+
+def create_app():
+    app = Flask(__name__)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = env_flag('SQLALCHEMY_TRACK_MODIFICATIONS')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    binds = {}
+    if os.getenv('REPLICA_DATABASE_URI'):
+        binds['replica'] = os.getenv('REPLICA_DATABASE_URI')
+    # department sharding: one database per shard, departments spread by id
+    shard_uris = [u.strip() for u in os.getenv('SHARD_DATABASE_URIS', '').split(',') if u.strip()]
+    binds.update({f'shard{i}': uri for i, uri in enumerate(shard_uris)})
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['REPLICA_MAX_LAG'] = float(os.getenv('REPLICA_MAX_LAG', 5))
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    app.config['DEBUG'] = env_flag('FLASK_DEBUG')
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config['EVENT_POLL_INTERVAL'] = float(os.getenv('EVENT_POLL_INTERVAL', 1.0))
+    app.config['REMINDER_LEAD_HOURS'] = float(os.getenv('REMINDER_LEAD_HOURS', 24))
+    app.config['IDEMPOTENCY_KEY_TTL'] = float(os.getenv('IDEMPOTENCY_KEY_TTL', 24))
+    app.config['WORKER_THREADS'] = worker_threads()
+    app.config['RATE_LIMIT_ENABLED'] = env_flag('RATE_LIMIT_ENABLED', 'True')
+    app.config['RATE_LIMIT_DB'] = os.getenv('RATE_LIMIT_DB')
+    app.config['SHED_QUEUE_MS'] = float(os.getenv('SHED_QUEUE_MS', 0))
+    # per-class admission limits ("requests/seconds") and thread shares; unset keeps the defaults
+    for name in ('LOGIN', 'BOOKING', 'API'):
+        for key in ('IP', 'USER', 'SHARE'):
+            app.config[f'RATE_LIMIT_{name}_{key}'] = os.getenv(f'RATE_LIMIT_{name}_{key}')
+    app.config['PROXY_FIX_X_FOR'] = int(os.getenv('PROXY_FIX_X_FOR', 0))
+    app.config['COMPRESS_RESPONSES'] = env_flag('COMPRESS_RESPONSES', 'True')
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+    app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))
+    app.config['STATIC_FINGERPRINT'] = env_flag('STATIC_FINGERPRINT', 'True')
+    app.config['FRAGMENT_CACHE_SIZE'] = int(os.getenv('FRAGMENT_CACHE_SIZE', 4 * 1024 * 1024))
+    app.config['ANALYTICS_PROCESSES'] = int(os.getenv('ANALYTICS_PROCESSES', os.cpu_count() or 1))
+    app.config['ANALYTICS_POOL_MIN_DAYS'] = int(os.getenv('ANALYTICS_POOL_MIN_DAYS', 90))
+    app.config['ANALYTICS_CACHE_TTL'] = float(os.getenv('ANALYTICS_CACHE_TTL', 300))
+    app.config['FREEBUSY_SLOT_MINUTES'] = int(os.getenv('FREEBUSY_SLOT_MINUTES', 15))
+
+    # compiled templates survive restarts, so new workers skip Jinja parsing/compiling
+    cache_dir = os.getenv('JINJA_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(cache_dir)}
+
+    # no schema work here: tables are created once by `flask init-db` / migrations/migration.py,
+    # not on every worker boot
+    # admission checks run first, before any other request hook touches the database
+    admission.init_app(app)
+    db.init_app(app)
+    change_feed.init_app(app)
+    replica.init_app(app)
+    shard_router.init_app(app)
+    directory.init_app(app)
+    assets.init_app(app)
+    fragments.init_app(app)
+    analytics.init_app(app)
+    login_manager.init_app(app)
+
+    app.register_error_handler(404, page_not_found)
+
+    from routes.auth import auth as auth_blueprint
+    from routes.main import main as main_blueprint
+    from routes.admin import admin as admin_blueprint
+    from routes.doctor import doctor as doctor_blueprint
+    from routes.patient import patient as patient_blueprint
+    from routes.api import api as api_blueprint
+
+    app.register_blueprint(auth_blueprint)
+    app.register_blueprint(main_blueprint)
+    app.register_blueprint(admin_blueprint)
+    app.register_blueprint(doctor_blueprint)
+    app.register_blueprint(patient_blueprint)
+    app.register_blueprint(api_blueprint)
+
+    register_commands(app)
+
+    if app.config['PROXY_FIX_X_FOR']:
+        # behind a proxy remote_addr is the proxy; take the client from X-Forwarded-For so
+        # per-IP rate limits don't put every client in one bucket
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    return app
+
+
+# module-level instance for `gunicorn app:app` and `flask --app app`
+app = create_app()
 
 if __name__ == '__main__':
+    # convenience for the dev server on a fresh checkout
+    with app.app_context():
+        init_db()
     app.run()
-
@@ -0,0 +1,203 @@
+import re
+import json
+from datetime import datetime, time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+try:
+    import aiosqlite  # noqa: F401
+except ImportError as e:
+    raise ImportError('The async API tier needs aiosqlite and an ASGI server: pip install -r requirements-async.txt') from e
+
+from itsdangerous import BadSignature
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import db, User, DoctorProfile, PatientProfile, Appointment, DoctorAvailability, Role
+from services import booking, lookups
+from services.shards import shard_router
+
+# eager loads matching what each to_dict() touches; lazy loads are not allowed under asyncio
+DOCTOR_LOAD = selectinload(User.doctor_profile).selectinload(DoctorProfile.department)
+APPOINTMENT_LOAD = [
+    selectinload(Appointment.patient).selectinload(PatientProfile.user),
+    selectinload(Appointment.doctor).selectinload(DoctorProfile.user),
+    selectinload(Appointment.doctor).selectinload(DoctorProfile.department),
+]
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+
+
+# Read-only subset of routes/api.py served from an asyncio event loop, so slow clients and
+# long exports wait on sockets instead of occupying a sync worker. Shares the models, the
+# database and the Flask session cookie with the main app.
+class AsyncAPI:
+    def __init__(self, flask_app, stream_batch=500):
+        if shard_router.enabled:
+            # the main database only holds the pre-split copies of the department tables
+            raise RuntimeError('The async API tier does not support sharding; unset SHARD_DATABASE_URIS '
+                               'or serve the API from gunicorn.')
+        with flask_app.app_context():
+            url = db.engine.url.set(drivername='sqlite+aiosqlite')
+        self.engine = create_async_engine(url)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self.stream_batch = stream_batch
+        self.routes = [
+            (re.compile(r'^/api/doctors$'), self.get_doctors),
+            (re.compile(r'^/api/doctors/(\d+)$'), self.get_doctor),
+            (re.compile(r'^/api/doctors/(\d+)/slots$'), self.get_doctor_slots),
+            (re.compile(r'^/api/slots/(\d+)$'), self.get_slot),
+            (re.compile(r'^/api/patients/(\d+)$'), self.get_patient),
+            (re.compile(r'^/api/appointments$'), self.get_appointments),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        for pattern, handler in self.routes:
+            match = pattern.match(scope['path'])
+            if match:
+                break
+        else:
+            return await self.send_json(send, 404, {'error': 'Not found'})
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self.send_json(send, 405, {'error': 'Method not allowed'})
+
+        try:
+            async with self.sessions() as session:
+                await handler(session, scope, send, *map(int, match.groups()))
+        except HTTPError as e:
+            await self.send_json(send, e.status, {'error': e.message})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def send_json(self, send, status, data):
+        body = json.dumps(data).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def current_user(self, session, scope):
+        # same cookie Flask-Login reads; signed with the app's SECRET_KEY
+        cookie = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        if self.cookie_name not in cookie:
+            raise HTTPError(401, 'Unauthorized')
+        try:
+            data = self.serializer.loads(cookie[self.cookie_name].value, max_age=self.max_age)
+        except BadSignature:
+            raise HTTPError(401, 'Unauthorized')
+        if '_user_id' not in data:
+            raise HTTPError(401, 'Unauthorized')
+
+        user = await session.get(User, int(data['_user_id']), options=[
+            selectinload(User.doctor_profile),
+            selectinload(User.patient_profile)
+        ])
+        if not user:
+            raise HTTPError(401, 'Unauthorized')
+        return user
+
+    async def get_doctor_user(self, session, id):
+        doctor = (await session.scalars(select(User).filter_by(id=id).options(DOCTOR_LOAD))).first()
+        if not doctor or doctor.role != Role.DOCTOR:
+            raise HTTPError(404, 'Doctor not found')
+        return doctor
+
+    async def get_doctors(self, session, scope, send):
+        args = parse_qs(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+        stmt = select(User).filter_by(role=Role.DOCTOR).options(DOCTOR_LOAD)
+        if 'ids' not in args:
+            doctors = (await session.scalars(stmt)).all()
+            return await self.send_json(send, 200, [doc.to_dict() for doc in doctors])
+        # multi-get, as on the sync tier: ids in the order asked, unknown ids left out
+        ids = lookups.parse_ids(args['ids'][0])
+        if ids is None:
+            raise HTTPError(400, f'ids must be up to {lookups.MAX_BATCH} comma separated ids')
+        found = {doc.id: doc.to_dict() for doc in (await session.scalars(stmt.filter(User.id.in_(ids)))).all()}
+        await self.send_json(send, 200, [found[i] for i in ids if i in found])
+
+    async def get_doctor(self, session, scope, send, id):
+        doctor = await self.get_doctor_user(session, id)
+        await self.send_json(send, 200, doctor.to_dict())
+
+    async def get_doctor_slots(self, session, scope, send, id):
+        doctor = await self.get_doctor_user(session, id)
+        today = datetime.now().date()
+        profile_id = doctor.doctor_profile.id
+        slots = (await session.scalars(booking.upcoming_slots_stmt(profile_id, today))).all()
+        busy = (await session.execute(booking.busy_windows_stmt(profile_id, datetime.combine(today, time.min)))).all()
+        booked = booking.booked_slot_ids(slots, busy)
+        await self.send_json(send, 200, [slot.to_dict(is_booked=slot.id in booked) for slot in slots])
+
+    async def get_slot(self, session, scope, send, id):
+        slot = await session.get(DoctorAvailability, id)
+        if not slot:
+            raise HTTPError(404, 'Slot not found')
+        start_dt, end_dt = booking.slot_bounds(slot)
+        busy = (await session.execute(booking.busy_windows_stmt(slot.doctor_id, start_dt)
+                                      .filter(Appointment.appointment_start < end_dt).limit(1))).first()
+        await self.send_json(send, 200, slot.to_dict(is_booked=busy is not None))
+
+    async def get_patient(self, session, scope, send, id):
+        user = await self.current_user(session, scope)
+        if user.role == Role.PATIENT and user.id != id:
+            raise HTTPError(403, 'Access denied')
+        patient = await session.get(User, id, options=[selectinload(User.patient_profile)])
+        if not patient or patient.role != Role.PATIENT:
+            raise HTTPError(404, 'Patient not found')
+        await self.send_json(send, 200, patient.to_dict())
+
+    async def get_appointments(self, session, scope, send):
+        user = await self.current_user(session, scope)
+        stmt = select(Appointment).options(*APPOINTMENT_LOAD)
+        if user.role == Role.PATIENT:
+            stmt = stmt.filter(Appointment.patient_id == user.patient_profile.id)
+        elif user.role == Role.DOCTOR:
+            stmt = stmt.filter(Appointment.doctor_id == user.doctor_profile.id)
+
+        # stream the array in batches so an admin export never sits in memory whole
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'application/json'),
+        ]})
+        result = await session.stream_scalars(stmt.execution_options(yield_per=self.stream_batch))
+        first = True
+        async for batch in result.partitions():
+            parts = []
+            for appt in batch:
+                parts.append((b'[' if first else b',') + json.dumps(appt.to_dict()).encode())
+                first = False
+            await send({'type': 'http.response.body', 'body': b''.join(parts), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'[]' if first else b']'})
+
+
+def create_asgi_app():
+    from app import app as flask_app
+    return AsyncAPI(flask_app)
+
+
+app = create_asgi_app()
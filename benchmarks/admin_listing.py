@@ -0,0 +1,116 @@
+import sys
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time to first byte, total time and peak Python memory for the unfiltered admin
+# listings on a seeded database. Fresh process per run: the app reads its database
+# from the environment at import time.
+
+PAGES = ['/admin/appointments', '/admin/patients', '/admin/doctors']
+
+
+def configure(workdir, shards):
+    os.environ['DATABASE_URI'] = f'sqlite:///{workdir}/hms.db'
+    if shards:
+        os.environ['SHARD_DATABASE_URIS'] = ','.join(f'sqlite:///{workdir}/shard{i}.db' for i in range(shards))
+    else:
+        os.environ.pop('SHARD_DATABASE_URIS', None)
+    os.environ.pop('REPLICA_DATABASE_URI', None)
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'
+    sys.path.insert(0, ROOT)
+
+
+def seed(doctors, patients, appointments):
+    from sqlalchemy import insert
+    from models import db, init_db, User, Role, Department, DoctorProfile, PatientProfile, Appointment
+    from services.shards import shard_router
+
+    init_db()
+    if shard_router.enabled:
+        shard_router.create_tables()
+    admin = User(email='admin@bench.local', name='Admin', role=Role.ADMIN)
+    admin.set_password('admin123')
+    db.session.add(admin)
+    depts = [Department(name=f'Dept {i}') for i in range(max(1, doctors // 10))]
+    db.session.add_all(depts)
+    db.session.commit()
+    users, doctors_t, patients_t = User.__table__, DoctorProfile.__table__, PatientProfile.__table__
+    db.session.execute(insert(users), [{'email': f'doc{i}@bench.local', 'name': f'Dr Bench {i}', 'role': Role.DOCTOR,
+                                        'password_hash': 'x'} for i in range(doctors)])
+    db.session.execute(insert(users), [{'email': f'pat{i}@bench.local', 'name': f'Patient {i}', 'role': Role.PATIENT,
+                                        'password_hash': 'x'} for i in range(patients)])
+    ids = dict(db.session.execute(db.select(User.email, User.id)).all())
+    db.session.execute(insert(doctors_t), [{'user_id': ids[f'doc{i}@bench.local'], 'qualification': 'MD',
+                                            'department_id': depts[i % len(depts)].id} for i in range(doctors)])
+    db.session.execute(insert(patients_t), [{'user_id': ids[f'pat{i}@bench.local'], 'phone': '9000000000'}
+                                            for i in range(patients)])
+    db.session.commit()
+    doctor_ids = db.session.scalars(db.select(DoctorProfile.id)).all()
+    patient_ids = db.session.scalars(db.select(PatientProfile.id)).all()
+    start = datetime(2024, 1, 1, 9)
+    batch = []
+    for n in range(appointments):
+        slot = start + timedelta(minutes=30 * (n // len(doctor_ids)))
+        batch.append(Appointment(doctor_id=doctor_ids[n % len(doctor_ids)],
+                                 patient_id=patient_ids[n % len(patient_ids)], appointment_start=slot,
+                                 appointment_end=slot + timedelta(minutes=30), reason='benchmark visit'))
+        if len(batch) == 5000:
+            db.session.add_all(batch)
+            db.session.commit()
+            batch = []
+    db.session.add_all(batch)
+    db.session.commit()
+
+
+def measure(client, page):
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(page, buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    first = time.perf_counter() - started
+    for chunk in chunks:
+        size += len(chunk)
+    total = time.perf_counter() - started
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first, total, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Admin listing latency and memory on a large table')
+    parser.add_argument('--appointments', type=int, default=20000)
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--shards', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='admin_listing_')
+    try:
+        configure(workdir, args.shards)
+        from app import app
+        with app.app_context():
+            seed(args.doctors, args.patients, args.appointments)
+        client = app.test_client()
+        client.post('/login', data={'email': 'admin@bench.local', 'password': 'admin123'})
+        print(f'{args.appointments} appointments, {args.patients} patients, {args.doctors} doctors, '
+              f'{args.shards or "no"} shards')
+        print(f"{'page':<22} {'first byte ms':>14} {'total ms':>9} {'peak MB':>8} {'page MB':>8}")
+        for page in PAGES:
+            first, total, peak, size = measure(client, page)
+            print(f'{page:<22} {first * 1000:>14.1f} {total * 1000:>9.0f} {peak / 2**20:>8.1f} {size / 2**20:>8.1f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
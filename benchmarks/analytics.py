@@ -0,0 +1,155 @@
+import sys
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time to compute the admin analytics for a period on a seeded database: the numpy
+# scan in the request process, the same scan spread over a process pool, and a plain
+# ORM loop over the same rows for comparison.
+
+START = date(2024, 1, 1)
+
+
+def configure(workdir, shards):
+    os.environ['DATABASE_URI'] = f'sqlite:///{workdir}/hms.db'
+    if shards:
+        os.environ['SHARD_DATABASE_URIS'] = ','.join(f'sqlite:///{workdir}/shard{i}.db' for i in range(shards))
+    else:
+        os.environ.pop('SHARD_DATABASE_URIS', None)
+    os.environ.pop('REPLICA_DATABASE_URI', None)
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'
+    sys.path.insert(0, ROOT)
+
+
+def seed(doctors, days, appointments):
+    from sqlalchemy import insert
+    from models import db, init_db, User, Role, Department, DoctorProfile, DoctorAvailability, Appointment
+    from models import AppointmentStatus
+    from services.shards import shard_router
+
+    init_db()
+    if shard_router.enabled:
+        shard_router.create_tables()
+    depts = [Department(name=f'Dept {i}') for i in range(max(1, doctors // 10))]
+    db.session.add_all(depts)
+    db.session.commit()
+    db.session.execute(insert(User.__table__), [{'email': f'doc{i}@bench.local', 'name': f'Dr Bench {i}',
+                                                 'role': Role.DOCTOR, 'password_hash': 'x'} for i in range(doctors)])
+    ids = dict(db.session.execute(db.select(User.email, User.id)).all())
+    db.session.execute(insert(DoctorProfile.__table__), [{'user_id': ids[f'doc{i}@bench.local'], 'qualification': 'MD',
+                                                          'department_id': depts[i % len(depts)].id}
+                                                         for i in range(doctors)])
+    db.session.commit()
+    profiles = db.session.execute(db.select(DoctorProfile.id, DoctorProfile.department_id)).all()
+
+    # sharded tables are reached through the ORM so rows land on their department's shard
+    rng = random.Random(7)
+    batch = []
+
+    def add(row):
+        batch.append(row)
+        if len(batch) == 5000:
+            db.session.add_all(batch)
+            db.session.commit()
+            batch.clear()
+
+    for day in range(days):
+        d = START + timedelta(days=day)
+        for p in profiles:
+            add(DoctorAvailability(doctor_id=p.id, date=d, start_time=datetime(2000, 1, 1, 9).time(),
+                                   end_time=datetime(2000, 1, 1, 17).time()))
+    statuses = [AppointmentStatus.COMPLETED] * 6 + [AppointmentStatus.BOOKED] * 3 + [AppointmentStatus.CANCELLED]
+    # 16 half-hour slots a day; each doctor's n-th appointment takes the n-th slot of one shuffled order
+    slots = list(range(days * 16))
+    rng.shuffle(slots)
+    if appointments > len(slots) * len(profiles):
+        raise SystemExit(f'at most {len(slots) * len(profiles)} appointments fit in {days} days')
+    for n in range(appointments):
+        p = profiles[n % len(profiles)]
+        day, half_hour = divmod(slots[n // len(profiles)], 16)
+        slot = datetime.combine(START + timedelta(days=day), datetime.min.time()) + \
+            timedelta(minutes=540 + 30 * half_hour)
+        status = rng.choice(statuses)
+        add(Appointment(doctor_id=p.id, patient_id=1, appointment_start=slot,
+                        appointment_end=slot + timedelta(minutes=30), status=status,
+                        canceled_by=rng.choice(('PATIENT', 'DOCTOR')) if status == 'CANCELLED' else None,
+                        created_at=(slot - timedelta(hours=rng.expovariate(1 / 72))).astimezone(timezone.utc),
+                        reason='benchmark visit'))
+    db.session.add_all(batch)
+    db.session.commit()
+
+
+def orm_loop(start, end):
+    # what the report costs without numpy: every row loaded as an object and summed in Python;
+    # with shards each query is routed by its doctor_id
+    from models import DoctorProfile, DoctorAvailability, Appointment, AppointmentStatus
+    lo = datetime.combine(start, datetime.min.time())
+    hi = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    available, booked, cancelled, hours, lead = {}, {}, 0, [0] * 24, []
+    for doctor in DoctorProfile.query.all():
+        for a in DoctorAvailability.query.filter(DoctorAvailability.doctor_id == doctor.id,
+                                                 DoctorAvailability.date.between(start, end)):
+            available[doctor.id] = available.get(doctor.id, 0) + \
+                (datetime.combine(a.date, a.end_time) - datetime.combine(a.date, a.start_time)).seconds / 60
+        for a in Appointment.query.filter(Appointment.doctor_id == doctor.id, Appointment.appointment_start >= lo,
+                                          Appointment.appointment_start < hi):
+            if a.status == AppointmentStatus.CANCELLED:
+                cancelled += 1
+                continue
+            booked[doctor.id] = booked.get(doctor.id, 0) + (a.appointment_end - a.appointment_start).seconds / 60
+            hours[a.appointment_start.hour] += 1
+            if a.created_at:
+                # created_at is UTC, appointment times are local
+                created = a.created_at.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+                lead.append((a.appointment_start - created).total_seconds() / 3600)
+    lead.sort()
+    return available, booked, cancelled, hours, lead[len(lead) // 2] if lead else None
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Admin analytics compute time on a large table')
+    parser.add_argument('--appointments', type=int, default=200000)
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--shards', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='analytics_')
+    try:
+        configure(workdir, args.shards)
+        from app import app
+        from services.analytics import analytics
+        with app.app_context():
+            seed(args.doctors, args.days, args.appointments)
+            start, end = START, START + timedelta(days=args.days - 1)
+            print(f'{args.appointments} appointments, {args.doctors} doctors, {args.days} days, '
+                  f'{args.shards or "no"} shards, {os.cpu_count()} CPUs')
+            analytics.processes = 1
+            numpy_time = timed(analytics.compute, start, end)
+            analytics.processes, analytics.pool_min_days = args.processes, 0
+            analytics.compute(start, end)           # start the pool processes outside the timing
+            pool_time = timed(analytics.compute, start, end)
+            orm_time = timed(orm_loop, start, end)
+        print(f"{'ORM loop':<28} {orm_time * 1000:>8.0f} ms")
+        print(f"{'numpy, in process':<28} {numpy_time * 1000:>8.0f} ms")
+        print(f"{f'numpy, {args.processes} processes':<28} {pool_time * 1000:>8.0f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import os
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def report(self, elapsed):
+        lat = sorted(self.latencies)
+        pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1000 if lat else float('nan')
+        return {
+            'requests': len(lat),
+            'rps': len(lat) / elapsed,
+            'errors': self.errors,
+            'p50': pct(0.50),
+            'p99': pct(0.99),
+        }
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            k, v = line.split(':', 1)
+            headers[k.strip().lower()] = v.strip().lower()
+
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+
+    return status, headers.get('connection') != 'close'
+
+
+async def client(host, port, request, deadline, stats):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            stats.errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            await asyncio.sleep(0.01)
+            continue
+
+        if status >= 400:
+            stats.errors += 1
+        else:
+            stats.latencies.append(time.perf_counter() - start)
+        if not keep_alive:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(host, port, paths, cookie, connections, seconds):
+    # connections are spread round-robin over the given paths
+    requests = [(f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: keep-alive\r\n'
+                 + (f'Cookie: {cookie}\r\n' if cookie else '') + '\r\n').encode() for path in paths]
+    stats = Stats()
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, requests[i % len(requests)], deadline, stats)
+                           for i in range(connections)))
+    return stats.report(time.perf_counter() - start)
+
+
+def wait_for_port(port, timeout=30):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def login_cookie(port, email, password):
+    import urllib.request
+    import urllib.parse
+    import http.cookiejar
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(f'http://127.0.0.1:{port}/login',
+                data=urllib.parse.urlencode({'email': email, 'password': password}).encode())
+    return '; '.join(f'{c.name}={c.value}' for c in jar)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent-client throughput: sync gunicorn tier vs async ASGI tier')
+    parser.add_argument('--path', default='/api/doctors')
+    parser.add_argument('--connections', type=int, nargs='*', default=[100, 250, 500, 1000])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=1, help='processes per tier')
+    parser.add_argument('--login', nargs=2, metavar=('EMAIL', 'PASSWORD'), help='authenticate (needed for /api/appointments)')
+    parser.add_argument('--sync-port', type=int, default=8100)
+    parser.add_argument('--async-port', type=int, default=8101)
+    args = parser.parse_args()
+
+    # 1000 client sockets plus the servers' own need more than the usual 1024 descriptors
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    servers = [
+        ('sync', args.sync_port, ['gunicorn', 'app:app', '-b', f'127.0.0.1:{args.sync_port}',
+                                  '-w', str(args.workers), '--backlog', '2048', '--log-level', 'warning']),
+        ('async', args.async_port, ['uvicorn', 'asgi:app', '--port', str(args.async_port),
+                                    '--workers', str(args.workers), '--backlog', '2048', '--log-level', 'warning']),
+    ]
+    procs = [subprocess.Popen(cmd, cwd=ROOT) for _, _, cmd in servers]
+    try:
+        for _, port, _ in servers:
+            wait_for_port(port)
+        cookie = login_cookie(args.sync_port, *args.login) if args.login else None
+
+        print(f"{args.path}, {args.workers} worker(s) per tier, {args.seconds:.0f}s per run")
+        print(f"{'tier':<6} {'conns':>6} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for connections in args.connections:
+            for name, port, _ in servers:
+                r = asyncio.run(run_load('127.0.0.1', port, [args.path], cookie, connections, args.seconds))
+                print(f"{name:<6} {connections:>6} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p99']:>9.1f} {r['errors']:>7}")
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import sys
+import os
+import time
+import random
+import sqlite3
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIAGNOSES = ['Viral fever', 'Acute bronchitis', 'Type 2 diabetes mellitus', 'Essential hypertension',
+             'Migraine without aura', 'Allergic rhinitis', 'Bronchial asthma', 'Urinary tract infection',
+             'Iron deficiency anaemia', 'Gastroesophageal reflux disease', 'Lumbar spondylosis',
+             'Atopic dermatitis', 'Hypothyroidism', 'Community acquired pneumonia', 'Acute gastroenteritis',
+             'Osteoarthritis of knee', 'Generalised anxiety disorder', 'Tension headache', 'Otitis media',
+             'Pulmonary tuberculosis']
+DRUGS = ['Paracetamol 500mg', 'Amoxicillin 500mg', 'Azithromycin 500mg', 'Metformin 500mg', 'Amlodipine 5mg',
+         'Salbutamol inhaler', 'Cetirizine 10mg', 'Pantoprazole 40mg', 'Ibuprofen 400mg', 'Levothyroxine 50mcg',
+         'Ferrous sulphate 200mg', 'Nitrofurantoin 100mg', 'Sumatriptan 50mg', 'Escitalopram 10mg',
+         'Ondansetron 4mg', 'Diclofenac gel', 'Hydrocortisone cream', 'Rifampicin 450mg', 'Montelukast 10mg',
+         'Oral rehydration salts']
+DOSING = ['once daily', 'twice daily', 'thrice daily', 'at bedtime', 'as needed', 'for 5 days', 'for 2 weeks']
+NOTES = ['Patient recovering well', 'Review after one week', 'Advised rest and fluids', 'Blood work ordered',
+         'Symptoms improving', 'Referred for imaging', 'Counselled on diet and exercise', 'No known allergies',
+         'Follow up if fever persists', 'Compliance with medication discussed']
+
+# (label, query, order, doctor scoped, p95 target in ms)
+QUERIES = [
+    ('common term, newest', 'paracetamol', 'recent', True, 50),
+    ('common term, newest, admin', 'paracetamol', 'recent', False, 50),
+    ('rare term, newest', 'rifampicin', 'recent', True, 100),
+    ('phrase, newest', '"viral fever"', 'recent', True, 50),
+    ('prefix, newest', 'amox*', 'recent', True, 100),
+    ('two terms, newest', 'asthma salbutamol', 'recent', True, 100),
+    ('common term, best match', 'paracetamol', 'relevance', True, 500),
+    ('phrase, best match, admin', '"viral fever"', 'relevance', False, 750),
+]
+
+
+def configure(path):
+    os.environ['DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ.pop('SHARD_DATABASE_URIS', None)
+    os.environ.pop('REPLICA_DATABASE_URI', None)
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    sys.path.insert(0, ROOT)
+
+
+def seed(path, rows, doctors, patients, batch=50000):
+    # schema and search index come from the migrations; bulk rows go in with plain
+    # sqlite3, and the index triggers fill treatment_search as they would in production
+    from app import app
+    from migrations import runner
+    from services import booking
+    from models import db
+
+    with app.app_context():
+        runner.upgrade(echo=lambda *a: None)
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    now = datetime(2025, 1, 1)
+    with conn:
+        conn.execute("INSERT INTO departments (id, name) VALUES (1, 'General Medicine')")
+        users = [(i, f'Doctor {i}', f'doc{i}@bench.local', 'x', 'DOCTOR', 1) for i in range(1, doctors + 1)]
+        users += [(doctors + i, f'Patient {i}', f'pat{i}@bench.local', 'x', 'PATIENT', 1) for i in range(1, patients + 1)]
+        conn.executemany('INSERT INTO users (id, name, email, password_hash, role, is_active) VALUES (?, ?, ?, ?, ?, ?)', users)
+        conn.executemany('INSERT INTO doctor_profiles (id, user_id, department_id) VALUES (?, ?, 1)',
+                         [(i, i) for i in range(1, doctors + 1)])
+        conn.executemany('INSERT INTO patient_profiles (id, user_id) VALUES (?, ?)',
+                         [(i, doctors + i) for i in range(1, patients + 1)])
+    started = time.perf_counter()
+    for first in range(1, rows + 1, batch):
+        appts, treatments = [], []
+        for i in range(first, min(first + batch, rows + 1)):
+            start = now - timedelta(minutes=15 * i)
+            # a patient mostly sees the same few doctors
+            patient = rng.randint(1, patients)
+            doctor = (patient * 7 + rng.randint(0, 2)) % doctors + 1
+            appts.append((i, patient, doctor, start, start + timedelta(minutes=15), 'COMPLETED', 'Consultation'))
+            treatments.append((i, i, rng.choice(DIAGNOSES),
+                               f'{rng.choice(DRUGS)} {rng.choice(DOSING)}\n{rng.choice(DRUGS)} {rng.choice(DOSING)}',
+                               '. '.join(rng.sample(NOTES, 2))))
+        with conn:
+            conn.executemany('INSERT INTO appointments (id, patient_id, doctor_id, appointment_start, appointment_end, '
+                             'status, reason, is_active) VALUES (?, ?, ?, ?, ?, ?, ?, 1)',
+                             [(a[0], a[1], a[2], a[3].isoformat(' '), a[4].isoformat(' '), a[5], a[6]) for a in appts])
+            conn.executemany('INSERT INTO treatments (id, appointment_id, diagnosis, prescription, notes) '
+                             'VALUES (?, ?, ?, ?, ?)', treatments)
+        done = min(first + batch - 1, rows)
+        print(f'  seeded {done}/{rows} ({done / (time.perf_counter() - started):.0f} rows/s)', end='\r', flush=True)
+    print()
+    conn.execute("INSERT INTO treatment_search (treatment_search) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+    with app.app_context():
+        with db.engines[None].begin() as c:
+            booking.rebuild_doctor_patients(c)
+
+
+def measure(label, query, order, scoped, target, runs, doctors):
+    from app import app
+    from services.search import search_treatments
+
+    rng = random.Random(label)
+    timings = []
+    found = 0
+    with app.app_context():
+        for _ in range(runs):
+            doctor_id = rng.randint(1, doctors) if scoped else None
+            started = time.perf_counter()
+            found = len(search_treatments(query, doctor_id=doctor_id, order=order, limit=50))
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    verdict = 'ok' if p95 <= target else 'MISS'
+    print(f'{label:<30} {statistics.median(timings):>8.1f} {p95:>8.1f} {target:>8} {found:>6}  {verdict}')
+    return p95 <= target
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clinical full-text search latency on a large seeded treatment set')
+    parser.add_argument('--db', default=os.path.join(ROOT, 'instance', 'search_bench.db'),
+                        help='seeded database; reused when it already exists')
+    parser.add_argument('--rows', type=int, default=2_000_000, help='treatment records to seed')
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--patients', type=int, default=50_000)
+    parser.add_argument('--runs', type=int, default=50, help='searches per query shape')
+    args = parser.parse_args()
+
+    configure(args.db)
+    if not os.path.exists(args.db):
+        print(f'Seeding {args.rows} treatments into {args.db}...')
+        seed(args.db, args.rows, args.doctors, args.patients)
+    print(f"{'query':<30} {'p50 ms':>8} {'p95 ms':>8} {'target':>8} {'rows':>6}")
+    results = [measure(*q, runs=args.runs, doctors=args.doctors) for q in QUERIES]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import sys
+import os
+import asyncio
+import argparse
+import resource
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from async_api import run_load, wait_for_port, ROOT
+
+# a read-heavy mix of public pages and API calls
+DEFAULT_PATHS = ['/api/doctors', '/login', '/api/doctors/2', '/api/doctors/2/slots']
+
+
+def run_server(port, workers, worker_class, threads):
+    env = dict(os.environ,
+               GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_WORKER_CLASS=worker_class,
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_LOGLEVEL='warning',
+               # one client IP would hit the per-IP limits within seconds
+               RATE_LIMIT_ENABLED=os.getenv('RATE_LIMIT_ENABLED', 'False'))
+    return subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=ROOT, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput as gunicorn scales from 1 to N worker processes')
+    parser.add_argument('--max-workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--worker-class', choices=['sync', 'gthread'], default='sync')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker for gthread')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--paths', nargs='*', default=DEFAULT_PATHS)
+    parser.add_argument('--port', type=int, default=8110)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    threads = args.threads if args.worker_class == 'gthread' else 1
+
+    print(f"{args.worker_class} workers x {threads} thread(s), {args.connections} connections, "
+          f"{args.seconds:.0f}s per step; the load client shares this host's CPUs")
+    print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    base = None
+    for workers in range(1, args.max_workers + 1):
+        proc = run_server(args.port, workers, args.worker_class, threads)
+        try:
+            wait_for_port(args.port)
+            # one short warm-up so every worker has loaded templates and opened its pool
+            asyncio.run(run_load('127.0.0.1', args.port, args.paths, None, args.connections, 1))
+            r = asyncio.run(run_load('127.0.0.1', args.port, args.paths, None, args.connections, args.seconds))
+        finally:
+            proc.terminate()
+            proc.wait()
+        base = base or r['rps']
+        print(f"{workers:>7} {r['rps']:>9.1f} {r['rps'] / base:>7.2f}x {r['p50']:>9.1f} {r['p99']:>9.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import sys
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import date, datetime, time as clock, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time for the admin free/busy schedule of one department: building the bitsets, the
+# JSON API and the rendered week and day pages, on a seeded department with two
+# availability windows a day per doctor and most of each window booked.
+
+START = date(2024, 1, 1)
+
+
+def configure(workdir, shards):
+    os.environ['DATABASE_URI'] = f'sqlite:///{workdir}/hms.db'
+    if shards:
+        os.environ['SHARD_DATABASE_URIS'] = ','.join(f'sqlite:///{workdir}/shard{i}.db' for i in range(shards))
+    else:
+        os.environ.pop('SHARD_DATABASE_URIS', None)
+    os.environ.pop('REPLICA_DATABASE_URI', None)
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'
+    sys.path.insert(0, ROOT)
+
+
+def seed(doctors, weeks):
+    from sqlalchemy import insert
+    from models import db, init_db, User, Role, Department, DoctorProfile, DoctorAvailability, Appointment
+    from services.shards import shard_router
+
+    init_db()
+    if shard_router.enabled:
+        shard_router.create_tables()
+    admin = User(email='admin@bench.local', name='Admin', role=Role.ADMIN)
+    admin.set_password('admin123')
+    dept = Department(name='Bench')
+    db.session.add_all([admin, dept])
+    db.session.commit()
+    db.session.execute(insert(User.__table__), [{'email': f'doc{i}@bench.local', 'name': f'Dr Bench {i:02d}',
+                                                 'role': Role.DOCTOR, 'password_hash': 'x'} for i in range(doctors)])
+    ids = dict(db.session.execute(db.select(User.email, User.id)).all())
+    db.session.execute(insert(DoctorProfile.__table__), [{'user_id': ids[f'doc{i}@bench.local'], 'qualification': 'MD',
+                                                          'department_id': dept.id} for i in range(doctors)])
+    db.session.commit()
+
+    # sharded tables are reached through the ORM so rows land on the department's shard
+    rng = random.Random(7)
+    rows = []
+    for profile_id in db.session.scalars(db.select(DoctorProfile.id)):
+        for day in range(weeks * 7):
+            d = START + timedelta(days=day)
+            for first, last in ((9, 13), (14, 18)):
+                rows.append(DoctorAvailability(doctor_id=profile_id, date=d, start_time=clock(first),
+                                               end_time=clock(last)))
+                for hour in range(first, last):
+                    for minute in (0, 30):
+                        if rng.random() < 0.7:
+                            slot = datetime.combine(d, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+                            rows.append(Appointment(doctor_id=profile_id, patient_id=1, appointment_start=slot,
+                                                    appointment_end=slot + timedelta(minutes=30), reason='benchmark'))
+        db.session.add_all(rows)
+        db.session.commit()
+        rows = []
+    return dept.id
+
+
+def timed(fn, repeat):
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Admin free/busy schedule latency')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--weeks', type=int, default=4)
+    parser.add_argument('--shards', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='freebusy_')
+    try:
+        configure(workdir, args.shards)
+        from app import app
+        from services.freebusy import department_doctors, build_grid
+        with app.app_context():
+            dept = seed(args.doctors, args.weeks)
+        client = app.test_client()
+        client.post('/login', data={'email': 'admin@bench.local', 'password': 'admin123'})
+        week = START + timedelta(days=7 * (args.weeks // 2))
+
+        def grid():
+            with app.app_context():
+                build_grid(department_doctors(dept), week, 7).free_for(14 * 60)
+
+        def get(url):
+            def run():
+                assert client.get(url).status_code == 200
+            return run
+
+        print(f'{args.doctors} doctors, one week of {args.weeks} seeded, {args.shards or "no"} shards')
+        api = f'/api/departments/{dept}/freebusy?date={week}&days=7&at=14:00'
+        for label, fn in [('bitsets + free at 14:00', grid),
+                          ('GET /api/.../freebusy', get(api)),
+                          ('week page', get(f'/admin/schedule?department={dept}&date={week}&view=week&at=14:00')),
+                          ('day page', get(f'/admin/schedule?department={dept}&date={week}&at=14:00'))]:
+            print(f'{label:<26} {timed(fn, args.repeat) * 1000:>7.1f} ms')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
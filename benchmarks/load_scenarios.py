@@ -0,0 +1,424 @@
+import sys
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import subprocess
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from async_api import wait_for_port, ROOT
+
+# Replays a Monday-morning mix against a running server. Scenarios are chained
+# page visits on the real routes; each virtual client picks one by weight, runs
+# it to completion and picks the next (closed loop, optional think time).
+#
+# Bookings and cancellations are real writes: point this at a scratch copy of
+# the database, not production.
+
+LOADTEST_PASSWORD = 'loadtest123'
+SEARCH_TERMS = ['a', 'dr', 'sh', 'ra', 'pa', 'gu', 'ver', 'mehta', 'iyer', 'nair', 'x']
+
+DEFAULT_WEIGHTS = {
+    'patient_login': 2,
+    'patient_search': 5,
+    'patient_book_doctor': 4,
+    'patient_book_slot': 3,
+    'patient_cancel': 1,
+    'doctor_dashboard': 3,
+    'admin_search': 1,
+}
+
+
+class LoadError(Exception):
+    pass
+
+
+class Connection:
+    # one keep-alive HTTP/1.1 connection; cookies are passed per request so a
+    # client can act for any user without reconnecting
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+        self.requests = 0
+
+    async def request(self, method, path, cookie=None, form=None):
+        body = urlencode(form).encode() if form is not None else b''
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nConnection: keep-alive\r\n'
+        if cookie:
+            head += f'Cookie: {cookie}\r\n'
+        if form is not None:
+            head += f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n'
+        try:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.writer.write(head.encode() + b'\r\n' + body)
+            await self.writer.drain()
+            status, headers, cookies, payload, keep_alive = await self._read()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            self.close()
+            raise LoadError(f'{method} {path}: {type(e).__name__}')
+        self.requests += 1
+        if not keep_alive:
+            self.close()
+        return status, headers, cookies, payload
+
+    async def _read(self):
+        raw = await self.reader.readuntil(b'\r\n\r\n')
+        lines = raw.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1])
+        headers = {}
+        cookies = []
+        for line in lines[1:]:
+            if ':' in line:
+                k, v = line.split(':', 1)
+                k = k.strip().lower()
+                if k == 'set-cookie':
+                    cookies.append(v.strip().split(';', 1)[0])
+                headers[k] = v.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).strip(), 16)
+                chunks.append((await self.reader.readexactly(size + 2))[:-2])
+                if size == 0:
+                    break
+            payload = b''.join(chunks)
+        elif 'content-length' in headers:
+            payload = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            return status, headers, cookies, await self.reader.read(), False
+        return status, headers, cookies, payload, headers.get('connection', '').lower() != 'close'
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def expect(response, *statuses):
+    status = response[0]
+    if status not in statuses:
+        raise LoadError(f'unexpected status {status}')
+    return response
+
+
+def session_cookie(cookies):
+    return '; '.join(cookies)
+
+
+class Population:
+    # everything scenarios need to pick realistic targets: who can log in and
+    # which doctors exist
+    def __init__(self):
+        self.patients = []     # (email, cookie)
+        self.doctors = []      # (user_id, email, cookie)
+        self.admin = None
+        self.doctor_ids = []
+        self.departments = []
+
+
+async def login(conn, email, password):
+    status, headers, cookies, _ = await conn.request('POST', '/login', form={'email': email, 'password': password})
+    if status != 302 or '/login' in headers.get('location', ''):
+        raise LoadError(f'login failed for {email} ({status})')
+    return session_cookie(cookies)
+
+
+async def register_or_login(conn, i):
+    email = f'loadtest{i}@example.com'
+    status, headers, cookies, _ = await conn.request('POST', '/register', form={
+        'email': email, 'name': f'Load Test {i}', 'password': LOADTEST_PASSWORD, 'phone': f'90000{i:05d}'})
+    # 302 to the dashboard means a new account; anything else means it already exists
+    if status == 302 and '/patient/dashboard' in headers.get('location', ''):
+        return email, session_cookie(cookies)
+    return email, await login(conn, email, LOADTEST_PASSWORD)
+
+
+async def prepare(host, port, args):
+    pop = Population()
+    conn = Connection(host, port)
+    _, _, _, body = expect(await conn.request('GET', '/api/doctors'), 200)
+    doctors = [d for d in json.loads(body) if d.get('is_active', True)]
+    if not doctors:
+        raise SystemExit('no doctors found; seed the database first (migrations/migration.py)')
+    pop.doctor_ids = [d['id'] for d in doctors]
+    pop.departments = sorted({d['department'] for d in doctors if d.get('department')})
+
+    for d in doctors[:args.doctors]:
+        try:
+            pop.doctors.append((d['id'], d['email'], await login(conn, d['email'], args.doctor_password)))
+        except LoadError:
+            pass
+    pop.admin = await login(conn, *args.admin)
+
+    # registering hashes a password per account, so do it over a few connections
+    conns = [Connection(host, port) for _ in range(min(8, args.patients))]
+    ids = list(range(args.patients))
+
+    async def worker(c):
+        while ids:
+            pop.patients.append(await register_or_login(c, ids.pop()))
+
+    await asyncio.gather(*(worker(c) for c in conns))
+    for c in conns + [conn]:
+        c.close()
+    return pop
+
+
+# --- scenarios: async (conn, pop, rng) -> outcome label ---
+
+async def patient_login(conn, pop, rng):
+    email, _ = rng.choice(pop.patients)
+    await login(conn, email, LOADTEST_PASSWORD)
+    return 'ok'
+
+
+async def patient_search(conn, pop, rng):
+    _, cookie = rng.choice(pop.patients)
+    params = {'search': rng.choice(SEARCH_TERMS)}
+    if pop.departments and rng.random() < 0.3:
+        params = {'department_id': rng.randint(1, len(pop.departments))}
+    expect(await conn.request('GET', '/patient/doctors?' + urlencode(params), cookie), 200)
+    return 'ok'
+
+
+async def patient_book_doctor(conn, pop, rng):
+    _, cookie = rng.choice(pop.patients)
+    expect(await conn.request('GET', '/patient/doctors', cookie), 200)
+    expect(await conn.request('GET', f'/patient/book/{rng.choice(pop.doctor_ids)}', cookie), 200)
+    return 'ok'
+
+
+async def patient_book_slot(conn, pop, rng, race_window=3):
+    _, cookie = rng.choice(pop.patients)
+    doctor_id = rng.choice(pop.doctor_ids)
+    expect(await conn.request('GET', f'/patient/book/{doctor_id}', cookie), 200)
+    _, _, _, body = expect(await conn.request('GET', f'/api/doctors/{doctor_id}/slots'), 200)
+    free = [s['id'] for s in json.loads(body) if not s['is_booked']]
+    if not free:
+        return 'no_slot'
+    # everyone goes for the earliest few slots, which is what makes Monday mornings hard
+    slot_id = rng.choice(free[:race_window])
+    _, headers, _, _ = expect(await conn.request('POST', f'/patient/book/slot/{slot_id}', cookie,
+                                                 form={'reason': 'Load test booking'}), 302)
+    return 'booked' if '/patient/dashboard' in headers.get('location', '') else 'conflict'
+
+
+async def patient_cancel(conn, pop, rng):
+    _, cookie = rng.choice(pop.patients)
+    _, _, _, body = expect(await conn.request('GET', '/api/appointments', cookie), 200)
+    booked = [a['id'] for a in json.loads(body) if a['status'] == 'BOOKED']
+    if not booked:
+        return 'nothing_booked'
+    expect(await conn.request('POST', f'/patient/appointments/{rng.choice(booked)}/cancel', cookie, form={}), 302)
+    return 'cancelled'
+
+
+async def doctor_dashboard(conn, pop, rng):
+    if not pop.doctors:
+        raise LoadError('no doctor accounts could log in')
+    _, _, cookie = rng.choice(pop.doctors)
+    expect(await conn.request('GET', '/doctor/dashboard', cookie), 200)
+    return 'ok'
+
+
+async def admin_search(conn, pop, rng):
+    term = rng.choice(SEARCH_TERMS)
+    expect(await conn.request('GET', '/admin/patients?' + urlencode({'search': term}), pop.admin), 200)
+    expect(await conn.request('GET', '/admin/doctors?' + urlencode({'search': term}), pop.admin), 200)
+    return 'ok'
+
+
+SCENARIOS = {
+    'patient_login': patient_login,
+    'patient_search': patient_search,
+    'patient_book_doctor': patient_book_doctor,
+    'patient_book_slot': patient_book_slot,
+    'patient_cancel': patient_cancel,
+    'doctor_dashboard': doctor_dashboard,
+    'admin_search': admin_search,
+}
+
+
+class ScenarioStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.outcomes = {}
+        self.samples = []
+
+    def report(self, elapsed):
+        lat = sorted(self.latencies)
+        pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1000 if lat else None
+        runs = len(lat) + self.errors
+        return {
+            'runs': runs,
+            'per_sec': runs / elapsed,
+            'errors': self.errors,
+            'error_rate': self.errors / runs if runs else 0.0,
+            'p50': pct(0.50),
+            'p95': pct(0.95),
+            'p99': pct(0.99),
+            'outcomes': self.outcomes,
+            'error_samples': self.samples,
+        }
+
+
+async def virtual_client(host, port, pop, names, weights, deadline, stats, seed, think):
+    rng = random.Random(seed)
+    conn = Connection(host, port)
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        s = stats[name]
+        start = time.perf_counter()
+        try:
+            outcome = await SCENARIOS[name](conn, pop, rng)
+        except LoadError as e:
+            s.errors += 1
+            if len(s.samples) < 5:
+                s.samples.append(str(e))
+            await asyncio.sleep(0.01)
+            continue
+        s.latencies.append(time.perf_counter() - start)
+        s.outcomes[outcome] = s.outcomes.get(outcome, 0) + 1
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+    conn.close()
+    return conn.requests
+
+
+async def run_mix(host, port, pop, weights, clients, seconds, think, seed):
+    names = [n for n, w in weights.items() if w > 0]
+    stats = {n: ScenarioStats() for n in names}
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    requests = await asyncio.gather(*(virtual_client(host, port, pop, names, [weights[n] for n in names],
+                                                     deadline, stats, seed + i, think)
+                                      for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    return {
+        'elapsed': elapsed,
+        'requests': sum(requests),
+        'requests_per_sec': sum(requests) / elapsed,
+        'scenarios': {n: stats[n].report(elapsed) for n in names},
+    }
+
+
+def fmt_ms(v):
+    return f'{v:>8.1f}' if v is not None else f'{"-":>8}'
+
+
+def print_report(result, weights):
+    total = sum(weights.values())
+    print(f"\n{result['requests']} requests in {result['elapsed']:.1f}s ({result['requests_per_sec']:.1f} req/s)")
+    print(f"{'scenario':<20} {'mix':>5} {'runs':>6} {'runs/s':>8} {'err %':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8}  outcomes")
+    for name, r in result['scenarios'].items():
+        outcomes = ', '.join(f'{k}={v}' for k, v in sorted(r['outcomes'].items()))
+        print(f"{name:<20} {weights[name] / total:>5.0%} {r['runs']:>6} {r['per_sec']:>8.1f} "
+              f"{r['error_rate'] * 100:>6.1f} {fmt_ms(r['p50'])} {fmt_ms(r['p95'])} {fmt_ms(r['p99'])}  {outcomes}")
+        for sample in r['error_samples']:
+            print(f"{'':<20}   ! {sample}")
+
+
+def delta(old, new):
+    if old is None or new is None or not old:
+        return f'{"-":>8}'
+    return f'{(new - old) / old:>+8.0%}'
+
+
+def print_comparison(base, result):
+    print(f"\nvs {base['label']}: {base['result']['requests_per_sec']:.1f} -> "
+          f"{result['requests_per_sec']:.1f} req/s ({delta(base['result']['requests_per_sec'], result['requests_per_sec']).strip()})")
+    print(f"{'scenario':<20} {'runs/s':>8} {'p50':>8} {'p99':>8} {'err % before/after':>20}")
+    for name, r in result['scenarios'].items():
+        old = base['result']['scenarios'].get(name)
+        if not old:
+            print(f"{name:<20} (not in baseline)")
+            continue
+        errs = f"{old['error_rate'] * 100:.1f}/{r['error_rate'] * 100:.1f}"
+        print(f"{name:<20} {delta(old['per_sec'], r['per_sec'])} {delta(old['p50'], r['p50'])} "
+              f"{delta(old['p99'], r['p99'])} {errs:>20}")
+
+
+def parse_weights(spec):
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in spec or []:
+        name, _, value = item.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f'unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        weights[name] = float(value)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a weighted mix of user journeys and report per-scenario '
+                                                 'throughput, error rate and tail latency')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--serve', action='store_true', help='start gunicorn with gunicorn.conf.py on --port')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent virtual users')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--think', type=float, default=0, help='mean think time between scenarios, seconds')
+    parser.add_argument('--patients', type=int, default=100, help='load-test patient accounts to register/reuse')
+    parser.add_argument('--doctors', type=int, default=20, help='doctor accounts to log in')
+    parser.add_argument('--doctor-password', default='doctor123')
+    parser.add_argument('--admin', nargs=2, metavar=('EMAIL', 'PASSWORD'), default=['admin@hospital.com', 'admin123'])
+    parser.add_argument('--weight', action='append', metavar='SCENARIO=W',
+                        help='override a scenario weight (0 disables it); repeatable')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', help='name for this run in saved reports')
+    parser.add_argument('--save', metavar='FILE', help='write the report as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a report saved with --save')
+    args = parser.parse_args()
+
+    weights = parse_weights(args.weight)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    proc = None
+    if args.serve:
+        # every virtual user shares one IP, which the per-IP limits would throttle
+        env = dict(os.environ, GUNICORN_BIND=f'{args.host}:{args.port}', GUNICORN_LOGLEVEL='warning',
+                   RATE_LIMIT_ENABLED=os.getenv('RATE_LIMIT_ENABLED', 'False'))
+        proc = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=ROOT, env=env)
+    try:
+        wait_for_port(args.port)
+        print(f'preparing {args.patients} patients and up to {args.doctors} doctors...')
+        pop = asyncio.run(prepare(args.host, args.port, args))
+        if args.warmup:
+            asyncio.run(run_mix(args.host, args.port, pop, weights, args.clients, args.warmup, args.think, args.seed))
+        result = asyncio.run(run_mix(args.host, args.port, pop, weights, args.clients, args.seconds,
+                                     args.think, args.seed))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    print(f'{args.clients} clients, {args.seconds:.0f}s, think {args.think}s')
+    print_report(result, weights)
+
+    report = {
+        'label': args.label or time.strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {'clients': args.clients, 'seconds': args.seconds, 'think': args.think, 'weights': weights},
+        'result': result,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), result)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nsaved to {args.save}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import sys
+import os
+import re
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bytes on the wire for the pages each role loads, as sent to a browser that accepts
+# no encoding, gzip and (when installed) brotli, plus what repeat page views cost in
+# static asset requests. Read-only; runs against the database in DATABASE_URI with
+# the seeded test accounts.
+
+ROLES = {
+    'admin': ('admin@hospital.com', 'admin123',
+              ['/admin/dashboard', '/admin/doctors', '/admin/patients', '/admin/appointments', '/api/doctors']),
+    'doctor': ('rajesh.k@hospital.com', 'doctor123',
+               ['/doctor/dashboard', '/doctor/patients', '/api/appointments']),
+    'patient': ('rohan.m@example.com', 'patient123',
+                ['/patient/dashboard', '/patient/doctors', '/patient/history', '/api/appointments']),
+}
+STATIC = re.compile(r'(?:src|href)="(/static/[^"]+)"')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Response sizes with and without compression')
+    parser.add_argument('--roles', default=','.join(ROLES), help='comma separated: ' + ', '.join(ROLES))
+    args = parser.parse_args()
+
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+    sys.path.insert(0, ROOT)
+    from app import app
+    from services.assets import brotli
+
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    print(f"{'page':<24}" + ''.join(f'{e:>10}' for e in encodings) + f"{'saved':>8}")
+    assets = {}
+    totals = dict.fromkeys(encodings, 0)
+    for role in args.roles.split(','):
+        email, password, pages = ROLES[role]
+        client = app.test_client()
+        client.post('/login', data={'email': email, 'password': password})
+        for page in pages:
+            sizes = {}
+            for encoding in encodings:
+                r = client.get(page, headers={'Accept-Encoding': encoding})
+                sizes[encoding] = len(r.data)
+                totals[encoding] += len(r.data)
+            html = client.get(page).get_data(as_text=True)
+            for url in STATIC.findall(html):
+                assets[url] = assets.get(url, 0) + 1
+            best = min(sizes.values())
+            print(f'{page:<24}' + ''.join(f'{sizes[e]:>10,}' for e in encodings)
+                  + f'{1 - best / sizes["identity"]:>8.0%}')
+    best = min(totals.values())
+    print(f"{'total':<24}" + ''.join(f'{totals[e]:>10,}' for e in encodings)
+          + f'{1 - best / totals["identity"]:>8.0%}')
+
+    # without a content hash every page view revalidates each asset (a 304 round trip)
+    client = app.test_client()
+    print(f"\n{'static asset':<48} {'bytes':>7} {'views':>6}  cache-control")
+    for url, views in sorted(assets.items()):
+        r = client.get(url)
+        print(f'{url:<48} {len(r.data):>7,} {views:>6}  {r.headers.get("Cache-Control")}')
+        r.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import sys
+import os
+import time
+import argparse
+
+# Add parent dir for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.passwords import normalize_hash_method, hash_password, verify_password, hash_passwords
+
+DEFAULT_METHODS = [
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'pbkdf2:sha256:100000',
+]
+
+
+def bench_logins(method, seconds):
+    # one login = one verify of the stored hash, which is what a sync worker spends its CPU on
+    pw_hash = hash_password('patient123', method=method)
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        verify_password(pw_hash, 'patient123')
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count / elapsed, elapsed / count * 1000
+
+
+def bench_bulk(method, n):
+    passwords = [f'password{i}' for i in range(n)]
+
+    start = time.perf_counter()
+    [hash_password(p, method=method) for p in passwords]
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hash_passwords(passwords, method=method)
+    pooled = time.perf_counter() - start
+    return serial, pooled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logins/sec per worker for each password hash setting')
+    parser.add_argument('--methods', nargs='*', default=DEFAULT_METHODS)
+    parser.add_argument('--seconds', type=float, default=3.0, help='time spent per method')
+    parser.add_argument('--bulk', type=int, default=0, help='also time bulk hashing of N passwords (serial vs pool)')
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'method':<24} {'logins/s/worker':>16} {'ms/login':>10}")
+    for method in args.methods:
+        method = normalize_hash_method(method)
+        rate, ms = bench_logins(method, args.seconds)
+        print(f"{method:<24} {rate:>16.1f} {ms:>10.2f}")
+
+    if args.bulk:
+        print()
+        print(f"Bulk hashing {args.bulk} passwords")
+        print(f"{'method':<24} {'serial s':>10} {'pool s':>10} {'speedup':>8}")
+        for method in args.methods:
+            method = normalize_hash_method(method)
+            serial, pooled = bench_bulk(method, args.bulk)
+            print(f"{method:<24} {serial:>10.2f} {pooled:>10.2f} {serial / pooled:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import sys
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from datetime import date, time as dtime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Patients moving their bookings around a handful of busy doctors, comparing the
+# one-transaction move with the old cancel-then-book flow. Fresh processes per mode:
+# the app reads its database from the environment at import time.
+
+MODES = ('move', 'cancel+book')
+
+
+def configure(workdir):
+    os.environ['DATABASE_URI'] = f'sqlite:///{workdir}/hms.db'
+    os.environ.pop('SHARD_DATABASE_URIS', None)
+    os.environ.pop('REPLICA_DATABASE_URI', None)
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    sys.path.insert(0, ROOT)
+
+
+def seed(workdir, doctors, slots_per_doctor, booked_per_doctor):
+    configure(workdir)
+    from app import app
+    from models import db, init_db, User, Role, Department, DoctorProfile, PatientProfile, DoctorAvailability
+    from services import booking
+
+    with app.app_context():
+        init_db()
+        dept = Department(name='Bench')
+        db.session.add(dept)
+        db.session.flush()
+        profiles = []
+        for i in range(doctors):
+            u = User(email=f'doc{i}@bench.local', name=f'Dr {i}', role=Role.DOCTOR, password_hash='x')
+            db.session.add(u)
+            db.session.flush()
+            profiles.append(DoctorProfile(user_id=u.id, department_id=dept.id, qualification='MD'))
+        db.session.add_all(profiles)
+        db.session.flush()
+        start = date.today() + timedelta(days=1)
+        for doc in profiles:
+            for n in range(slots_per_doctor):
+                day, k = divmod(n, 8)
+                db.session.add(DoctorAvailability(doctor_id=doc.id, date=start + timedelta(days=day),
+                                                  start_time=dtime(9 + k, 0), end_time=dtime(9 + k, 30)))
+        db.session.commit()
+        appointment_ids = []
+        for doc in profiles:
+            slots = DoctorAvailability.query.filter_by(doctor_id=doc.id).limit(booked_per_doctor).all()
+            for n, slot in enumerate(slots):
+                u = User(email=f'pat{doc.id}.{n}@bench.local', name=f'Patient {doc.id}.{n}', role=Role.PATIENT,
+                         password_hash='x')
+                db.session.add(u)
+                db.session.flush()
+                patient = PatientProfile(user_id=u.id, phone='9000000000')
+                db.session.add(patient)
+                db.session.flush()
+                appointment_ids.append(booking.book_slot(patient, slot, 'benchmark booking').id)
+    return appointment_ids
+
+
+def reschedule(workdir, mode, appointment_ids, seconds, seed_value, results):
+    configure(workdir)
+    from sqlalchemy.exc import OperationalError
+    from app import app
+    from models import db, Appointment, AppointmentStatus, DoctorAvailability
+    from services import booking
+
+    rng = random.Random(seed_value)
+    timings, conflicts, lost, errors = [], 0, 0, 0
+    with app.app_context():
+        slots = {}
+        for slot in DoctorAvailability.query.all():
+            slots.setdefault(slot.doctor_id, []).append(slot.id)
+        db.session.remove()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            appointment_id = rng.choice(appointment_ids)
+            started = time.perf_counter()
+            try:
+                appointment = db.session.get(Appointment, appointment_id)
+                if appointment.status != AppointmentStatus.BOOKED:
+                    continue
+                slot = db.session.get(DoctorAvailability, rng.choice(slots[appointment.doctor_id]))
+                if mode == 'move':
+                    booking.move_appointment(appointment, slot)
+                else:
+                    booking.change_status(appointment, AppointmentStatus.CANCELLED, canceled_by='PATIENT_RESCHEDULE')
+                    db.session.commit()
+                    try:
+                        appointment_ids.append(booking.book_slot(appointment.patient, slot, appointment.reason).id)
+                    except booking.SlotUnavailable:
+                        # cancelled, and the new slot went to someone else
+                        lost += 1
+                        raise
+                timings.append((time.perf_counter() - started) * 1000)
+            except booking.BookingError:
+                conflicts += 1
+            except OperationalError:
+                # "database is locked" after the busy timeout
+                db.session.rollback()
+                errors += 1
+            finally:
+                db.session.remove()
+    results.put((timings, conflicts, lost, errors))
+
+
+def check(workdir):
+    # live appointments of one doctor must never overlap
+    configure(workdir)
+    from sqlalchemy import text
+    from app import app
+    from models import db
+
+    with app.app_context():
+        return db.session.execute(text(
+            "SELECT COUNT(*) FROM appointments a JOIN appointments b ON a.doctor_id = b.doctor_id AND a.id < b.id "
+            "WHERE a.status != 'CANCELLED' AND b.status != 'CANCELLED' "
+            "AND a.appointment_start < b.appointment_end AND a.appointment_end > b.appointment_start")).scalar()
+
+
+def run_mode(mode, args):
+    ctx = multiprocessing.get_context('spawn')
+    workdir = tempfile.mkdtemp(prefix='reschedule_')
+    try:
+        with ctx.Pool(1) as pool:
+            appointment_ids = pool.apply(seed, (workdir, args.doctors, args.slots, args.booked))
+        results = ctx.Queue()
+        procs = [ctx.Process(target=reschedule, args=(workdir, mode, appointment_ids, args.seconds, i, results))
+                 for i in range(args.workers)]
+        for p in procs:
+            p.start()
+        timings, totals = [], [0, 0, 0]
+        for _ in procs:
+            t, *counts = results.get()
+            timings.extend(t)
+            for i, n in enumerate(counts):
+                totals[i] += n
+        for p in procs:
+            p.join()
+        with ctx.Pool(1) as pool:
+            overlaps = pool.apply(check, (workdir,))
+        return timings, totals, overlaps
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reschedule latency and correctness under contention')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2, help='patient processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--doctors', type=int, default=4)
+    parser.add_argument('--slots', type=int, default=24, help='slots per doctor')
+    parser.add_argument('--booked', type=int, default=16, help='booked appointments per doctor')
+    args = parser.parse_args()
+
+    print(f'{args.workers} processes, {args.seconds:.0f}s, {args.doctors} doctors with '
+          f'{args.booked} of {args.slots} slots booked')
+    print(f"{'mode':<12} {'moves/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'taken':>6} {'lost':>5} {'locked':>7} {'overlaps':>9}")
+    for mode in MODES:
+        timings, (conflicts, lost, errors), overlaps = run_mode(mode, args)
+        timings.sort()
+        p50 = statistics.median(timings) if timings else 0
+        p95 = timings[int(len(timings) * 0.95)] if timings else 0
+        print(f'{mode:<12} {len(timings) / args.seconds:>8.1f} {p50:>7.1f} {p95:>7.1f} {conflicts:>6} {lost:>5} '
+              f'{errors:>7} {overlaps:>9}')
+
+
+if __name__ == '__main__':
+    main()
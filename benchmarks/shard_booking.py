@@ -0,0 +1,141 @@
+import sys
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from datetime import date, time as dtime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Every configuration runs in fresh processes: the app reads its databases from the
+# environment at import time.
+
+
+def configure(workdir, shards):
+    os.environ['DATABASE_URI'] = f'sqlite:///{workdir}/global.db'
+    os.environ['SHARD_DATABASE_URIS'] = ','.join(f'sqlite:///{workdir}/shard{i}.db' for i in range(shards))
+    os.environ.setdefault('SECRET_KEY', 'bench')
+    sys.path.insert(0, ROOT)
+
+
+def seed(workdir, shards, departments, doctors_per_dept, slots_per_doctor, patients):
+    configure(workdir, shards)
+    from app import app
+    from models import db, init_db, User, Role, Department, DoctorProfile, PatientProfile, DoctorAvailability
+    from services.shards import shard_router
+
+    with app.app_context():
+        init_db()
+        if shard_router.enabled:
+            shard_router.create_tables()
+        depts = [Department(name=f'Dept {i}') for i in range(departments)]
+        db.session.add_all(depts)
+        db.session.flush()
+        doctors = []
+        for d in depts:
+            for j in range(doctors_per_dept):
+                u = User(email=f'doc{d.id}.{j}@bench.local', name=f'Dr {d.id}.{j}', role=Role.DOCTOR, password_hash='x')
+                db.session.add(u)
+                db.session.flush()
+                doctors.append(DoctorProfile(user_id=u.id, department_id=d.id, qualification='MD'))
+        db.session.add_all(doctors)
+        for k in range(patients):
+            u = User(email=f'pat{k}@bench.local', name=f'Patient {k}', role=Role.PATIENT, password_hash='x')
+            db.session.add(u)
+            db.session.flush()
+            db.session.add(PatientProfile(user_id=u.id, phone='9000000000'))
+        db.session.commit()
+
+        # 15-minute slots, 8 per day, spread over as many days as needed
+        start = date.today() + timedelta(days=1)
+        for doc in doctors:
+            for n in range(slots_per_doctor):
+                day, k = divmod(n, 8)
+                t = dtime(9 + k // 4, (k % 4) * 15)
+                end = dtime(9 + (k + 1) // 4, ((k + 1) % 4) * 15)
+                db.session.add(DoctorAvailability(doctor_id=doc.id, date=start + timedelta(days=day),
+                                                  start_time=t, end_time=end))
+            db.session.commit()
+        slots = [s.id for s in DoctorAvailability.query.all()]
+        patient_ids = [p.id for p in PatientProfile.query.all()]
+    return slots, patient_ids
+
+
+def book(workdir, shards, slot_ids, patient_ids, seconds, seed_value, results):
+    configure(workdir, shards)
+    from sqlalchemy.exc import OperationalError
+    from app import app
+    from models import db, DoctorAvailability, PatientProfile
+    from services import booking
+
+    rng = random.Random(seed_value)
+    booked = conflicts = errors = 0
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            try:
+                slot = db.session.get(DoctorAvailability, rng.choice(slot_ids))
+                patient = db.session.get(PatientProfile, rng.choice(patient_ids))
+                booking.book_slot(patient, slot, 'benchmark booking')
+                booked += 1
+            except booking.SlotUnavailable:
+                conflicts += 1
+            except OperationalError:
+                # "database is locked" after the busy timeout
+                db.session.rollback()
+                errors += 1
+            finally:
+                db.session.remove()
+    results.put((booked, conflicts, errors))
+
+
+def run_config(shards, args):
+    ctx = multiprocessing.get_context('spawn')
+    workdir = tempfile.mkdtemp(prefix=f'shards{shards}_')
+    try:
+        with ctx.Pool(1) as pool:
+            slots, patients = pool.apply(seed, (workdir, shards, args.departments, args.doctors,
+                                                args.slots, args.patients))
+        results = ctx.Queue()
+        procs = [ctx.Process(target=book, args=(workdir, shards, slots, patients, args.seconds, i, results))
+                 for i in range(args.workers)]
+        for p in procs:
+            p.start()
+        totals = [0, 0, 0]
+        for _ in procs:
+            for i, n in enumerate(results.get()):
+                totals[i] += n
+        for p in procs:
+            p.join()
+        return totals
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Booking throughput as departments are spread over more SQLite shards')
+    parser.add_argument('--shards', type=int, nargs='*', default=[0, 1, 2, 4])
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2, help='booking processes')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--departments', type=int, default=8)
+    parser.add_argument('--doctors', type=int, default=4, help='doctors per department')
+    parser.add_argument('--slots', type=int, default=400, help='slots per doctor')
+    parser.add_argument('--patients', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{args.workers} booking processes, {args.seconds:.0f}s, {args.departments} departments")
+    print(f"{'shards':>6} {'booked/s':>9} {'speedup':>8} {'conflicts':>10} {'locked':>7}")
+    base = None
+    for shards in args.shards:
+        booked, conflicts, errors = run_config(shards, args)
+        rate = booked / args.seconds
+        base = base or rate
+        label = 'off' if shards == 0 else str(shards)
+        print(f"{label:>6} {rate:>9.1f} {rate / base:>7.2f}x {conflicts:>10} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import sys
+import os
+import time
+import json
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in a fresh interpreter so nothing is warm except what is on disk
+PROBE = r'''
+import time, json, sys
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+client = app.test_client()
+t3 = time.perf_counter()
+r = client.get('/login')
+t4 = time.perf_counter()
+client.get('/login')
+t5 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_request": t4 - t3,
+                  "second_request": t5 - t4, "status": r.status_code}))
+'''
+
+
+def probe(env):
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def gunicorn_boot(env, workers, preload):
+    # time from exec until the server answers its first request
+    port = free_port()
+    cmd = ['gunicorn', 'app:app', '-b', f'127.0.0.1:{port}', '-w', str(workers), '--log-level', 'warning']
+    if preload:
+        cmd.append('--preload')
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/login', timeout=5).read()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Worker boot time and first-request latency')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='jinja_cache_')
+    env = dict(os.environ, JINJA_CACHE_DIR=cache_dir)
+    try:
+        cold = []
+        warm = []
+        for _ in range(args.runs):
+            shutil.rmtree(cache_dir)
+            os.makedirs(cache_dir)
+            cold.append(probe(env))
+            warm.append(probe(env))
+
+        avg = lambda rows, key: sum(r[key] for r in rows) / len(rows) * 1000
+        print(f"In-process (avg of {args.runs}, ms)")
+        print(f"{'':<22} {'import*':>8} {'create':>8} {'1st req':>8} {'2nd req':>8}")
+        for name, rows in (('cold template cache', cold), ('warm template cache', warm)):
+            print(f"{name:<22} {avg(rows, 'import'):>8.1f} {avg(rows, 'create_app'):>8.1f} "
+                  f"{avg(rows, 'first_request'):>8.1f} {avg(rows, 'second_request'):>8.1f}")
+
+        print("* importing app also builds the module-level app instance")
+        print()
+        print(f"gunicorn, {args.workers} workers: exec to first response (ms)")
+        for preload in (False, True):
+            times = [gunicorn_boot(env, args.workers, preload) for _ in range(args.runs)]
+            print(f"{'--preload' if preload else 'no preload':<22} {sum(times) / len(times) * 1000:>8.1f}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
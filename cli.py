@@ -0,0 +1,120 @@
+import os
+import time
+import click
+from flask import current_app
+from models import init_db
+from services.replica import replica
+from services.shards import shard_router
+from services import backup
+from migrations import runner
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create any missing tables. Run once per deploy, not per worker."""
+        init_db()
+        click.echo('Database initialized.')
+
+    @app.cli.command('migrate')
+    @click.option('--batch-size', default=1000, help='Rows per backfill transaction.')
+    @click.option('--pause', default=0.0, help='Seconds to yield to writers between backfill batches.')
+    def migrate_command(batch_size, pause):
+        """Apply pending schema migrations from migrations/versions."""
+        ran = runner.upgrade(batch_size=batch_size, pause=pause, echo=click.echo)
+        click.echo(f'{len(ran)} migration(s) applied.' if ran else 'Schema is up to date.')
+
+    @app.cli.command('migrate-status')
+    def migrate_status_command():
+        """List migrations and whether each has been applied."""
+        done = runner.applied()
+        for version, name, _ in runner.available():
+            row = done.get(version)
+            click.echo(f"{version:04d}_{name}: {f'applied {row.applied_at}' if row else 'pending'}")
+
+    @app.cli.command('replica-sync')
+    @click.option('--interval', default=1.0, help='Seconds between refreshes.')
+    @click.option('--once', is_flag=True, help='Refresh once and exit.')
+    def replica_sync_command(interval, once):
+        """Keep the read replica fresh by copying the primary with the SQLite backup API."""
+        if not replica.enabled:
+            raise click.ClickException('REPLICA_DATABASE_URI is not set.')
+        while True:
+            took = replica.sync()
+            if once:
+                click.echo(f'Replica refreshed in {took * 1000:.0f}ms.')
+                return
+            time.sleep(max(0.0, interval - took))
+
+    @app.cli.command('replica-status')
+    def replica_status_command():
+        """Show how far the read replica is behind the primary."""
+        if not replica.enabled:
+            raise click.ClickException('REPLICA_DATABASE_URI is not set.')
+        lag = replica.lag()
+        if lag is None:
+            click.echo('Replica has never been synced; reads use the primary.')
+        else:
+            state = 'in use' if lag <= replica.max_lag else 'too stale, reads use the primary'
+            click.echo(f'Replica lag {lag:.1f}s (limit {replica.max_lag:.1f}s): {state}.')
+
+    @app.cli.command('shard-init')
+    @click.option('--split', is_flag=True, help='Also copy existing department data out of the global database.')
+    def shard_init_command(split):
+        """Create department tables in every shard database."""
+        if not shard_router.enabled:
+            raise click.ClickException('SHARD_DATABASE_URIS is not set.')
+        shard_router.create_tables()
+        click.echo(f'{shard_router.count} shard(s) ready.')
+        if split:
+            copied, rekeyed = shard_router.split()
+            for table, n in copied.items():
+                click.echo(f'  {table}: {n} row(s) copied')
+            for table, n in rekeyed.items():
+                click.echo(f'  {table}: {n} appointment reference(s) re-keyed')
+
+    def backup_root():
+        return os.getenv('BACKUP_DIR') or os.path.join(current_app.instance_path, 'backups')
+
+    @app.cli.command('backup')
+    @click.option('--dest', help='Backup directory (default $BACKUP_DIR or instance/backups).')
+    @click.option('--pages', default=256, help='Pages copied per step.')
+    @click.option('--pause', default=0.05, help='Seconds to yield to writers between steps.')
+    @click.option('--daily', default=7, help='Keep the newest backup of this many days.')
+    @click.option('--weekly', default=4, help='Keep the newest backup of this many weeks.')
+    @click.option('--monthly', default=6, help='Keep the newest backup of this many months.')
+    def backup_command(dest, pages, pause, daily, weekly, monthly):
+        """Take a consistent online backup while the app keeps serving writes."""
+        root = dest or backup_root()
+        started = time.perf_counter()
+        path = backup.create_backup(root, pages=pages, pause=pause)
+        click.echo(f'Backup written to {path} in {time.perf_counter() - started:.1f}s.')
+        for removed in backup.prune(root, daily=daily, weekly=weekly, monthly=monthly):
+            click.echo(f'  pruned {removed}')
+
+    @app.cli.command('backup-verify')
+    @click.argument('path', required=False)
+    def backup_verify_command(path):
+        """Check a backup's checksums and integrity (default: the newest backup)."""
+        if path is None:
+            sets = backup.backup_sets(backup_root())
+            if not sets:
+                raise click.ClickException('No backups found.')
+            path = sets[0][1]
+        try:
+            checked = backup.verify(path)
+        except backup.BackupError as e:
+            raise click.ClickException(str(e))
+        click.echo(f'{path}: {len(checked)} file(s) OK.')
+
+    @app.cli.command('snapshot')
+    @click.argument('out_dir')
+    @click.option('--patients', type=int, help='Keep only this many patients and their appointments.')
+    def snapshot_command(out_dir, patients):
+        """Write an anonymized (optionally trimmed) snapshot for benchmark environments."""
+        try:
+            files = backup.create_snapshot(out_dir, keep_patients=patients)
+        except backup.BackupError as e:
+            raise click.ClickException(str(e))
+        for f in files:
+            click.echo(f'{f}: {os.path.getsize(f) / 1024:.0f} KiB')
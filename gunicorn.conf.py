@@ -0,0 +1,54 @@
+import os
+import multiprocessing
+
+# Every setting can be overridden from the environment (or on the command line).
+#   sync    - one request per process; workers = 2 x cores + 1
+#   gthread - GUNICORN_THREADS requests per process; workers = cores, and the
+#             SQLAlchemy pool is sized to the thread count (see app.engine_options)
+
+cores = multiprocessing.cpu_count()
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.getenv('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1))
+workers = int(os.getenv('GUNICORN_WORKERS', cores if worker_class == 'gthread' else cores * 2 + 1))
+
+port = os.getenv('PORT')
+bind = os.getenv('GUNICORN_BIND', f'0.0.0.0:{port}' if port else '127.0.0.1:8000')
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+# recycle workers now and then, staggered so they don't all restart at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# only threaded workers hold idle keep-alive connections
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').strip().lower() in ('1', 'true', 'yes', 'on')
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG')
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def when_ready(server):
+    # only a preloaded master has the app; without preload each worker checks after loading it
+    if server.cfg.preload_app:
+        from app import check_pool_size
+        check_pool_size(server.app.wsgi(), server.cfg.threads, server.log)
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from app import check_pool_size
+        check_pool_size(worker.wsgi, worker.cfg.threads, worker.log)
+
+
+def post_fork(server, worker):
+    # never share pooled connections opened in the master across processes
+    from models import db
+    app = server.app.wsgi() if server.cfg.preload_app else None
+    if app is not None:
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
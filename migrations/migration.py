@@ -6,13 +6,41 @@ import random
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app
-from models import db, User, Role, Department, DoctorProfile, PatientProfile, DoctorAvailability, Appointment, AppointmentStatus, Treatment
+from models import db, init_db, User, Role, Department, DoctorProfile, PatientProfile, DoctorAvailability, Appointment, AppointmentStatus, Treatment
+from utils import hash_passwords
+from services import booking
 from datetime import datetime, timedelta, time, date
 
 def seed_database():
     with app.app_context():
         print("Initializing database...")
-        db.create_all()
+        init_db()
+
+        doctors_info = [
+            ('Cardiology', 'Dr. Rajesh Kumar', 'rajesh.k@hospital.com', 'MD, DM Cardiology'),
+            ('Oncology', 'Dr. Priya Sharma', 'priya.s@hospital.com', 'MD Oncology'),
+            ('General Medicine', 'Dr. Amit Patel', 'amit.p@hospital.com', 'MBBS, MD'),
+            ('Neurology', 'Dr. Sneha Gupta', 'sneha.g@hospital.com', 'DM Neurology'),
+            ('Orthopedics', 'Dr. Vikram Singh', 'vikram.s@hospital.com', 'MS Orthopedics'),
+            ('Pediatrics', 'Dr. Anjali Desai', 'anjali.d@hospital.com', 'MD Pediatrics'),
+            ('Dermatology', 'Dr. Rahul Verma', 'rahul.v@hospital.com', 'MD Dermatology')
+        ]
+        patient_names = [
+            ('Rohan Mehta', 'rohan.m@example.com'),
+            ('Karthik Iyer', 'karthik.i@example.com'),
+            ('Lakshmi Nair', 'lakshmi.n@example.com'),
+            ('Arjun Reddy', 'arjun.r@example.com'),
+            ('Meera Krishnan', 'meera.k@example.com'),
+            ('Sanya Malhotra', 'sanya.m@example.com')
+        ]
+
+        # hash passwords for all missing accounts in one go on a process pool
+        wanted = {'admin@hospital.com': 'admin123'}
+        wanted.update({d[2]: 'doctor123' for d in doctors_info})
+        wanted.update({p[1]: 'patient123' for p in patient_names})
+        existing = {u.email for u in User.query.filter(User.email.in_(wanted)).all()}
+        missing = [email for email in wanted if email not in existing]
+        hashes = dict(zip(missing, hash_passwords([wanted[e] for e in missing])))
 
         print("Checking Admin...")
         admin = User.query.filter_by(email='admin@hospital.com').first()
@@ -23,7 +51,7 @@ def seed_database():
                 role=Role.ADMIN,
                 is_active=True
             )
-            admin.set_password('admin123')
+            admin.password_hash = hashes['admin@hospital.com']
             db.session.add(admin)
             print(" + Admin created")
         else:
@@ -57,22 +85,12 @@ def seed_database():
 
 
         print("Checking Doctors...")
-        doctors_info = [
-            ('Cardiology', 'Dr. Rajesh Kumar', 'rajesh.k@hospital.com', 'MD, DM Cardiology'),
-            ('Oncology', 'Dr. Priya Sharma', 'priya.s@hospital.com', 'MD Oncology'),
-            ('General Medicine', 'Dr. Amit Patel', 'amit.p@hospital.com', 'MBBS, MD'),
-            ('Neurology', 'Dr. Sneha Gupta', 'sneha.g@hospital.com', 'DM Neurology'),
-            ('Orthopedics', 'Dr. Vikram Singh', 'vikram.s@hospital.com', 'MS Orthopedics'),
-            ('Pediatrics', 'Dr. Anjali Desai', 'anjali.d@hospital.com', 'MD Pediatrics'),
-            ('Dermatology', 'Dr. Rahul Verma', 'rahul.v@hospital.com', 'MD Dermatology')
-        ]
-
         active_doctors = []
         for dept_name, name, email, qual in doctors_info:
             doc = User.query.filter_by(email=email).first()
             if not doc:
                 doc = User(email=email, name=name, role=Role.DOCTOR)
-                doc.set_password('doctor123')
+                doc.password_hash = hashes[email]
                 db.session.add(doc)
                 db.session.flush()
                 
@@ -92,21 +110,12 @@ def seed_database():
 
 
         print("Checking Patients...")
-        patient_names = [
-            ('Rohan Mehta', 'rohan.m@example.com'),
-            ('Karthik Iyer', 'karthik.i@example.com'),
-            ('Lakshmi Nair', 'lakshmi.n@example.com'),
-            ('Arjun Reddy', 'arjun.r@example.com'),
-            ('Meera Krishnan', 'meera.k@example.com'),
-            ('Sanya Malhotra', 'sanya.m@example.com')
-        ]
-
         active_patients = []
         for name, email in patient_names:
             pat = User.query.filter_by(email=email).first()
             if not pat:
                 pat = User(email=email, name=name, role=Role.PATIENT)
-                pat.set_password('patient123')
+                pat.password_hash = hashes[email]
                 db.session.add(pat)
                 db.session.flush()
                 
@@ -218,6 +227,10 @@ def seed_database():
         else:
             print(" - Appointments already populated")
 
+        # sample appointments bypass services.booking, so rebuild the doctor-patient list
+        booking.rebuild_doctor_patients(db.session.connection())
+        db.session.commit()
+
         print("Database seeding completed!")
 
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import importlib
+from sqlalchemy import text
+from models import db
+from services.shards import shard_router, SHARDED_TABLES
+
+VERSIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'versions')
+VERSION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def available():
+    # (version, name, module) for every file in migrations/versions, oldest first
+    found = []
+    for filename in sorted(os.listdir(VERSIONS_DIR)):
+        match = VERSION_FILE.match(filename)
+        if match:
+            module = importlib.import_module(f'migrations.versions.{filename[:-3]}')
+            found.append((int(match.group(1)), match.group(2), module))
+    versions = [v for v, _, _ in found]
+    if len(set(versions)) != len(versions):
+        raise MigrationError('two migrations share a version number')
+    return found
+
+
+def ensure_tracking_tables():
+    with db.engines[None].begin() as conn:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS schema_migrations '
+                          '(version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)'))
+        # resume points for batched backfills, one row per backfill and database
+        conn.execute(text('CREATE TABLE IF NOT EXISTS migration_backfills '
+                          '(name VARCHAR(150) NOT NULL, bind VARCHAR(50) NOT NULL, last_id INTEGER NOT NULL, '
+                          'rows_done INTEGER NOT NULL, finished_at DATETIME, PRIMARY KEY (name, bind))'))
+
+
+def applied():
+    ensure_tracking_tables()
+    with db.engines[None].connect() as conn:
+        return {r.version: r for r in conn.execute(text('SELECT version, name, applied_at FROM schema_migrations'))}
+
+
+class Migration:
+    # What an upgrade() function gets. Every operation is safe to repeat, so a
+    # migration interrupted half way simply runs again from the top next time.
+
+    def __init__(self, version, name, batch_size=1000, pause=0.0, echo=print):
+        self.version = version
+        self.name = name
+        self.batch_size = batch_size
+        self.pause = pause
+        self.echo = echo
+
+    def databases(self, table=None):
+        # (bind, engine) pairs holding `table`; department tables live in the shards
+        if table in SHARDED_TABLES and shard_router.enabled:
+            return [(f'shard{i}', shard_router.engine(i)) for i in range(shard_router.count)]
+        return [('main', db.engines[None])]
+
+    def execute(self, sql, table=None, **params):
+        for _, engine in self.databases(table):
+            with engine.begin() as conn:
+                conn.execute(text(sql), params)
+
+    @staticmethod
+    def has_column(conn, table, column):
+        return any(r.name == column for r in conn.execute(text(f'PRAGMA main.table_info({table})')))
+
+    def add_column(self, table, column, ddl):
+        # `ddl` is the column definition after the name, e.g. "INTEGER NOT NULL DEFAULT 0";
+        # SQLite adds columns without rewriting the table
+        for _, engine in self.databases(table):
+            with engine.begin() as conn:
+                if not self.has_column(conn, table, column):
+                    conn.execute(text(f'ALTER TABLE main.{table} ADD COLUMN {column} {ddl}'))
+
+    def create_index(self, name, table, columns, unique=False):
+        # SQLite holds the write lock while an index builds; each database gets its
+        # own short transaction so writers elsewhere are never held up by all of them
+        for bind, engine in self.databases(table):
+            started = time.perf_counter()
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS main.{name} "
+                                  f"ON {table} ({', '.join(columns)})"))
+            self.echo(f'  index {name} [{bind}] ready in {time.perf_counter() - started:.2f}s')
+
+    def create_table(self, table):
+        for _, engine in self.databases(table.name):
+            table.create(engine, checkfirst=True)
+
+    def in_batches(self, name, table, fn, where='1 = 1', params=None):
+        # Call fn(conn, first_id, last_id) for successive id ranges of `table`, batch_size
+        # rows each. The resume point commits in the same transaction as fn's work, so an
+        # interrupted run picks up where it stopped; fn must give the same result when
+        # a range is processed twice.
+        key = f'{self.version}:{name}'
+        params = dict(params or {})
+        for bind, engine in self.databases(table):
+            progress = 'migration_backfills' if bind == 'main' else 'global.migration_backfills'
+            with engine.begin() as conn:
+                state = conn.execute(text(f'SELECT last_id, rows_done, finished_at FROM {progress} '
+                                          'WHERE name = :n AND bind = :b'), {'n': key, 'b': bind}).first()
+                if state is None:
+                    conn.execute(text(f'INSERT INTO {progress} (name, bind, last_id, rows_done) '
+                                      'VALUES (:n, :b, 0, 0)'), {'n': key, 'b': bind})
+                    last_id, done = 0, 0
+                elif state.finished_at is not None:
+                    continue
+                else:
+                    last_id, done = state.last_id, state.rows_done
+                remaining = conn.execute(text(f'SELECT COUNT(*) FROM main.{table} WHERE id > :last AND ({where})'),
+                                         {**params, 'last': last_id}).scalar()
+            total = done + remaining
+            if done:
+                self.echo(f'  {name} [{bind}]: resuming after id {last_id}')
+            while True:
+                with engine.begin() as conn:
+                    ids = conn.execute(text(f'SELECT id FROM main.{table} WHERE id > :last AND ({where}) '
+                                            'ORDER BY id LIMIT :n'),
+                                       {**params, 'last': last_id, 'n': self.batch_size}).scalars().all()
+                    if not ids:
+                        conn.execute(text(f'UPDATE {progress} SET finished_at = CURRENT_TIMESTAMP '
+                                          'WHERE name = :n AND bind = :b'), {'n': key, 'b': bind})
+                        break
+                    fn(conn, ids[0], ids[-1])
+                    last_id, done = ids[-1], done + len(ids)
+                    conn.execute(text(f'UPDATE {progress} SET last_id = :last, rows_done = :done '
+                                      'WHERE name = :n AND bind = :b'),
+                                 {'last': last_id, 'done': done, 'n': key, 'b': bind})
+                pct = 100.0 * done / total if total else 100.0
+                self.echo(f'  {name} [{bind}]: {done}/{total} rows ({pct:.0f}%)')
+                if self.pause:
+                    time.sleep(self.pause)
+
+    def backfill(self, name, table, assignments, where='1 = 1', params=None):
+        # UPDATE `table` SET `assignments` in id order, batch_size rows per transaction;
+        # `where` should exclude rows already done, e.g. "col IS NULL"
+        params = dict(params or {})
+
+        def update(conn, first_id, last_id):
+            conn.execute(text(f'UPDATE main.{table} SET {assignments} '
+                              f'WHERE id BETWEEN :lo AND :hi AND ({where})'),
+                         {**params, 'lo': first_id, 'hi': last_id})
+        self.in_batches(name, table, update, where=where, params=params)
+
+
+def pending():
+    done = applied()
+    return [(v, n, m) for v, n, m in available() if v not in done]
+
+
+def upgrade(batch_size=1000, pause=0.0, echo=print):
+    # apply every pending migration in version order; returns the versions applied
+    ran = []
+    for version, name, module in pending():
+        echo(f'Applying {version:04d}_{name}...')
+        started = time.perf_counter()
+        module.upgrade(Migration(version, name, batch_size=batch_size, pause=pause, echo=echo))
+        with db.engines[None].begin() as conn:
+            conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at) '
+                              'VALUES (:v, :n, CURRENT_TIMESTAMP)'), {'v': version, 'n': name})
+        echo(f'  done in {time.perf_counter() - started:.1f}s')
+        ran.append(version)
+    return ran
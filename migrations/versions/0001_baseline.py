@@ -0,0 +1,9 @@
+from models import db
+from services.shards import shard_router
+
+
+def upgrade(m):
+    # tables as the models define them; existing tables are left alone
+    db.create_all()
+    if shard_router.enabled:
+        shard_router.create_tables()
@@ -0,0 +1,3 @@
+def upgrade(m):
+    # patient dashboards and history filter on patient_id and sort by start time
+    m.create_index('ix_patient_start', 'appointments', ['patient_id', 'appointment_start'])
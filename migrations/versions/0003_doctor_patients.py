@@ -0,0 +1,8 @@
+from models import DoctorPatient
+from services import booking
+
+
+def upgrade(m):
+    m.create_table(DoctorPatient.__table__)
+    # rebuilt from appointments a range of doctors at a time
+    m.in_batches('doctor_patients', 'doctor_profiles', booking.rebuild_doctor_patients)
@@ -0,0 +1,9 @@
+from services import search
+
+
+def upgrade(m):
+    # triggers first, so rows written during the backfill are indexed either way
+    for _, engine in m.databases('treatments'):
+        with engine.begin() as conn:
+            search.create_index(conn)
+    m.in_batches('treatment_search', 'treatments', search.reindex)
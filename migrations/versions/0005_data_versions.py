@@ -0,0 +1,5 @@
+from models import DataVersion
+
+
+def upgrade(m):
+    m.create_table(DataVersion.__table__)
@@ -0,0 +1,5 @@
+from models import IdempotencyKey
+
+
+def upgrade(m):
+    m.create_table(IdempotencyKey.__table__)
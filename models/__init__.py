@@ -1,4 +1,4 @@
-from models.base import db, utc_now, Role, AppointmentStatus
+from models.base import db, utc_now, Role, AppointmentStatus, JobStatus
 from models.user import User
 from models.department import Department
 from models.doctor_profile import DoctorProfile
@@ -6,6 +6,11 @@ from models.patient_profile import PatientProfile
 from models.doctor_availability import DoctorAvailability
 from models.appointment import Appointment
 from models.treatment import Treatment
+from models.appointment_event import AppointmentEvent
+from models.job import Job
+from models.doctor_patient import DoctorPatient
+from models.data_version import DataVersion
+from models.idempotency_key import IdempotencyKey
 
 
 def init_db():
@@ -17,6 +22,7 @@ __all__ = [
     'utc_now',
     'Role',
     'AppointmentStatus',
+    'JobStatus',
     'User',
     'Department',
     'DoctorProfile',
@@ -24,5 +30,10 @@ __all__ = [
     'DoctorAvailability',
     'Appointment',
     'Treatment',
+    'AppointmentEvent',
+    'Job',
+    'DoctorPatient',
+    'DataVersion',
+    'IdempotencyKey',
     'init_db'
 ]
@@ -22,6 +22,7 @@ class Appointment(db.Model):
     
     __table_args__ = (
         db.Index('ix_doctor_start', 'doctor_id', 'appointment_start'),
+        db.Index('ix_patient_start', 'patient_id', 'appointment_start'),
         db.UniqueConstraint('doctor_id', 'appointment_start', name='uq_doctor_appointment_slot'),
     )
     
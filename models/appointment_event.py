@@ -0,0 +1,49 @@
+import json
+from models.base import db, utc_now
+
+
+class AppointmentEvent(db.Model):
+    __tablename__ = "appointment_events"
+    
+    # append-only change log; appointment_id is not a FK so entries outlive deleted appointments
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=utc_now)
+    
+    __table_args__ = (
+        db.Index('ix_event_doctor_id', 'doctor_id', 'id'),
+    )
+
+    # kind is the new status, or MOVED when a booked appointment changes time
+    MOVED = "MOVED"
+    
+    @classmethod
+    def record(cls, appointment, kind=None):
+        # call before commit so the event lands in the same transaction as the change
+        if appointment.id is None:
+            db.session.flush()
+        event = cls(
+            appointment_id=appointment.id,
+            doctor_id=appointment.doctor_id,
+            patient_id=appointment.patient_id,
+            kind=kind or appointment.status,
+            payload=json.dumps(appointment.to_dict())
+        )
+        db.session.add(event)
+        return event
+    
+    def __repr__(self):
+        return f'<AppointmentEvent {self.id} {self.kind} Appointment:{self.appointment_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'doctor_id': self.doctor_id,
+            'patient_id': self.patient_id,
+            'appointment': json.loads(self.payload) if self.payload else {'id': self.appointment_id}
+        }
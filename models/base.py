@@ -1,7 +1,31 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
 from datetime import datetime, timezone
 
-db = SQLAlchemy()
+
+class RoutingSession(Session):
+    # Reads inside a view that set g.db_read_bind (see services.replica) go to that
+    # bind; flushes and INSERT/UPDATE/DELETE statements always use the primary.
+    # Department tables are placed by services.shards when sharding is enabled.
+    shard_router = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.shard_router is not None:
+            engine = self.shard_router.bind_for(mapper, clause)
+            if engine is not None:
+                return engine
+        if bind is None and not self._flushing and has_app_context():
+            key = g.get('db_read_bind')
+            if key and not isinstance(clause, UpdateBase):
+                engine = self._db.engines.get(key)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 def utc_now():
@@ -18,3 +42,10 @@ class AppointmentStatus:
     BOOKED = "BOOKED"
     COMPLETED = "COMPLETED"
     CANCELLED = "CANCELLED"
+
+
+class JobStatus:
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
@@ -0,0 +1,32 @@
+from sqlalchemy import text
+from models.base import db
+
+
+class DataVersion(db.Model):
+    # a counter per derived dataset (e.g. the doctor directory); writers bump it in
+    # their transaction and every worker compares it with the copy it has in memory
+    __tablename__ = "data_versions"
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(connection, name):
+        # returns the new version; `connection` is the caller's, so the bump commits with their writes
+        return connection.execute(text(
+            'INSERT INTO data_versions (name, version) VALUES (:name, 1) '
+            'ON CONFLICT (name) DO UPDATE SET version = version + 1 RETURNING version'), {'name': name}).scalar()
+
+    @staticmethod
+    def current(name):
+        return db.session.execute(db.select(DataVersion.version).filter_by(name=name)).scalar() or 0
+
+    @staticmethod
+    def current_many(names):
+        # {name: version} for several datasets in one query; never-bumped names are 0
+        rows = db.session.execute(db.select(DataVersion.name, DataVersion.version)
+                                  .filter(DataVersion.name.in_(names))).all()
+        return {**dict.fromkeys(names, 0), **dict(rows)}
+
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
@@ -19,3 +19,16 @@ class DoctorAvailability(db.Model):
     
     def __repr__(self):
         return f'<DoctorAvailability Doctor:{self.doctor_id} Date:{self.date}>'
+
+    def to_dict(self, is_booked=None):
+        data = {
+            'id': self.id,
+            'doctor_id': self.doctor_id,
+            'date': self.date.isoformat(),
+            'start_time': self.start_time.strftime('%H:%M'),
+            'end_time': self.end_time.strftime('%H:%M'),
+            'notes': self.notes
+        }
+        if is_booked is not None:
+            data['is_booked'] = is_booked
+        return data
@@ -0,0 +1,22 @@
+from models.base import db
+
+
+class DoctorPatient(db.Model):
+    # one row per doctor and patient who share at least one appointment; kept
+    # current by services.booking so lists and access checks never scan appointments
+    __tablename__ = "doctor_patients"
+
+    doctor_id = db.Column(db.Integer, db.ForeignKey("doctor_profiles.id", ondelete="CASCADE"), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey("patient_profiles.id", ondelete="CASCADE"), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=False)
+    last_seen = db.Column(db.DateTime)
+    visit_count = db.Column(db.Integer, nullable=False, default=0)
+
+    patient = db.relationship("PatientProfile")
+
+    __table_args__ = (
+        db.Index('ix_doctor_patient_last_seen', 'doctor_id', 'last_seen'),
+    )
+
+    def __repr__(self):
+        return f'<DoctorPatient Doctor:{self.doctor_id} Patient:{self.patient_id}>'
@@ -0,0 +1,61 @@
+from sqlalchemy import delete, select, update, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from models.base import db
+
+
+class IdempotencyKey(db.Model):
+    # the first response to each (user, Idempotency-Key), replayed to retries until it
+    # expires; status_code is NULL while that first request is still running
+    __tablename__ = "idempotency_keys"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_idempotency_expires_at', 'expires_at'),
+    )
+
+    # these run on their own connection and commit at once, outside the request's session
+
+    @classmethod
+    def claim(cls, conn, user_id, key, fingerprint, now, expires_at, stale_before):
+        # True if this request owns the key: it's new, expired, or its first request
+        # never finished (started before `stale_before`)
+        t = cls.__table__
+        stmt = insert(t).values(user_id=user_id, key=key, fingerprint=fingerprint, created_at=now,
+                                expires_at=expires_at)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'key'],
+            set_={'fingerprint': stmt.excluded.fingerprint, 'status_code': None, 'response': None,
+                  'created_at': stmt.excluded.created_at, 'expires_at': stmt.excluded.expires_at},
+            where=(t.c.expires_at < now) | (t.c.status_code.is_(None) & (t.c.created_at < stale_before))
+        ).returning(t.c.key)
+        return conn.execute(stmt).first() is not None
+
+    @classmethod
+    def lookup(cls, conn, user_id, key):
+        return conn.execute(select(cls.__table__).filter_by(user_id=user_id, key=key)).first()
+
+    @classmethod
+    def store(cls, conn, user_id, key, status_code, response):
+        conn.execute(update(cls.__table__).filter_by(user_id=user_id, key=key)
+                     .values(status_code=status_code, response=response))
+
+    @classmethod
+    def release(cls, conn, user_id, key):
+        conn.execute(delete(cls.__table__).filter_by(user_id=user_id, key=key))
+
+    @classmethod
+    def purge(cls, conn, now, batch_size=1000):
+        # one batch of expired keys; returns how many went
+        t = cls.__table__
+        expired = select(t.c.user_id, t.c.key).where(t.c.expires_at < now).limit(batch_size)
+        return conn.execute(delete(t).where(tuple_(t.c.user_id, t.c.key).in_(expired))).rowcount
+
+    def __repr__(self):
+        return f'<IdempotencyKey User:{self.user_id} {self.key}>'
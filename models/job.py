@@ -0,0 +1,61 @@
+import json
+from sqlalchemy.dialects.sqlite import insert
+from models.base import db, utc_now, JobStatus
+
+
+class Job(db.Model):
+    __tablename__ = "jobs"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default=JobStatus.PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=utc_now)
+    dedupe_key = db.Column(db.String(120), unique=True)
+    locked_by = db.Column(db.String(120))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=utc_now)
+    updated_at = db.Column(db.DateTime, default=utc_now, onupdate=utc_now)
+    
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+        db.Index('ix_job_locked_by', 'locked_by'),
+    )
+    
+    @classmethod
+    def enqueue(cls, kind, payload=None, run_after=None, max_attempts=5):
+        # outbox: added to the caller's session so it commits (or rolls back) with the change
+        job = cls(
+            kind=kind,
+            payload=json.dumps(payload or {}),
+            run_after=run_after or utc_now(),
+            max_attempts=max_attempts
+        )
+        db.session.add(job)
+        return job
+    
+    @classmethod
+    def enqueue_unique(cls, dedupe_key, kind, payload=None, run_after=None, max_attempts=5):
+        # skips silently if a job with this key already exists; does not touch the ORM session state
+        stmt = insert(cls).values(
+            kind=kind,
+            payload=json.dumps(payload or {}),
+            status=JobStatus.PENDING,
+            attempts=0,
+            max_attempts=max_attempts,
+            run_after=run_after or utc_now(),
+            dedupe_key=dedupe_key,
+            created_at=utc_now(),
+            updated_at=utc_now()
+        ).on_conflict_do_nothing(index_elements=['dedupe_key'])
+        return db.session.execute(stmt).rowcount > 0
+    
+    @property
+    def data(self):
+        return json.loads(self.payload) if self.payload else {}
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} ({self.status})>'
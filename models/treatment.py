@@ -11,8 +11,22 @@ class Treatment(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=utc_now)
     doctor_notes = db.Column(db.Text)
+    # filled only by queries that ask for it (see services.history)
+    diagnosis_excerpt = db.query_expression()
     
     appointment = db.relationship("Appointment", back_populates="treatment")
     
     def __repr__(self):
         return f'<Treatment {self.id} - Appointment:{self.appointment_id}>'
+
+    def to_dict(self, include_private=False):
+        data = {
+            'id': self.id,
+            'appointment_id': self.appointment_id,
+            'diagnosis': self.diagnosis,
+            'prescription': self.prescription,
+            'notes': self.notes
+        }
+        if include_private:
+            data['doctor_notes'] = self.doctor_notes
+        return data
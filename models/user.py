@@ -1,5 +1,5 @@
-from werkzeug.security import generate_password_hash
 from models.base import db, utc_now, Role
+from utils.passwords import hash_password, verify_password, needs_rehash
 
 
 from flask_login import UserMixin
@@ -23,11 +23,13 @@ class User(UserMixin, db.Model):
         return f'<User {self.email} ({self.role})>'
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        from werkzeug.security import check_password_hash
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
 
     def to_dict(self):
         data = {
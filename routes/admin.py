@@ -1,9 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
-from models import db, User, DoctorProfile, PatientProfile, Appointment, Department, Role, AppointmentStatus, DoctorAvailability
+from models import db, User, DoctorProfile, PatientProfile, Appointment, Department, Role, AppointmentStatus, DoctorAvailability, AppointmentEvent
 from werkzeug.security import generate_password_hash
+from services import booking
+from services.replica import read_replica
+from services.events import change_feed
+from services.shards import shard_router
+from services.search import search_treatments, SearchError
+from services.fragments import once
+from services.streaming import stream_page, ROWS_PER_FETCH
+from services.analytics import analytics, parse_period, AnalyticsError
+from services.freebusy import parse_grid, department_doctors, build_grid, FreeBusyError
 from utils import validate_email, validate_password, validate_required_fields, ValidationError, sanitize_input, validate_date, validate_time_range
-from datetime import datetime
+from datetime import datetime, timedelta
+from operator import attrgetter
+from sqlalchemy.orm import joinedload
 
 admin = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -13,56 +24,59 @@ def require_admin():
     if current_user.role != Role.ADMIN:
         return "Access Denied", 403
 
-@admin.route('/dashboard')
-def dashboard():
-    # stats
+def appointment_status_counts():
+    return db.session.query(Appointment.status, db.func.count(Appointment.id))\
+        .group_by(Appointment.status).all()
+
+def people_stats():
     doctors_count = User.query.filter_by(role=Role.DOCTOR).count()
     patients_count = User.query.filter_by(role=Role.PATIENT).count()
-    total_appts = Appointment.query.count()
-    
-    # blacklisted counts
-    blocked_docs = DoctorProfile.query.filter_by(is_blacklisted=True).count()
     blocked_patients = PatientProfile.query.filter_by(is_blacklisted=True).count()
-    total_blocked = blocked_docs + blocked_patients
-    active_users = (doctors_count + patients_count) - total_blocked
     
     # chart data 1: doctors per dept
     dept_stats = db.session.query(Department.name, db.func.count(DoctorProfile.id))\
         .join(DoctorProfile, DoctorProfile.department_id == Department.id)\
         .group_by(Department.name).all()
-        
-    dept_labels = [s[0] for s in dept_stats]
-    dept_data = [s[1] for s in dept_stats]
     
     # chart data 2: patient status
-    active_patients = patients_count - blocked_patients
-    pat_labels = ['Active Patients', 'Blacklisted Patients']
-    pat_data = [active_patients, blocked_patients]
-    
-    # chart data 3: appt status
-    status_counts = db.session.query(Appointment.status, db.func.count(Appointment.id))\
-        .group_by(Appointment.status).all()
-        
-    status_map = {s[0]: s[1] for s in status_counts}
-    appt_labels = ['Booked', 'Completed', 'Cancelled']
-    appt_data = [
-        status_map.get(AppointmentStatus.BOOKED, 0),
-        status_map.get(AppointmentStatus.COMPLETED, 0),
-        status_map.get(AppointmentStatus.CANCELLED, 0)
-    ]
-    
-    return render_template('dashboards/admin.html', 
-                         total_doctors=doctors_count,
-                         total_patients=patients_count,
-                         total_appointments=total_appts,
-                         dept_labels=dept_labels,
-                         dept_data=dept_data,
-                         patient_status_labels=pat_labels,
-                         patient_status_data=pat_data,
-                         appt_status_labels=appt_labels,
-                         appt_status_data=appt_data)
+    return {
+        'total_doctors': doctors_count,
+        'total_patients': patients_count,
+        'dept_labels': [s[0] for s in dept_stats],
+        'dept_data': [s[1] for s in dept_stats],
+        'patient_status_labels': ['Active Patients', 'Blacklisted Patients'],
+        'patient_status_data': [patients_count - blocked_patients, blocked_patients],
+    }
+
+def appointment_stats():
+    # chart data 3: appt status (per shard in parallel when sharded; also gives the total)
+    status_map = {}
+    for status_counts in shard_router.fan_out(appointment_status_counts):
+        for status, n in status_counts:
+            status_map[status] = status_map.get(status, 0) + n
+    return {
+        'total_appointments': sum(status_map.values()),
+        'appt_status_labels': ['Booked', 'Completed', 'Cancelled'],
+        'appt_status_data': [
+            status_map.get(AppointmentStatus.BOOKED, 0),
+            status_map.get(AppointmentStatus.COMPLETED, 0),
+            status_map.get(AppointmentStatus.CANCELLED, 0)
+        ],
+    }
+
+@admin.route('/dashboard')
+@read_replica
+def dashboard():
+    # the counts and charts are cached fragments keyed on data versions and the last
+    # change-log id; the queries behind them only run when the template misses
+    last_event_id = change_feed.latest_id()
+    return render_template('dashboards/admin.html',
+                         people=once(people_stats),
+                         appointments=once(appointment_stats),
+                         last_event_id=last_event_id)
 
 @admin.route('/doctors')
+@read_replica
 def doctors():
     search = request.args.get('search', '')
     query = User.query.filter_by(role=Role.DOCTOR, is_active=True)
@@ -75,8 +89,8 @@ def doctors():
                 Department.name.ilike(search_term)
             )
         )
-    doctors = query.all()
-    return render_template('admin/doctors.html', doctors=doctors, search=search)
+    query = query.options(joinedload(User.doctor_profile).joinedload(DoctorProfile.department))
+    return stream_page('admin/doctors.html', doctors=query.yield_per(ROWS_PER_FETCH), search=search)
 
 @admin.route('/doctors/add', methods=['GET', 'POST'])
 def add_doctor():
@@ -145,6 +159,10 @@ def edit_doctor(id):
             dept = db.session.get(Department, dept_id)
             if not dept:
                 raise ValidationError("Invalid department selected")
+            # a doctor's appointments live in their department's shard
+            if shard_router.enabled and shard_router.shard_of_department(dept.id) != \
+                    shard_router.shard_of_department(doctor.doctor_profile.department_id):
+                raise ValidationError("This department is stored on another shard; doctors can't be moved there")
             
             # check password only if provided
             if pwd:
@@ -185,8 +203,7 @@ def delete_doctor(id):
         if doctor.doctor_profile and doctor.doctor_profile.appointments:
             for appt in doctor.doctor_profile.appointments:
                 if appt.status == AppointmentStatus.BOOKED:
-                    appt.status = AppointmentStatus.CANCELLED
-                    appt.canceled_by = 'ADMIN'
+                    booking.change_status(appt, AppointmentStatus.CANCELLED, canceled_by='ADMIN')
         
         doctor.is_active = False
         db.session.commit()
@@ -195,6 +212,7 @@ def delete_doctor(id):
     return redirect(url_for('admin.doctors'))
 
 @admin.route('/patients')
+@read_replica
 def patients():
     search = request.args.get('search', '')
     query = User.query.filter_by(role=Role.PATIENT)
@@ -213,8 +231,8 @@ def patients():
             
         query = query.join(PatientProfile).filter(db.or_(*conditions))
         
-    patients = query.all()
-    return render_template('admin/patients.html', patients=patients, search=search)
+    query = query.options(joinedload(User.patient_profile))
+    return stream_page('admin/patients.html', patients=query.yield_per(ROWS_PER_FETCH), search=search)
 
 @admin.route('/patients/<int:id>/edit', methods=['GET', 'POST'])
 def edit_patient(id):
@@ -269,17 +287,77 @@ def toggle_patient_status(id):
         flash(f'Patient {status} successfully', 'success')
     return redirect(url_for('admin.patients'))
 
+@admin.route('/treatments/search')
+@read_replica
+def treatment_search():
+    q = request.args.get('q', '').strip()
+    order = 'relevance' if request.args.get('order') == 'relevance' else 'recent'
+    results, error = [], None
+    if q:
+        try:
+            results = search_treatments(q, order=order)
+        except SearchError as e:
+            error = str(e)
+    return render_template('admin/treatment_search.html', q=q, order=order, results=results, error=error)
+
+@admin.route('/analytics')
+@read_replica
+def analytics_report():
+    try:
+        start, end = parse_period(request.args.get('start'), request.args.get('end'))
+    except AnalyticsError as e:
+        flash(str(e), 'danger')
+        start, end = parse_period(None, None)
+    return render_template('admin/analytics.html', report=analytics.report(start, end))
+
+@admin.route('/schedule')
+@read_replica
+def schedule():
+    departments = Department.query.order_by(Department.name).all()
+    department = next((d for d in departments if str(d.id) == request.args.get('department')),
+                      departments[0] if departments else None)
+    view = 'week' if request.args.get('view') == 'week' else 'day'
+    slot_minutes = current_app.config.get('FREEBUSY_SLOT_MINUTES', 15)
+    try:
+        start, days, window = parse_grid(request.args.get('date'), 7 if view == 'week' else 1,
+                                         request.args.get('at'), request.args.get('minutes'), slot_minutes)
+    except FreeBusyError as e:
+        flash(str(e), 'danger')
+        start, days, window = parse_grid(None, 7 if view == 'week' else 1)
+    if view == 'week':
+        start -= timedelta(days=start.weekday())
+
+    rows, hours, free_counts = [], None, None
+    if department:
+        grid = build_grid(department_doctors(department.id), start, days, slot_minutes)
+        states = grid.states()
+        hours = grid.hours(states)
+        free = grid.free_for(*window) if window else None
+        rows = [(doctor, runs, free[i].tolist() if free is not None else None)
+                for i, (doctor, runs) in enumerate(zip(grid.doctors, grid.runs(*hours, states)))]
+        free_counts = free.sum(axis=0).tolist() if free is not None else None
+    return render_template('admin/schedule.html', departments=departments, department=department, view=view,
+                           dates=[start + timedelta(days=i) for i in range(days)],
+                           previous=start - timedelta(days=days), following=start + timedelta(days=days),
+                           window=window, rows=rows, hours=hours, free_counts=free_counts,
+                           at=request.args.get('at', ''), minutes=window[1] if window else slot_minutes)
+
 @admin.route('/appointments')
+@read_replica
 def appointments():
-    appointments = Appointment.query.order_by(Appointment.appointment_start.desc()).all()
-    return render_template('admin/appointments.html', appointments=appointments)
+    stmt = db.select(Appointment).options(
+        joinedload(Appointment.patient).joinedload(PatientProfile.user),
+        joinedload(Appointment.doctor).joinedload(DoctorProfile.user),
+    ).order_by(Appointment.appointment_start.desc())
+    appointments = shard_router.stream(stmt, key=attrgetter('appointment_start'), reverse=True,
+                                       yield_per=ROWS_PER_FETCH)
+    return stream_page('admin/appointments.html', appointments=appointments)
 
 @admin.route('/appointments/<int:id>/cancel', methods=['POST'])
 def cancel_appointment(id):
     appointment = db.session.get(Appointment, id)
     if appointment and appointment.status == AppointmentStatus.BOOKED:
-        appointment.status = AppointmentStatus.CANCELLED
-        appointment.canceled_by = 'ADMIN'
+        booking.change_status(appointment, AppointmentStatus.CANCELLED, canceled_by='ADMIN')
         db.session.commit()
         flash('Appointment cancelled successfully', 'success')
     return redirect(url_for('admin.appointments'))
@@ -288,6 +366,8 @@ def cancel_appointment(id):
 def delete_appointment(id):
     appointment = db.session.get(Appointment, id)
     if appointment:
+        AppointmentEvent.record(appointment, kind='DELETED')
+        booking.forget_visit(appointment)
         db.session.delete(appointment)
         db.session.commit()
         flash('Appointment deleted successfully', 'success')
@@ -1,24 +1,100 @@
-from flask import Blueprint, jsonify, request
+import queue
+from flask import Blueprint, Response, jsonify, request, current_app
 from flask_login import login_required, current_user
-from models import db, User, Appointment, Role, AppointmentStatus, DoctorAvailability
-from datetime import datetime
+from models import db, User, Appointment, Role, DoctorAvailability, DoctorPatient, Department
+from datetime import datetime, time, MAXYEAR
+from services import booking, lookups
+from services.replica import read_replica
+from services.shards import shard_router
+from services.events import change_feed, format_sse
+from services.search import search_treatments, SearchError
+from services.directory import directory
+from services.idempotency import idempotent
+from services.analytics import analytics, parse_period, AnalyticsError
+from services.freebusy import parse_grid, department_doctors, build_grid, FreeBusyError
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
 @api.route('/doctors', methods=['GET'])
+@read_replica
 def get_doctors():
+    if 'ids' in request.args:
+        # multi-get: ?ids=1,2,3 in one query, unknown ids left out
+        ids = lookups.parse_ids(request.args['ids'])
+        if ids is None:
+            return jsonify({'error': f'ids must be up to {lookups.MAX_BATCH} comma separated ids'}), 400
+        found = lookups.doctors(ids)
+        return jsonify([found[i] for i in ids if i in found])
     doctors = User.query.filter_by(role=Role.DOCTOR).all()
     return jsonify([doc.to_dict() for doc in doctors])
 
 @api.route('/doctors/<int:id>', methods=['GET'])
+@read_replica
 def get_doctor(id):
     doctor = db.session.get(User, id)
     if not doctor or doctor.role != Role.DOCTOR:
         return jsonify({'error': 'Doctor not found'}), 404
     return jsonify(doctor.to_dict())
 
+@api.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    # served from the in-memory directory; the only query is the version check
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 25)
+    return jsonify(directory.search(request.args.get('q', ''), limit=limit))
+
+@api.route('/doctors/<int:id>/slots', methods=['GET'])
+def get_doctor_slots(id):
+    doctor = db.session.get(User, id)
+    if not doctor or doctor.role != Role.DOCTOR:
+        return jsonify({'error': 'Doctor not found'}), 404
+        
+    today = datetime.now().date()
+    profile_id = doctor.doctor_profile.id
+    slots = db.session.scalars(booking.upcoming_slots_stmt(profile_id, today)).all()
+    busy = db.session.execute(booking.busy_windows_stmt(profile_id, datetime.combine(today, time.min))).all()
+    booked = booking.booked_slot_ids(slots, busy)
+    return jsonify([slot.to_dict(is_booked=slot.id in booked) for slot in slots])
+
+@api.route('/doctors/<int:id>/calendar', methods=['GET'])
+@read_replica
+def get_doctor_calendar(id):
+    doctor = db.session.get(User, id)
+    if not doctor or doctor.role != Role.DOCTOR:
+        return jsonify({'error': 'Doctor not found'}), 404
+    month = request.args.get('month') or datetime.now().strftime('%Y-%m')
+    try:
+        first = datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': 'month must be YYYY-MM'}), 400
+    if first.year >= MAXYEAR:
+        # the calendar's range ends on the first of the next month, which has to be a valid date
+        return jsonify({'error': f'month must be before {MAXYEAR}-01'}), 400
+    days = booking.month_calendar(doctor.doctor_profile.id, first.year, first.month)
+    return jsonify({'doctor_id': id, 'month': first.strftime('%Y-%m'), 'days': days})
+
+@api.route('/slots/<int:id>', methods=['GET'])
+def get_slot(id):
+    slot = db.session.get(DoctorAvailability, id)
+    if not slot:
+        return jsonify({'error': 'Slot not found'}), 404
+    start_dt, end_dt = booking.slot_bounds(slot)
+    return jsonify(slot.to_dict(is_booked=booking.find_overlap(slot.doctor_id, start_dt, end_dt) is not None))
+
+@api.route('/patients', methods=['GET'])
+@login_required
+@read_replica
+def get_patients():
+    ids = lookups.parse_ids(request.args.get('ids', ''))
+    if ids is None:
+        return jsonify({'error': f'ids must be up to {lookups.MAX_BATCH} comma separated ids'}), 400
+    if not all(lookups.can_view_patient(i) for i in ids):
+        return jsonify({'error': 'Access denied'}), 403
+    found = lookups.patients(ids)
+    return jsonify([found[i] for i in ids if i in found])
+
 @api.route('/patients/<int:id>', methods=['GET'])
 @login_required
+@read_replica
 def get_patient(id):
     if current_user.role == Role.PATIENT and current_user.id != id:
         return jsonify({'error': 'Access denied'}), 403
@@ -30,18 +106,167 @@ def get_patient(id):
 
 @api.route('/appointments', methods=['GET'])
 @login_required
+@read_replica
 def get_appointments():
+    if current_user.role == Role.DOCTOR:
+        # one doctor's appointments all live in one shard
+        return jsonify(appointment_dicts(doctor_id=current_user.doctor_profile.id))
+    patient_id = current_user.patient_profile.id if current_user.role == Role.PATIENT else None
+    parts = shard_router.fan_out(appointment_dicts, None, patient_id)
+    return jsonify([appt for part in parts for appt in part])
+
+def appointment_dicts(doctor_id=None, patient_id=None):
+    q = Appointment.query
+    if doctor_id is not None:
+        q = q.filter_by(doctor_id=doctor_id)
+    if patient_id is not None:
+        q = q.filter_by(patient_id=patient_id)
+    return [appt.to_dict() for appt in q.all()]
+
+@api.route('/appointments/<int:id>', methods=['GET'])
+@login_required
+@read_replica
+def get_appointment(id):
+    appointment = db.session.get(Appointment, id)
+    if not appointment:
+        return jsonify({'error': 'Appointment not found'}), 404
+    if not lookups.can_view_appointment(appointment):
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(appointment.to_dict())
+
+@api.route('/batch', methods=['POST'])
+@read_replica
+def batch():
+    # several GETs in one round trip; same-kind lookups share one query
+    data = request.get_json(silent=True) or {}
+    try:
+        responses = lookups.run_batch(data.get('requests'))
+    except lookups.BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'responses': responses})
+
+@api.route('/appointments/<int:id>/treatment', methods=['GET'])
+@login_required
+@read_replica
+def get_treatment(id):
+    # full treatment text for one history entry; history pages only load a summary
+    appointment = db.session.get(Appointment, id)
+    if not appointment or not appointment.treatment:
+        return jsonify({'error': 'Treatment not found'}), 404
     if current_user.role == Role.PATIENT:
-        appointments = Appointment.query.filter_by(patient_id=current_user.patient_profile.id).all()
+        allowed = appointment.patient_id == current_user.patient_profile.id
     elif current_user.role == Role.DOCTOR:
-        appointments = Appointment.query.filter_by(doctor_id=current_user.doctor_profile.id).all()
+        allowed = db.session.get(DoctorPatient, (current_user.doctor_profile.id, appointment.patient_id)) is not None
     else:
-        appointments = Appointment.query.all()
-        
-    return jsonify([appt.to_dict() for appt in appointments])
+        allowed = True
+    if not allowed:
+        return jsonify({'error': 'Access denied'}), 403
+    return jsonify(appointment.treatment.to_dict(include_private=current_user.role == Role.DOCTOR))
+
+@api.route('/treatments/search', methods=['GET'])
+@login_required
+@read_replica
+def search_treatment_records():
+    if current_user.role == Role.DOCTOR:
+        doctor_id = current_user.doctor_profile.id
+    elif current_user.role == Role.ADMIN:
+        doctor_id = None
+    else:
+        return jsonify({'error': 'Access denied'}), 403
+    order = 'relevance' if request.args.get('order') == 'relevance' else 'recent'
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    try:
+        rows = search_treatments(request.args.get('q', ''), doctor_id=doctor_id, order=order, limit=limit)
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify([{
+        'appointment_id': r['appointment_id'],
+        'treatment_id': r['treatment_id'],
+        'patient_id': r['patient_id'],
+        'patient_name': r['patient_name'],
+        'doctor_name': r['doctor_name'],
+        'date': r['appointment_start'].isoformat(),
+        'snippet': str(r['snippet'])
+    } for r in rows])
+
+@api.route('/analytics', methods=['GET'])
+@login_required
+@read_replica
+def get_analytics():
+    if current_user.role != Role.ADMIN:
+        return jsonify({'error': 'Access denied'}), 403
+    try:
+        start, end = parse_period(request.args.get('start'), request.args.get('end'))
+    except AnalyticsError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(analytics.report(start, end))
+
+@api.route('/departments/<int:id>/freebusy', methods=['GET'])
+@login_required
+@read_replica
+def get_department_freebusy(id):
+    if current_user.role != Role.ADMIN:
+        return jsonify({'error': 'Access denied'}), 403
+    department = db.session.get(Department, id)
+    if not department:
+        return jsonify({'error': 'Department not found'}), 404
+    slot_minutes = current_app.config.get('FREEBUSY_SLOT_MINUTES', 15)
+    try:
+        start, days, window = parse_grid(request.args.get('date'), request.args.get('days'),
+                                         request.args.get('at'), request.args.get('minutes'), slot_minutes)
+    except FreeBusyError as e:
+        return jsonify({'error': str(e)}), 400
+    grid = build_grid(department_doctors(id), start, days, slot_minutes)
+    return jsonify({'department': {'id': department.id, 'name': department.name}, **grid.to_dict(window)})
+
+@api.route('/appointments/events', methods=['GET'])
+@login_required
+def appointment_events():
+    if current_user.role == Role.DOCTOR:
+        doctor_id = current_user.doctor_profile.id
+    elif current_user.role == Role.ADMIN:
+        doctor_id = None
+    else:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    # EventSource sends Last-Event-ID on reconnect; pages pass the id they rendered at
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_event_id', type=int)
+    
+    sub, cursor = change_feed.subscribe(doctor_id)
+    backlog = change_feed.backlog(last_id, cursor, doctor_id) if last_id is not None else []
+    # don't hold a pooled connection for the lifetime of the stream
+    db.session.close()
+    
+    heartbeat = current_app.config.get('EVENT_HEARTBEAT', 15)
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            for event in backlog:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = sub.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if event is None:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                yield format_sse(event)
+        finally:
+            change_feed.unsubscribe(sub)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @api.route('/appointments', methods=['POST'])
 @login_required
+@idempotent
 def create_appointment():
     if current_user.role != Role.PATIENT:
         return jsonify({'error': 'Only patients can book appointments'}), 403
@@ -60,34 +285,37 @@ def create_appointment():
     if not slot:
         return jsonify({'error': 'Slot not found'}), 404
         
-    # check overlap
-    start_dt = datetime.combine(slot.date, slot.start_time)
-    end_dt = datetime.combine(slot.date, slot.end_time)
-    
-    existing = Appointment.query.filter_by(doctor_id=slot.doctor_id)\
-        .filter(Appointment.status != AppointmentStatus.CANCELLED)\
-        .filter(
-            db.and_(
-                Appointment.appointment_start < end_dt,
-                Appointment.appointment_end > start_dt
-            )
-        ).first()
-    
-    if existing:
-        return jsonify({'error': 'Slot overlaps with an existing appointment'}), 409
-        
     try:
-        appointment = Appointment(
-            patient_id=current_user.patient_profile.id,
-            doctor_id=slot.doctor_id,
-            appointment_start=start_dt,
-            appointment_end=end_dt,
-            reason=reason,
-            status=AppointmentStatus.BOOKED
-        )
-        db.session.add(appointment)
-        db.session.commit()
+        appointment = booking.book_slot(current_user.patient_profile, slot, reason)
         return jsonify(appointment.to_dict()), 201
+    except booking.SlotUnavailable as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
+
+@api.route('/appointments/<int:id>/reschedule', methods=['POST'])
+@login_required
+@idempotent
+def reschedule_appointment(id):
+    if current_user.role != Role.PATIENT:
+        return jsonify({'error': 'Only patients can reschedule appointments'}), 403
+    appointment = db.session.get(Appointment, id)
+    if not appointment or appointment.patient_id != current_user.patient_profile.id:
+        return jsonify({'error': 'Appointment not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    slot_id = data.get('slot_id')
+    if not slot_id:
+        return jsonify({'error': 'Missing slot_id'}), 400
+    slot = db.session.get(DoctorAvailability, slot_id)
+    if not slot:
+        return jsonify({'error': 'Slot not found'}), 404
+
+    try:
+        booking.move_appointment(appointment, slot)
+    except booking.SlotUnavailable as e:
+        return jsonify({'error': str(e)}), 409
+    except booking.BookingError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(appointment.to_dict())
@@ -30,6 +30,10 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if user and user.check_password(pwd):
+            # upgrade hashes made with an outdated method/cost while we have the plaintext
+            if user.password_needs_rehash():
+                user.set_password(pwd)
+                db.session.commit()
             login_user(user)
             # redirect based on role
             if user.role == Role.ADMIN:
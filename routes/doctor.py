@@ -1,7 +1,13 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
-from models import db, User, Appointment, Treatment, DoctorAvailability, Role, AppointmentStatus, PatientProfile
+from sqlalchemy.orm import contains_eager
+from models import db, User, Appointment, Treatment, DoctorAvailability, Role, AppointmentStatus, PatientProfile, DoctorPatient
 from datetime import datetime, timedelta, date
+from services import booking
+from services.history import history_page, EXCERPT_LENGTH
+from services.search import search_treatments, SearchError
+from services.replica import read_replica
+from services.events import change_feed
 from utils import validate_required_fields, validate_date, validate_time_range, ValidationError, sanitize_input
 
 doctor = Blueprint('doctor', __name__, url_prefix='/doctor')
@@ -15,6 +21,8 @@ def require_doctor():
 @doctor.route('/dashboard')
 def dashboard():
     today = datetime.now().date()
+    # read the change-log position first so the live stream replays anything newer
+    last_event_id = change_feed.latest_id()
     # fetch upcoming appointments
     appointments = Appointment.query.filter_by(
         doctor_id=current_user.doctor_profile.id,
@@ -32,7 +40,8 @@ def dashboard():
     return render_template('dashboards/doctor.html', 
                          appointments=appointments,
                          status_labels=labels,
-                         status_data=data)
+                         status_data=data,
+                         last_event_id=last_event_id)
 
 @doctor.route('/appointments/<int:id>/status', methods=['POST'])
 def update_status(id):
@@ -45,7 +54,7 @@ def update_status(id):
             return redirect(url_for('doctor.dashboard'))
         
         if appointment.can_transition_to(new_status):
-            appointment.status = new_status
+            booking.change_status(appointment, new_status)
             db.session.commit()
             flash(f'Appointment marked as {new_status}', 'success')
         else:
@@ -91,7 +100,7 @@ def treatment(id):
         
         # complete appointment automatically
         if appointment.can_transition_to(AppointmentStatus.COMPLETED):
-            appointment.status = AppointmentStatus.COMPLETED
+            booking.change_status(appointment, AppointmentStatus.COMPLETED)
             
         db.session.commit()
         flash('Treatment record saved successfully', 'success')
@@ -100,33 +109,59 @@ def treatment(id):
     return render_template('doctor/treatment.html', appointment=appointment, treatment=treatment)
 
 @doctor.route('/patients/<int:id>/history')
+@read_replica
 def patient_history(id):
     patient = db.session.get(PatientProfile, id)
     if not patient:
         return "Not Found", 404
     
     # Verify doctor has access to this patient (has at least one appointment)
-    has_access = Appointment.query.filter_by(
-        doctor_id=current_user.doctor_profile.id,
-        patient_id=id
-    ).first()
+    has_access = db.session.get(DoctorPatient, (current_user.doctor_profile.id, id))
     
     if not has_access:
         return "Access Denied", 403
     
-    appointments = Appointment.query.filter_by(patient_id=id)\
-        .order_by(Appointment.appointment_start.desc()).all()
+    page = history_page(id, request.args.get('page', 1, type=int))
         
-    return render_template('doctor/patient_history.html', patient=patient, appointments=appointments)
+    return render_template('doctor/patient_history.html', patient=patient, page=page,
+                           excerpt_length=EXCERPT_LENGTH)
+
+# sort keys for My Patients; patient_id keeps pages stable
+MY_PATIENTS_ORDER = {
+    'last_visit': (DoctorPatient.last_seen.desc().nulls_last(), DoctorPatient.patient_id),
+    'first_visit': (DoctorPatient.first_seen, DoctorPatient.patient_id),
+    'visits': (DoctorPatient.visit_count.desc(), DoctorPatient.patient_id),
+    'name': (User.name, DoctorPatient.patient_id),
+}
 
 @doctor.route('/patients')
+@read_replica
 def my_patients():
-    patients = db.session.query(PatientProfile)\
-        .join(Appointment, Appointment.patient_id == PatientProfile.id)\
-        .filter(Appointment.doctor_id == current_user.doctor_profile.id)\
-        .distinct().all()
+    sort = request.args.get('sort', 'last_visit')
+    order = MY_PATIENTS_ORDER.get(sort)
+    if order is None:
+        sort, order = 'last_visit', MY_PATIENTS_ORDER['last_visit']
+    query = db.select(DoctorPatient)\
+        .filter(DoctorPatient.doctor_id == current_user.doctor_profile.id)\
+        .join(DoctorPatient.patient).join(PatientProfile.user)\
+        .options(contains_eager(DoctorPatient.patient).contains_eager(PatientProfile.user))\
+        .order_by(*order)
+    page = db.paginate(query, page=request.args.get('page', 1, type=int), per_page=25, error_out=False)
         
-    return render_template('doctor/my_patients.html', patients=patients)
+    return render_template('doctor/my_patients.html', page=page, sort=sort)
+
+@doctor.route('/search')
+@read_replica
+def search():
+    q = request.args.get('q', '').strip()
+    order = 'relevance' if request.args.get('order') == 'relevance' else 'recent'
+    results, error = [], None
+    if q:
+        try:
+            results = search_treatments(q, doctor_id=current_user.doctor_profile.id, order=order)
+        except SearchError as e:
+            error = str(e)
+    return render_template('doctor/search.html', q=q, order=order, results=results, error=error)
 
 @doctor.route('/availability', methods=['GET', 'POST'])
 def availability():
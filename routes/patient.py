@@ -3,6 +3,10 @@ from flask_login import login_required, current_user
 from models import db, User, Appointment, DoctorAvailability, Role, AppointmentStatus, Department, DoctorProfile
 from datetime import datetime
 from sqlalchemy import func
+from services import booking
+from services.history import history_page, EXCERPT_LENGTH
+from services.replica import read_replica
+from services.fragments import once
 from utils import validate_phone, validate_date, validate_gender, validate_required_fields, ValidationError, sanitize_input
 
 patient = Blueprint('patient', __name__, url_prefix='/patient')
@@ -92,6 +96,7 @@ def profile():
     return render_template('patient/profile.html')
 
 @patient.route('/doctors')
+@read_replica
 def doctors():
     search = request.args.get('search', '')
     dept_id = request.args.get('department_id')
@@ -110,8 +115,9 @@ def doctors():
         except ValueError:
             pass
         
-    doctors = q.all()
-    departments = Department.query.all()
+    # the dropdown and the cards are cached fragments; these only run when they miss
+    doctors = once(q.all)
+    departments = once(Department.query.all)
     today = datetime.now().strftime('%Y-%m-%d')
     
     return render_template('patient/doctors.html', doctors=doctors, departments=departments, search=search, selected_dept=dept_id, selected_date=avail_date, today=today)
@@ -126,8 +132,17 @@ def book_doctor(doctor_id):
     availabilities = DoctorAvailability.query.filter_by(doctor_id=doctor.doctor_profile.id)\
         .filter(DoctorAvailability.date >= today)\
         .order_by(DoctorAvailability.date, DoctorAvailability.start_time).all()
-        
-    return render_template('patient/book.html', doctor=doctor, availabilities=availabilities)
+
+    # ?reschedule=<appointment id>: the slots offer to move that appointment instead of booking
+    moving = None
+    reschedule_id = request.args.get('reschedule', type=int)
+    if reschedule_id is not None:
+        moving = db.session.get(Appointment, reschedule_id)
+        if not moving or moving.patient_id != current_user.patient_profile.id or \
+                moving.doctor_id != doctor.doctor_profile.id or moving.status != AppointmentStatus.BOOKED:
+            moving = None
+
+    return render_template('patient/book.html', doctor=doctor, availabilities=availabilities, moving=moving)
 
 @patient.route('/book/slot/<int:slot_id>', methods=['POST'])
 def book_slot(slot_id):
@@ -150,39 +165,11 @@ def book_slot(slot_id):
         flash(str(e), 'danger')
         return redirect(url_for('patient.book_doctor', doctor_id=slot.doctor.user_id))
         
-    # check overlap
-    start_dt = datetime.combine(slot.date, slot.start_time)
-    end_dt = datetime.combine(slot.date, slot.end_time)
-    
-    existing = Appointment.query.filter_by(doctor_id=slot.doctor_id)\
-        .filter(Appointment.status != AppointmentStatus.CANCELLED)\
-        .filter(
-            db.and_(
-                Appointment.appointment_start < end_dt,
-                Appointment.appointment_end > start_dt
-            )
-        ).first()
-    
-    if existing:
-        flash('This slot overlaps with an existing appointment', 'warning')
-        return redirect(url_for('patient.book_doctor', doctor_id=slot.doctor.user_id))
-        
-    appointment = Appointment(
-        patient_id=current_user.patient_profile.id,
-        doctor_id=slot.doctor_id,
-        appointment_start=start_dt,
-        appointment_end=end_dt,
-        reason=reason,
-        status=AppointmentStatus.BOOKED
-    )
-    
     try:
-        db.session.add(appointment)
-        db.session.commit()
+        booking.book_slot(current_user.patient_profile, slot, reason)
         flash('Appointment booked successfully', 'success')
-    except Exception as e:
-        db.session.rollback()
-        flash('This slot was just booked by someone else. Please choose another.', 'warning')
+    except booking.SlotUnavailable as e:
+        flash(str(e), 'warning')
         return redirect(url_for('patient.book_doctor', doctor_id=slot.doctor.user_id))
     
     return redirect(url_for('patient.dashboard'))
@@ -192,8 +179,7 @@ def cancel_appointment(id):
     appointment = db.session.get(Appointment, id)
     if appointment and appointment.patient_id == current_user.patient_profile.id:
         if appointment.can_transition_to(AppointmentStatus.CANCELLED):
-            appointment.status = AppointmentStatus.CANCELLED
-            appointment.canceled_by = 'PATIENT'
+            booking.change_status(appointment, AppointmentStatus.CANCELLED, canceled_by='PATIENT')
             db.session.commit()
             flash('Appointment cancelled', 'success')
         else:
@@ -203,25 +189,32 @@ def cancel_appointment(id):
 @patient.route('/appointments/<int:id>/reschedule', methods=['POST'])
 def reschedule_appointment(id):
     appointment = db.session.get(Appointment, id)
-    if appointment and appointment.patient_id == current_user.patient_profile.id:
-        if appointment.status == AppointmentStatus.BOOKED:
-            # Store doctor ID to redirect
-            doctor_id = appointment.doctor.user.id
-            
-            # Cancel current appointment
-            appointment.status = AppointmentStatus.CANCELLED
-            appointment.canceled_by = 'PATIENT_RESCHEDULE'
-            db.session.commit()
-            
-            flash('Previous appointment cancelled. Please select a new time slot.', 'info')
-            return redirect(url_for('patient.book_doctor', doctor_id=doctor_id))
-        else:
-            flash('Cannot reschedule this appointment', 'warning')
+    if not appointment or appointment.patient_id != current_user.patient_profile.id:
+        return redirect(url_for('patient.dashboard'))
+    if appointment.status != AppointmentStatus.BOOKED:
+        flash('Cannot reschedule this appointment', 'warning')
+        return redirect(url_for('patient.dashboard'))
+
+    doctor_id = appointment.doctor.user_id
+    slot_id = request.form.get('slot_id', type=int)
+    if slot_id is None:
+        # pick the new slot first; the current one is kept until the move succeeds
+        return redirect(url_for('patient.book_doctor', doctor_id=doctor_id, reschedule=appointment.id))
+
+    slot = db.session.get(DoctorAvailability, slot_id)
+    if not slot:
+        return "Slot not found", 404
+    try:
+        booking.move_appointment(appointment, slot)
+        flash('Appointment rescheduled', 'success')
+    except booking.BookingError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('patient.book_doctor', doctor_id=doctor_id, reschedule=appointment.id))
     return redirect(url_for('patient.dashboard'))
 
 @patient.route('/history')
+@read_replica
 def history():
-    appointments = Appointment.query.filter_by(patient_id=current_user.patient_profile.id)\
-        .filter(Appointment.status == AppointmentStatus.COMPLETED)\
-        .order_by(Appointment.appointment_start.desc()).all()
-    return render_template('patient/history.html', appointments=appointments)
+    page = history_page(current_user.patient_profile.id, request.args.get('page', 1, type=int),
+                        completed_only=True)
+    return render_template('patient/history.html', page=page, excerpt_length=EXCERPT_LENGTH)
@@ -0,0 +1,204 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from flask import current_app, g, jsonify, request, session
+
+logger = logging.getLogger(__name__)
+
+# Requests are sorted into classes by endpoint. Each class has token buckets per scope,
+# written "requests/seconds": a burst of `requests`, refilled evenly over `seconds`. Each
+# class also caps how many of its requests one worker runs at once, as a share of its
+# threads. Booking caps are higher than login caps, so password hashing can never take
+# every thread. Any of these can be overridden per deployment, e.g. RATE_LIMIT_LOGIN_IP.
+CLASSES = {
+    'login': {
+        'endpoints': {'auth.login', 'auth.register'},
+        'methods': {'POST'},
+        'limits': {'ip': '10/60', 'user': '5/60'},
+        'share': 0.5,
+    },
+    'booking': {
+        'endpoints': {'api.create_appointment', 'api.reschedule_appointment', 'patient.book_slot',
+                      'patient.reschedule_appointment'},
+        'methods': {'POST'},
+        'limits': {'ip': '30/30', 'user': '10/30'},
+        'share': 1.0,
+    },
+    'api': {
+        'prefix': '/api/',
+        'limits': {'ip': '100/5', 'user': '50/5'},
+        'share': 0.75,
+        # cheap reads: dropped first when requests are already waiting too long
+        'sheddable': True,
+    },
+}
+
+
+def setting(name, key):
+    # app.config key overriding one class setting
+    return f'RATE_LIMIT_{name.upper()}_{key.upper()}'
+
+
+def parse_limit(value):
+    # "requests/seconds" -> (tokens per second, burst)
+    try:
+        requests, seconds = (float(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f'rate limit {value!r} must be "requests/seconds"')
+    if requests < 1 or seconds <= 0:
+        raise ValueError(f'rate limit {value!r} needs at least 1 request over a positive number of seconds')
+    return requests / seconds, requests
+
+
+SCHEMA = ('CREATE TABLE IF NOT EXISTS buckets '
+          '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID')
+# refill by elapsed time, then take one token; no row back means the bucket was empty
+TAKE = ('INSERT INTO buckets (key, tokens, updated) VALUES (:key, :burst - 1, :now) '
+        'ON CONFLICT (key) DO UPDATE SET tokens = min(:burst, tokens + (:now - updated) * :rate) - 1, updated = :now '
+        'WHERE min(:burst, tokens + (:now - updated) * :rate) >= 1 RETURNING tokens')
+PRUNE_EVERY = 60
+# full buckets older than this hold no state worth keeping
+IDLE_SECONDS = 3600
+
+
+class Admission:
+    # Rate limits live in a small SQLite file next to the app so every gunicorn worker
+    # (and host-local process) sees the same buckets; concurrency counts are per worker.
+    # All checks run in before_request, ahead of login, session loading and the database.
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        if not self.enabled:
+            return
+        self.path = app.config.get('RATE_LIMIT_DB') or os.path.join(app.instance_path, 'ratelimit.db')
+        self.threads = int(app.config.get('WORKER_THREADS', 1))
+        self.shed_after = float(app.config.get('SHED_QUEUE_MS', 0)) / 1000
+        self.limits = {name: {scope: parse_limit(app.config.get(setting(name, scope)) or default)
+                              for scope, default in c['limits'].items()}
+                       for name, c in CLASSES.items()}
+        self.caps = {name: max(1, int(self.threads * float(app.config.get(setting(name, 'share')) or c['share'])))
+                     for name, c in CLASSES.items()}
+        self._inflight = dict.fromkeys(CLASSES, 0)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pruned_at = 0.0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # limits are advisory: a short wait, and losing the last writes on a crash is fine
+            conn = sqlite3.connect(self.path, timeout=0.05, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def classify():
+        for name, c in CLASSES.items():
+            if request.endpoint in c.get('endpoints', ()) and request.method in c['methods']:
+                return name
+        if request.path.startswith(CLASSES['api']['prefix']):
+            return 'api'
+        return None
+
+    @staticmethod
+    def subjects(name):
+        # the signed-in user comes from the session cookie, so no user row is loaded
+        user = session.get('_user_id')
+        if name == 'login':
+            user = (request.form.get('email') or '').strip().lower() or None
+        found = {'ip': request.remote_addr or 'unknown'}
+        if user:
+            found['user'] = user
+        return found
+
+    def take(self, key, rate, burst):
+        # seconds until a token is available; 0 when one was taken
+        now = time.time()
+        conn = self._connection()
+        params = {'key': key, 'rate': rate, 'burst': burst, 'now': now}
+        if conn.execute(TAKE, params).fetchone() is not None:
+            return 0
+        tokens, updated = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        return (1 - min(burst, tokens + (now - updated) * rate)) / rate
+
+    def queued_for(self):
+        # time since the proxy accepted the request (nginx: X-Request-Start "t=${msec}")
+        header = request.headers.get('X-Request-Start', '')
+        try:
+            started = float(header[2:] if header.startswith('t=') else header)
+        except ValueError:
+            return 0.0
+        # seconds, milliseconds or microseconds since the epoch
+        while started > 1e11:
+            started /= 1000
+        return max(0.0, time.time() - started)
+
+    def _admit(self):
+        name = self.classify()
+        if name is None:
+            return None
+        if CLASSES[name].get('sheddable') and self.shed_after and self.queued_for() > self.shed_after:
+            return self.refuse(503, 1, 'The service is busy. Please retry shortly.')
+
+        try:
+            waits = [self.take(f'{name}:{scope}:{subject}', *self.limits[name][scope])
+                     for scope, subject in self.subjects(name).items()]
+            self._prune()
+        except sqlite3.OperationalError:
+            # the limiter must never take the site down with it
+            logger.warning('rate limit store busy; admitting request', exc_info=True)
+            waits = [0]
+        if max(waits) > 0:
+            return self.refuse(429, max(waits), 'Too many requests. Please slow down.')
+
+        with self._lock:
+            if self._inflight[name] >= self.caps[name]:
+                busy = True
+            else:
+                busy = False
+                self._inflight[name] += 1
+        if busy:
+            return self.refuse(503, 1, 'The service is busy. Please retry shortly.')
+        g.admission_class = name
+        return None
+
+    def _release(self, exc=None):
+        name = g.pop('admission_class', None)
+        if name is not None:
+            with self._lock:
+                self._inflight[name] -= 1
+
+    def _prune(self):
+        now = time.time()
+        if now - self._pruned_at < PRUNE_EVERY:
+            return
+        self._pruned_at = now
+        self._connection().execute('DELETE FROM buckets WHERE updated < ?', (now - IDLE_SECONDS,))
+
+    @staticmethod
+    def refuse(status, retry_after, message):
+        if request.path.startswith('/api/'):
+            response = jsonify({'error': message})
+        else:
+            response = current_app.response_class(message, mimetype='text/plain')
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+
+admission = Admission()
@@ -0,0 +1,267 @@
+import time
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+import numpy as np
+from flask import g
+from sqlalchemy import select
+from models import db, User, DoctorProfile, Department, AppointmentStatus
+from services.shards import shard_router
+
+# rows pulled from SQLite per fetch; each batch becomes one structured array
+CHUNK_ROWS = 50000
+MAX_DAYS = 3 * 366
+STATUSES = (AppointmentStatus.BOOKED, AppointmentStatus.COMPLETED, AppointmentStatus.CANCELLED)
+CANCELLED = STATUSES.index(AppointmentStatus.CANCELLED)
+# lead time buckets, in hours
+LEAD_EDGES = np.array([0, 1, 24, 72, 168, 336, 720, np.inf])
+LEAD_LABELS = ['< 1 hour', '1-24 hours', '1-3 days', '3-7 days', '1-2 weeks', '2-4 weeks', '4+ weeks']
+# computed results for periods that are over don't change; keep them for a day
+PAST_PERIOD_TTL = 24 * 3600
+MAX_CACHED_PERIODS = 32
+
+AVAILABILITY_DTYPE = np.dtype([('doctor', 'i8'), ('minutes', 'f8')])
+APPOINTMENT_DTYPE = np.dtype([('doctor', 'i8'), ('start', 'i8'), ('minutes', 'f8'), ('status', 'i8'),
+                              ('canceled_by', 'i8'), ('lead', 'f8')])
+
+AVAILABILITY_SQL = ('SELECT doctor_id, (julianday(end_time) - julianday(start_time)) * 1440 '
+                    'FROM doctor_availabilities WHERE doctor_id IN ({doctors}) AND date BETWEEN ? AND ?')
+CANCELED_BY_SQL = ("SELECT DISTINCT canceled_by FROM appointments WHERE doctor_id IN ({doctors}) "
+                   "AND appointment_start >= ? AND appointment_start < ? AND status = 'CANCELLED'")
+# start in minutes after the period's first midnight; lead time in hours, -1 when unknown.
+# appointment times are naive local time and created_at is UTC, so created_at is converted first
+APPOINTMENT_SQL = ("SELECT doctor_id, "
+                   "CAST(round((julianday(appointment_start) - julianday(?)) * 1440) AS INTEGER), "
+                   "(julianday(appointment_end) - julianday(appointment_start)) * 1440, "
+                   "CASE status WHEN 'COMPLETED' THEN 1 WHEN 'CANCELLED' THEN 2 ELSE 0 END, "
+                   "CASE canceled_by {canceled_by} ELSE -1 END, "
+                   "coalesce((julianday(appointment_start) - julianday(created_at, 'localtime')) * 24, -1) "
+                   "FROM appointments "
+                   "WHERE doctor_id IN ({doctors}) AND appointment_start >= ? AND appointment_start < ?")
+
+
+class AnalyticsError(Exception):
+    pass
+
+
+def _chunks(conn, sql, params, dtype):
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            return
+        yield np.fromiter(rows, dtype=dtype, count=len(rows))
+
+
+def scan_department(path, doctor_ids, start, end):
+    # Partial sums for one department's doctors, read straight from the SQLite file that
+    # holds their rows. Runs in the request thread or in a pool process.
+    doctors = np.array(sorted(doctor_ids), dtype=np.int64)
+    n = len(doctors)
+    part = {
+        'doctors': doctors,
+        'available': np.zeros(n), 'booked': np.zeros(n),
+        'appointments': np.zeros(n, dtype=np.int64), 'cancelled': np.zeros(n, dtype=np.int64),
+        'statuses': np.zeros(len(STATUSES), dtype=np.int64),
+        'canceled_by': {},
+        'week': np.zeros(7 * 24, dtype=np.int64),
+        'lead': [],
+    }
+    marks = ','.join('?' * n)
+    lo, hi = f'{start} 00:00:00', f'{end + timedelta(days=1)} 00:00:00'
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        for chunk in _chunks(conn, AVAILABILITY_SQL.format(doctors=marks),
+                             [*doctors.tolist(), start.isoformat(), end.isoformat()], AVAILABILITY_DTYPE):
+            idx = np.searchsorted(doctors, chunk['doctor'])
+            part['available'] += np.bincount(idx, weights=chunk['minutes'], minlength=n)
+
+        # canceled_by is free text: number the values present, then select the numbers
+        names = [r[0] for r in conn.execute(CANCELED_BY_SQL.format(doctors=marks), [*doctors.tolist(), lo, hi])]
+        cases = ' '.join('WHEN ? THEN ?' for _ in names) or 'WHEN NULL THEN -1'
+        params = [lo, *[v for i, name in enumerate(names) for v in (name, i)], *doctors.tolist(), lo, hi]
+        sql = APPOINTMENT_SQL.format(canceled_by=cases, doctors=marks)
+        for chunk in _chunks(conn, sql, params, APPOINTMENT_DTYPE):
+            idx = np.searchsorted(doctors, chunk['doctor'])
+            live = chunk['status'] != CANCELLED
+            part['appointments'] += np.bincount(idx, minlength=n)
+            part['cancelled'] += np.bincount(idx[~live], minlength=n)
+            part['booked'] += np.bincount(idx[live], weights=chunk['minutes'][live], minlength=n)
+            part['statuses'] += np.bincount(chunk['status'], minlength=len(STATUSES))
+            # index 0 counts cancellations with no canceled_by
+            by = np.bincount(chunk['canceled_by'][~live] + 1, minlength=len(names) + 1)
+            for name, count in zip([None, *names], by.tolist()):
+                if count:
+                    part['canceled_by'][name] = part['canceled_by'].get(name, 0) + count
+            day, minute = np.divmod(chunk['start'][live], 24 * 60)
+            part['week'] += np.bincount((day + start.weekday()) % 7 * 24 + minute // 60, minlength=7 * 24)
+            # appointments entered after they started have no meaningful lead time
+            lead = chunk['lead']
+            part['lead'].append(lead[lead >= 0].astype(np.float32))
+    finally:
+        conn.close()
+    part['lead'] = np.concatenate(part['lead']) if part['lead'] else np.zeros(0, dtype=np.float32)
+    return part
+
+
+def parse_period(start, end, today=None):
+    # YYYY-MM-DD strings; defaults to the 30 days up to today
+    today = today or date.today()
+    try:
+        end = date.fromisoformat(end) if end else today
+        start = date.fromisoformat(start) if start else end - timedelta(days=29)
+    except ValueError:
+        raise AnalyticsError('start and end must be YYYY-MM-DD dates')
+    if start > end:
+        raise AnalyticsError('start must not be after end')
+    if (end - start).days >= MAX_DAYS:
+        raise AnalyticsError(f'periods are limited to {MAX_DAYS} days')
+    return start, end
+
+
+def _rate(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+class Analytics:
+    # Utilization, cancellations, lead times and busy hours for a period. Rows are
+    # scanned per department into numpy arrays and reduced there; long periods spread
+    # the departments over a process pool. Results are cached per period in each worker.
+
+    def __init__(self, app=None):
+        self.processes = 1
+        self.pool_min_days = 90
+        self.ttl = 300
+        self._pool = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.processes = int(app.config.get('ANALYTICS_PROCESSES', 1))
+        self.pool_min_days = int(app.config.get('ANALYTICS_POOL_MIN_DAYS', 90))
+        self.ttl = float(app.config.get('ANALYTICS_CACHE_TTL', 300))
+
+    def report(self, start, end):
+        key = (start, end)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+        result = self.compute(start, end)
+        ttl = PAST_PERIOD_TTL if end < date.today() else self.ttl
+        with self._lock:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            while len(self._cache) >= MAX_CACHED_PERIODS:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (now + ttl, result)
+        return result
+
+    def compute(self, start, end):
+        doctors = db.session.execute(
+            select(DoctorProfile.id, DoctorProfile.department_id, User.id.label('user_id'), User.name)
+            .join(User, User.id == DoctorProfile.user_id)).all()
+        departments = dict(db.session.execute(select(Department.id, Department.name)).all())
+        groups = {}
+        for d in doctors:
+            groups.setdefault(d.department_id, []).append(d.id)
+        jobs = [(self._source(dept), ids, start, end) for dept, ids in groups.items()]
+
+        if self.processes > 1 and len(jobs) > 1 and (end - start).days >= self.pool_min_days:
+            parts = list(self._executor().map(scan_department, *zip(*jobs)))
+        else:
+            parts = [scan_department(*job) for job in jobs]
+        return self._combine(start, end, parts, doctors, departments)
+
+    @staticmethod
+    def _source(department_id):
+        # the file holding this department's appointments: its shard, or the (replica) database
+        if shard_router.enabled:
+            engine = shard_router.engine(shard_router.shard_of_department(department_id))
+        else:
+            engine = db.engines.get(g.get('db_read_bind'), db.engines[None])
+        return engine.url.database
+
+    def _executor(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn: forking a threaded server process is not safe
+                    self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    @staticmethod
+    def _combine(start, end, parts, doctors, departments):
+        profile_ids = np.concatenate([p['doctors'] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+        columns = {name: np.concatenate([p[name] for p in parts]) if parts else np.zeros(0)
+                   for name in ('available', 'booked', 'appointments', 'cancelled')}
+        statuses = sum((p['statuses'] for p in parts), np.zeros(len(STATUSES), dtype=np.int64))
+        week = sum((p['week'] for p in parts), np.zeros(7 * 24, dtype=np.int64))
+        lead = np.concatenate([p['lead'] for p in parts]) if parts else np.zeros(0, dtype=np.float32)
+        canceled_by = {}
+        for p in parts:
+            for name, count in p['canceled_by'].items():
+                canceled_by[name] = canceled_by.get(name, 0) + count
+
+        info = {d.id: d for d in doctors}
+        doctor_rows, by_department = [], {}
+        for i, profile_id in enumerate(profile_ids.tolist()):
+            d = info[profile_id]
+            available, booked = float(columns['available'][i]), float(columns['booked'][i])
+            doctor_rows.append({
+                'id': d.user_id, 'name': d.name, 'department_id': d.department_id,
+                'available_minutes': round(available), 'booked_minutes': round(booked),
+                'utilization': _rate(booked, available),
+                'appointments': int(columns['appointments'][i]), 'cancelled': int(columns['cancelled'][i]),
+            })
+            dept = by_department.setdefault(d.department_id, [0.0, 0.0, 0])
+            dept[0] += available
+            dept[1] += booked
+            dept[2] += 1
+        doctor_rows.sort(key=lambda r: (-(r['utilization'] or 0), r['name']))
+
+        total = int(statuses.sum())
+        cancelled = int(statuses[CANCELLED])
+        available, booked = float(columns['available'].sum()), float(columns['booked'].sum())
+        hist, _ = np.histogram(lead, bins=LEAD_EDGES)
+        by_hour = week.reshape(7, 24).sum(axis=0)
+        busiest = np.argsort(-by_hour, kind='stable')
+        return {
+            'period': {'start': start.isoformat(), 'end': end.isoformat()},
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'totals': {
+                'appointments': total, 'available_minutes': round(available), 'booked_minutes': round(booked),
+                'utilization': _rate(booked, available),
+                'statuses': dict(zip(STATUSES, statuses.tolist())),
+            },
+            'departments': sorted(({
+                'id': dept_id, 'name': departments.get(dept_id, 'No department'), 'doctors': n,
+                'available_minutes': round(a), 'booked_minutes': round(b), 'utilization': _rate(b, a),
+            } for dept_id, (a, b, n) in by_department.items()), key=lambda r: r['name']),
+            'doctors': doctor_rows,
+            'cancellations': {
+                'total': cancelled, 'rate': _rate(cancelled, total),
+                'by': sorted(({'canceled_by': name or 'UNKNOWN', 'count': n, 'rate': _rate(n, total)}
+                              for name, n in canceled_by.items()), key=lambda r: -r['count']),
+            },
+            'lead_time_hours': {
+                'appointments': int(lead.size),
+                'mean': round(float(lead.mean()), 1) if lead.size else None,
+                'median': round(float(np.median(lead)), 1) if lead.size else None,
+                'p90': round(float(np.percentile(lead, 90)), 1) if lead.size else None,
+                'histogram': [{'label': label, 'count': int(n)} for label, n in zip(LEAD_LABELS, hist)],
+            },
+            'hours': {
+                'by_hour': by_hour.tolist(),
+                # rows Monday..Sunday, columns 0..23
+                'by_weekday': week.reshape(7, 24).tolist(),
+                'busiest': [int(h) for h in busiest[:5] if by_hour[h]],
+            },
+        }
+
+
+analytics = Analytics()
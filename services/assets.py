@@ -0,0 +1,139 @@
+import os
+import re
+import gzip
+import zlib
+import hashlib
+import threading
+from functools import partial, wraps
+from flask import request
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# text responses worth compressing; images other than SVG are already compressed
+COMPRESSIBLE = frozenset(('text/html', 'application/json', 'text/plain', 'text/css', 'text/javascript',
+                          'application/javascript', 'image/svg+xml'))
+# brotli's sweet spot for per-request compression: near level 9 gzip size at level 6 speed
+BROTLI_QUALITY = 5
+# name.<hash>.ext as produced by url_for('static', ...)
+FINGERPRINTED = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Assets:
+    # Two things that cut bytes on the wire: text responses are gzip/brotli encoded
+    # once they pass a size threshold (streamed pages chunk by chunk), and url_for('static', ...) adds a content hash
+    # to the filename so browsers can cache assets for a year without revalidating.
+    # Templates keep calling url_for as before.
+
+    def __init__(self, app=None):
+        self._digests = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.min_size = int(app.config.get('COMPRESS_MIN_SIZE', 500))
+        self.level = int(app.config.get('COMPRESS_LEVEL', 6))
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        if app.config.get('STATIC_FINGERPRINT', True) and 'static' in app.view_functions:
+            app.url_defaults(self._fingerprint)
+            app.view_functions['static'] = self._serve(app.view_functions['static'])
+        if app.config.get('COMPRESS_RESPONSES', True):
+            app.after_request(self._compress)
+
+    # --- fingerprinted static URLs ---
+
+    def digest(self, filename):
+        # first 12 hex digits of the file's sha256, recomputed when its mtime changes
+        path = safe_join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (TypeError, OSError):
+            return None
+        cached = self._digests.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._digests[filename] = (mtime, digest)
+        return digest
+
+    def _fingerprint(self, endpoint, values):
+        if endpoint != 'static' or 'filename' not in values:
+            return
+        digest = self.digest(values['filename'])
+        if digest is not None:
+            stem, ext = os.path.splitext(values['filename'])
+            values['filename'] = f'{stem}.{digest}{ext}'
+
+    def split(self, filename):
+        # (real filename, digest from the URL or None)
+        match = FINGERPRINTED.match(filename)
+        if match is None or self.digest(filename) is not None:
+            return filename, None
+        return match['stem'] + match['ext'], match['digest']
+
+    def _serve(self, view):
+        @wraps(view)
+        def serve(filename):
+            filename, digest = self.split(filename)
+            response = view(filename=filename)
+            # a stale hash (page rendered before a deploy) gets the current file, revalidated as usual
+            if digest is not None and digest == self.digest(filename):
+                response.headers['Cache-Control'] = IMMUTABLE
+            return response
+        return serve
+
+    # --- compression ---
+
+    def _compress(self, response):
+        if (response.direct_passthrough or response.mimetype not in COMPRESSIBLE
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._compress_stream(response.iter_encoded(), response.response, encoding)
+            response.headers['Content-Encoding'] = encoding
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(data, compresslevel=self.level, mtime=0)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _compress_stream(self, chunks, source, encoding):
+        # each chunk is flushed as it comes, so the browser can render while the rest is produced
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            compress, finish = compressor.compress, compressor.flush
+            flush = partial(compressor.flush, zlib.Z_SYNC_FLUSH)
+        try:
+            for chunk in chunks:
+                yield compress(chunk) + flush()
+            yield finish()
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+
+assets = Assets()
@@ -0,0 +1,248 @@
+import os
+import time
+import random
+import shutil
+import sqlite3
+import hashlib
+import logging
+from datetime import datetime, timezone
+from models import db
+from utils import hash_password
+
+logger = logging.getLogger(__name__)
+
+STAMP_FORMAT = '%Y%m%dT%H%M%SZ'
+CHECKSUM_FILE = 'SHA256SUMS'
+
+# words for scrubbed free text; keeps row sizes realistic without any real content
+FILLER_WORDS = ('review', 'stable', 'follow', 'routine', 'mild', 'advised', 'daily', 'course', 'symptoms',
+                'check', 'rest', 'fluids', 'tablet', 'dose', 'history', 'normal', 'plan', 'visit', 'taken')
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    pass
+
+
+def database_files():
+    # (name, path) for the main database and every shard; the read replica is a copy already
+    files = [('main', db.engines[None].url.database)]
+    for key, engine in sorted(db.engines.items(), key=lambda kv: kv[0] or ''):
+        if key and key.startswith('shard'):
+            files.append((key, engine.url.database))
+    return files
+
+
+def copy_database(src_path, dst_path, pages=256, pause=0.05, max_restarts=3):
+    # Copy `pages` pages per step and sleep in between so writers get the lock back.
+    # SQLite restarts the copy when another connection writes mid-backup; after a few
+    # restarts finish in one step, which is a single short read transaction.
+    src = sqlite3.connect(src_path, timeout=30)
+    dst = sqlite3.connect(dst_path)
+    state = {'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise _Restarted()
+        state['remaining'] = remaining
+        time.sleep(pause)
+
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+        except _Restarted:
+            logger.info('%s kept changing during backup; copying in one step', src_path)
+            src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    return state['restarts']
+
+
+def quick_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if result != 'ok':
+        raise BackupError(f'{path} failed integrity check: {result}')
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_checksums(directory, names):
+    with open(os.path.join(directory, CHECKSUM_FILE), 'w') as f:
+        for name in names:
+            f.write(f'{sha256(os.path.join(directory, name))}  {name}\n')
+
+
+def verify(directory):
+    # returns the files checked; raises BackupError on any mismatch or corruption
+    listing = os.path.join(directory, CHECKSUM_FILE)
+    if not os.path.exists(listing):
+        raise BackupError(f'{directory} has no {CHECKSUM_FILE}')
+    checked = []
+    with open(listing) as f:
+        for line in f:
+            digest, name = line.rstrip('\n').split('  ', 1)
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                raise BackupError(f'{path} is missing')
+            if sha256(path) != digest:
+                raise BackupError(f'{path} does not match its checksum')
+            quick_check(path)
+            checked.append(name)
+    return checked
+
+
+def backup_sets(root):
+    sets = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            try:
+                taken = datetime.strptime(name, STAMP_FORMAT).replace(tzinfo=timezone.utc)
+            except ValueError:
+                continue
+            sets.append((taken, os.path.join(root, name)))
+    return sorted(sets, reverse=True)
+
+
+def create_backup(root, pages=256, pause=0.05):
+    # one directory per backup: every database file plus SHA256SUMS, renamed into
+    # place only after every copy passed its integrity check
+    stamp = datetime.now(timezone.utc).strftime(STAMP_FORMAT)
+    final = os.path.join(root, stamp)
+    work = final + '.part'
+    os.makedirs(work)
+    try:
+        names = []
+        for name, path in database_files():
+            target = os.path.join(work, f'{name}.db')
+            copy_database(path, target, pages=pages, pause=pause)
+            quick_check(target)
+            names.append(f'{name}.db')
+        write_checksums(work, names)
+        os.rename(work, final)
+    except Exception:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    return final
+
+
+def prune(root, daily=7, weekly=4, monthly=6):
+    # grandfather-father-son: newest backup of each of the last `daily` days,
+    # `weekly` ISO weeks and `monthly` months; the newest backup is always kept
+    sets = backup_sets(root)
+    keep = set(path for _, path in sets[:1])
+    for count, key in ((daily, lambda t: t.date()),
+                       (weekly, lambda t: t.isocalendar()[:2]),
+                       (monthly, lambda t: (t.year, t.month))):
+        seen = set()
+        for taken, path in sets:
+            k = key(taken)
+            if k not in seen and len(seen) < count:
+                seen.add(k)
+                keep.add(path)
+    removed = []
+    for _, path in sets:
+        if path not in keep:
+            shutil.rmtree(path)
+            removed.append(path)
+    return removed
+
+
+def _filler(text, seed):
+    if text is None:
+        return None
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < len(text):
+        word = rng.choice(FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:max(len(text), 1)]
+
+
+def _tables(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+
+
+def anonymize(path, main_path=None, keep_patients=None):
+    # scrub PHI in place; shard files pass the (already scrubbed) main copy so
+    # trimming can see which patients were kept
+    conn = sqlite3.connect(path)
+    conn.create_function('filler', 2, _filler, deterministic=True)
+    try:
+        if main_path and main_path != path:
+            conn.execute('ATTACH DATABASE ? AS global', (main_path,))
+        profiles = 'global.patient_profiles' if main_path and main_path != path else 'main.patient_profiles'
+        tables = _tables(conn)
+        with conn:
+            if 'users' in tables:
+                if keep_patients is not None:
+                    conn.execute('DELETE FROM main.patient_profiles WHERE id NOT IN '
+                                 '(SELECT id FROM main.patient_profiles ORDER BY id LIMIT ?)', (keep_patients,))
+                    conn.execute("DELETE FROM main.users WHERE role = 'PATIENT' AND id NOT IN "
+                                 "(SELECT user_id FROM main.patient_profiles)")
+                conn.execute("UPDATE main.users SET name = 'Patient ' || id, "
+                             "email = 'patient' || id || '@example.invalid' WHERE role = 'PATIENT'")
+                # everyone can log in to a snapshot with the seed passwords
+                for role, password in (('PATIENT', 'patient123'), ('DOCTOR', 'doctor123'), ('ADMIN', 'admin123')):
+                    conn.execute('UPDATE main.users SET password_hash = ? WHERE role = ?',
+                                 (hash_password(password), role))
+                conn.execute("UPDATE main.patient_profiles SET phone = printf('90000%05d', id % 100000), "
+                             "address = NULL, dob = strftime('%Y-01-01', dob)")
+                conn.execute("UPDATE main.doctor_profiles SET phone = printf('80000%05d', id % 100000)")
+            if 'doctor_patients' in tables and keep_patients is not None:
+                conn.execute('DELETE FROM main.doctor_patients WHERE patient_id NOT IN (SELECT id FROM main.patient_profiles)')
+            # the change log, job payloads and stored API responses embed names and reasons
+            for table in ('appointment_events', 'jobs', 'idempotency_keys'):
+                if table in tables:
+                    conn.execute(f'DELETE FROM main.{table}')
+            if 'appointments' in tables:
+                if keep_patients is not None:
+                    conn.execute(f'DELETE FROM main.appointments WHERE patient_id NOT IN (SELECT id FROM {profiles})')
+                conn.execute('UPDATE main.appointments SET reason = filler(reason, id)')
+            if 'treatments' in tables:
+                if keep_patients is not None:
+                    conn.execute('DELETE FROM main.treatments WHERE appointment_id NOT IN (SELECT id FROM main.appointments)')
+                conn.execute('UPDATE main.treatments SET diagnosis = filler(diagnosis, id), '
+                             'prescription = filler(prescription, id + 1), notes = filler(notes, id + 2), '
+                             'doctor_notes = filler(doctor_notes, id + 3)')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+
+def create_snapshot(out_dir, keep_patients=None, pages=256, pause=0.05):
+    # a consistent, anonymized and optionally trimmed copy of every database file
+    # for loading into benchmark environments
+    os.makedirs(out_dir, exist_ok=True)
+    names = []
+    files = database_files()
+    for name, path in files:
+        target = os.path.join(out_dir, f'{name}.db')
+        if os.path.exists(target):
+            raise BackupError(f'{target} already exists')
+        copy_database(path, target, pages=pages, pause=pause)
+        names.append(f'{name}.db')
+    main_copy = os.path.join(out_dir, 'main.db')
+    for name in names:
+        anonymize(os.path.join(out_dir, name), main_path=main_copy, keep_patients=keep_patients)
+    for name in names:
+        quick_check(os.path.join(out_dir, name))
+    write_checksums(out_dir, names)
+    return [os.path.join(out_dir, n) for n in names]
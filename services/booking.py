@@ -0,0 +1,292 @@
+from bisect import bisect_left
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, delete, insert, update, func, case, exists, type_coerce, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Appointment, AppointmentEvent, AppointmentStatus, Job, DoctorAvailability, DoctorPatient
+from services.shards import shard_router
+
+
+class BookingError(Exception):
+    pass
+
+
+class SlotUnavailable(BookingError):
+    pass
+
+
+class SlotOverlap(SlotUnavailable):
+    pass
+
+
+class SlotTaken(SlotUnavailable):
+    pass
+
+
+def slot_bounds(slot):
+    return datetime.combine(slot.date, slot.start_time), datetime.combine(slot.date, slot.end_time)
+
+
+def find_overlap(doctor_id, start_dt, end_dt, exclude_id=None):
+    q = Appointment.query.filter_by(doctor_id=doctor_id)\
+        .filter(Appointment.status != AppointmentStatus.CANCELLED)\
+        .filter(
+            db.and_(
+                Appointment.appointment_start < end_dt,
+                Appointment.appointment_end > start_dt
+            )
+        )
+    if exclude_id is not None:
+        q = q.filter(Appointment.id != exclude_id)
+    return q.first()
+
+
+def upcoming_slots_stmt(doctor_id, today):
+    return select(DoctorAvailability)\
+        .filter(DoctorAvailability.doctor_id == doctor_id, DoctorAvailability.date >= today)\
+        .order_by(DoctorAvailability.date, DoctorAvailability.start_time)
+
+
+def busy_windows_stmt(doctor_id, since):
+    return select(Appointment.appointment_start, Appointment.appointment_end)\
+        .filter(Appointment.doctor_id == doctor_id, Appointment.status != AppointmentStatus.CANCELLED)\
+        .filter(Appointment.appointment_end > since)\
+        .order_by(Appointment.appointment_start)
+
+
+def booked_slot_ids(slots, busy):
+    # busy windows of one doctor never overlap, so both starts and ends are sorted
+    busy = list(busy)
+    starts = [b[0] for b in busy]
+    booked = set()
+    for slot in slots:
+        start_dt, end_dt = slot_bounds(slot)
+        i = bisect_left(starts, end_dt)
+        if i and busy[i - 1][1] > start_dt:
+            booked.add(slot.id)
+    return booked
+
+
+
+def _minutes(start, end):
+    # SQLite stores times and datetimes as ISO text, which julianday() reads
+    return func.round((func.julianday(end) - func.julianday(start)) * 1440)
+
+
+def month_calendar(doctor_id, year, month):
+    # Per-day summary of one doctor's month: window minutes and slots from one grouped
+    # query over availabilities, booked minutes from one over appointments. A slot is
+    # free when no live appointment overlaps its window.
+    first = date(year, month, 1)
+    last = first + timedelta(days=monthrange(year, month)[1] - 1)
+    live = Appointment.status != AppointmentStatus.CANCELLED
+    window_start = type_coerce(DoctorAvailability.date, String) + ' ' + type_coerce(DoctorAvailability.start_time, String)
+    window_end = type_coerce(DoctorAvailability.date, String) + ' ' + type_coerce(DoctorAvailability.end_time, String)
+    taken = exists().where(Appointment.doctor_id == DoctorAvailability.doctor_id, live,
+                           Appointment.appointment_start < window_end, Appointment.appointment_end > window_start)
+    windows = db.session.execute(
+        select(DoctorAvailability.date,
+               func.count().label('slots'),
+               func.sum(_minutes(DoctorAvailability.start_time, DoctorAvailability.end_time)).label('minutes'),
+               func.sum(case((taken, 0), else_=1)).label('free'))
+        .filter(DoctorAvailability.doctor_id == doctor_id, DoctorAvailability.date.between(first, last))
+        .group_by(DoctorAvailability.date)).all()
+    day = func.date(Appointment.appointment_start)
+    booked = db.session.execute(
+        select(day, func.sum(_minutes(Appointment.appointment_start, Appointment.appointment_end)))
+        .filter(Appointment.doctor_id == doctor_id, live,
+                Appointment.appointment_start >= datetime.combine(first, datetime.min.time()),
+                Appointment.appointment_start < datetime.combine(last + timedelta(days=1), datetime.min.time()))
+        .group_by(day)).all()
+
+    windows = {w.date: w for w in windows}
+    booked = {date.fromisoformat(d): int(m or 0) for d, m in booked}
+    days = []
+    for offset in range((last - first).days + 1):
+        d = first + timedelta(days=offset)
+        w = windows.get(d)
+        days.append({
+            'date': d.isoformat(),
+            'window_minutes': int(w.minutes or 0) if w else 0,
+            'booked_minutes': booked.get(d, 0),
+            'slots': w.slots if w else 0,
+            'free_slots': int(w.free or 0) if w else 0,
+        })
+    return days
+
+
+def slot_status(slots, today=None):
+    # {slot id: is_booked} for slots of any number of doctors, with one query for
+    # the busy windows of all of them
+    slots = list(slots)
+    if not slots:
+        return {}
+    doctor_ids = {s.doctor_id for s in slots}
+    since = datetime.combine(today or min(s.date for s in slots), datetime.min.time())
+    busy = {}
+    for doctor_id, start, end in db.session.execute(
+            select(Appointment.doctor_id, Appointment.appointment_start, Appointment.appointment_end)
+            .filter(Appointment.doctor_id.in_(doctor_ids), Appointment.status != AppointmentStatus.CANCELLED)
+            .filter(Appointment.appointment_end > since)
+            .order_by(Appointment.doctor_id, Appointment.appointment_start)):
+        busy.setdefault(doctor_id, []).append((start, end))
+    by_doctor = {}
+    for slot in slots:
+        by_doctor.setdefault(slot.doctor_id, []).append(slot)
+    booked = set()
+    for doctor_id, doctor_slots in by_doctor.items():
+        booked |= booked_slot_ids(doctor_slots, busy.get(doctor_id, ()))
+    return {s.id: s.id in booked for s in slots}
+
+
+def book_slot(patient_profile, slot, reason):
+    start_dt, end_dt = slot_bounds(slot)
+    
+    if find_overlap(slot.doctor_id, start_dt, end_dt):
+        raise SlotOverlap('This slot overlaps with an existing appointment')
+        
+    appointment = Appointment(
+        patient_id=patient_profile.id,
+        doctor_id=slot.doctor_id,
+        appointment_start=start_dt,
+        appointment_end=end_dt,
+        reason=reason,
+        status=AppointmentStatus.BOOKED
+    )
+    
+    try:
+        db.session.add(appointment)
+        record_change(appointment)
+        record_visit(appointment)
+        db.session.commit()
+    except IntegrityError:
+        # lost the race on uq_doctor_appointment_slot
+        db.session.rollback()
+        raise SlotTaken('This slot was just booked by someone else. Please choose another.')
+    
+    return appointment
+
+
+def move_appointment(appointment, slot):
+    # Moves a booked appointment to another of its doctor's slots in one transaction,
+    # so the patient never holds neither slot. Same checks as book_slot: the overlap
+    # query up front, uq_doctor_appointment_slot for a booking that lands meanwhile.
+    if appointment.status != AppointmentStatus.BOOKED:
+        raise BookingError('Only booked appointments can be rescheduled')
+    if appointment.patient.is_blacklisted:
+        raise BookingError('Your account has been restricted. Please contact administrator.')
+    if slot.doctor_id != appointment.doctor_id:
+        raise BookingError('Appointments can only be moved to another slot with the same doctor')
+    start_dt, end_dt = slot_bounds(slot)
+    if start_dt == appointment.appointment_start:
+        raise BookingError('The appointment is already in this slot')
+    if start_dt <= datetime.now():
+        raise BookingError('This slot has already started. Please choose a later one.')
+
+    if find_overlap(slot.doctor_id, start_dt, end_dt, exclude_id=appointment.id):
+        raise SlotOverlap('This slot overlaps with an existing appointment')
+
+    appointment.appointment_start = start_dt
+    appointment.appointment_end = end_dt
+    try:
+        record_change(appointment, kind=AppointmentEvent.MOVED)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise SlotTaken('This slot was just booked by someone else. Your appointment was not changed.')
+
+    return appointment
+
+
+def change_status(appointment, new_status, canceled_by=None):
+    # caller checks can_transition_to and commits
+    if appointment.status == new_status:
+        return
+    appointment.status = new_status
+    if canceled_by:
+        appointment.canceled_by = canceled_by
+    record_change(appointment)
+    if new_status == AppointmentStatus.COMPLETED:
+        record_visit(appointment, completed=True)
+
+
+def record_change(appointment, kind=None):
+    # change-log entry for live views plus an outbox job for side effects, both in the caller's transaction
+    AppointmentEvent.record(appointment, kind)
+    Job.enqueue('appointment.changed', {'appointment_id': appointment.id, 'status': appointment.status,
+                                        'kind': kind or appointment.status})
+
+
+def record_visit(appointment, completed=False):
+    # upsert the doctor_patients row: bookings open the relationship, completions count as visits
+    dp = DoctorPatient.__table__
+    start = appointment.appointment_start
+    stmt = sqlite_insert(dp).values(
+        doctor_id=appointment.doctor_id,
+        patient_id=appointment.patient_id,
+        first_seen=start,
+        last_seen=start if completed else None,
+        visit_count=1 if completed else 0
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=['doctor_id', 'patient_id'], set_={
+        'first_seen': func.min(dp.c.first_seen, stmt.excluded.first_seen),
+        # two-argument max() is NULL if either side is
+        'last_seen': func.coalesce(func.max(dp.c.last_seen, stmt.excluded.last_seen),
+                                   dp.c.last_seen, stmt.excluded.last_seen),
+        'visit_count': dp.c.visit_count + stmt.excluded.visit_count,
+    })
+    db.session.execute(stmt)
+
+
+def forget_visit(appointment):
+    # before deleting an appointment: recompute its doctor_patients row from the pair's other
+    # appointments, or drop it when none are left so the doctor loses access to the records
+    completed = Appointment.status == AppointmentStatus.COMPLETED
+    remaining = db.session.execute(
+        select(func.count(),
+               func.min(Appointment.appointment_start),
+               func.max(case((completed, Appointment.appointment_start))),
+               func.count(case((completed, 1))))
+        .filter(Appointment.doctor_id == appointment.doctor_id, Appointment.patient_id == appointment.patient_id,
+                Appointment.id != appointment.id)).one()
+    pair = (DoctorPatient.doctor_id == appointment.doctor_id) & (DoctorPatient.patient_id == appointment.patient_id)
+    if not remaining[0]:
+        db.session.execute(delete(DoctorPatient.__table__).where(pair))
+        return
+    db.session.execute(update(DoctorPatient.__table__).where(pair).values(
+        first_seen=remaining[1], last_seen=remaining[2], visit_count=remaining[3]))
+
+
+def doctor_patient_rows(conn, first_doctor_id=None, last_doctor_id=None):
+    # doctor_patients rows recomputed from appointments; a doctor's appointments
+    # all live in one shard, so no (doctor, patient) group spans two databases
+    completed = Appointment.status == AppointmentStatus.COMPLETED
+    stmt = select(
+        Appointment.doctor_id,
+        Appointment.patient_id,
+        func.min(Appointment.appointment_start).label('first_seen'),
+        func.max(case((completed, Appointment.appointment_start))).label('last_seen'),
+        func.count(case((completed, 1))).label('visit_count')
+    ).group_by(Appointment.doctor_id, Appointment.patient_id)
+    if first_doctor_id is not None:
+        stmt = stmt.filter(Appointment.doctor_id.between(first_doctor_id, last_doctor_id))
+    if not shard_router.enabled:
+        return [dict(r._mapping) for r in conn.execute(stmt)]
+    rows = []
+    for shard in range(shard_router.count):
+        with shard_router.engine(shard).connect() as shard_conn:
+            rows.extend(dict(r._mapping) for r in shard_conn.execute(stmt))
+    return rows
+
+
+def rebuild_doctor_patients(conn, first_doctor_id=None, last_doctor_id=None):
+    # replaces the rows of the given doctors (all doctors by default) inside conn's transaction
+    rows = doctor_patient_rows(conn, first_doctor_id, last_doctor_id)
+    stmt = delete(DoctorPatient.__table__)
+    if first_doctor_id is not None:
+        stmt = stmt.where(DoctorPatient.doctor_id.between(first_doctor_id, last_doctor_id))
+    conn.execute(stmt)
+    if rows:
+        conn.execute(insert(DoctorPatient.__table__), rows)
+    return len(rows)
@@ -0,0 +1,183 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from itertools import chain
+from sqlalchemy import event, inspect, select
+from models import db, User, Role, DoctorProfile, Department, DataVersion
+from models.base import RoutingSession
+
+VERSION_NAME = 'doctor_directory'
+WORD = re.compile(r'\w+')
+# titles every doctor shares; typing them shouldn't list the whole directory
+STOP_WORDS = frozenset(('dr',))
+# match order: doctor name, then department, then qualification
+NAME, DEPARTMENT, QUALIFICATION = 0, 1, 2
+
+
+def normalize_words(value):
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(c for c in value if not unicodedata.combining(c)).lower()
+    return [w for w in WORD.findall(value) if w not in STOP_WORDS]
+
+
+class PrefixIndex:
+    # Sorted (word, rank, key) tuples searched with bisect. Never changed in place:
+    # updates build a new index, so request threads can keep reading the old one.
+
+    def __init__(self, entries=()):
+        self.entries = {}
+        self.words = {}
+        keys = []
+        for key, entry, fields in entries:
+            self.entries[key] = entry
+            self.words[key] = set()
+            for rank, text in fields:
+                for word in normalize_words(text):
+                    keys.append((word, rank, key))
+                    self.words[key].add(word)
+        keys.sort()
+        self.keys = keys
+
+    def replace(self, remove_keys, entries):
+        # a copy without `remove_keys` and with `entries` added
+        remove_keys = set(remove_keys) | {key for key, _, _ in entries}
+        updated = PrefixIndex(entries)
+        updated.keys = sorted(chain((k for k in self.keys if k[2] not in remove_keys), updated.keys))
+        for key, entry in self.entries.items():
+            if key not in remove_keys:
+                updated.entries[key] = entry
+                updated.words[key] = self.words[key]
+        return updated
+
+    def search(self, query, limit=10):
+        words = normalize_words(query)
+        if not words:
+            return []
+        # scan the longest word's range, then require every other word to prefix-match too
+        probe = max(words, key=len)
+        best = {}
+        i = bisect_left(self.keys, (probe,))
+        while i < len(self.keys) and self.keys[i][0].startswith(probe):
+            _, rank, key = self.keys[i]
+            if rank < best.get(key, QUALIFICATION + 1):
+                best[key] = rank
+            i += 1
+        others = [w for w in words if w != probe]
+        hits = [key for key in best
+                if all(any(word.startswith(w) for word in self.words[key]) for w in others)]
+        hits.sort(key=lambda key: (best[key], self.entries[key]['label'].lower()))
+        return [self.entries[key] for key in hits[:limit]]
+
+
+def _changed(obj, *attrs):
+    state = inspect(obj)
+    return state.pending or state.deleted or any(state.attrs[a].history.has_changes() for a in attrs)
+
+
+class DoctorDirectory:
+    # Type-ahead over active doctors and departments, held in memory by every worker.
+    # Edits made through this worker's sessions are applied in place after commit and
+    # bump the shared data_versions row; other workers notice the new version on their
+    # next lookup and rebuild.
+
+    def __init__(self, app=None):
+        self.index = PrefixIndex()
+        self.version = None
+        self._lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self._listening:
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+            event.listen(RoutingSession, 'after_commit', self._after_commit)
+            event.listen(RoutingSession, 'after_rollback', self._after_rollback)
+            self._listening = True
+
+    # --- lookups ---
+
+    def search(self, query, limit=10):
+        self.ensure_current()
+        return self.index.search(query, limit)
+
+    def ensure_current(self):
+        version = DataVersion.current(VERSION_NAME)
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    self.rebuild(version)
+
+    def rebuild(self, version):
+        self.index = PrefixIndex(self._load())
+        self.version = version
+
+    # --- loading ---
+
+    @staticmethod
+    def _doctor_rows(conn, user_ids=None):
+        stmt = select(User.id, User.name, DoctorProfile.qualification, Department.id.label('department_id'),
+                      Department.name.label('department'))\
+            .join(DoctorProfile, DoctorProfile.user_id == User.id)\
+            .outerjoin(Department, Department.id == DoctorProfile.department_id)\
+            .filter(User.role == Role.DOCTOR, User.is_active.is_(True))
+        if user_ids is not None:
+            stmt = stmt.filter(User.id.in_(user_ids))
+        return conn.execute(stmt).all()
+
+    @staticmethod
+    def _doctor_entry(row):
+        entry = {'type': 'doctor', 'id': row.id, 'label': row.name, 'detail': row.department,
+                 'department_id': row.department_id}
+        fields = [(NAME, row.name), (DEPARTMENT, row.department), (QUALIFICATION, row.qualification)]
+        return ('doctor', row.id), entry, fields
+
+    def _load(self):
+        conn = db.session.connection()
+        entries = [self._doctor_entry(r) for r in self._doctor_rows(conn)]
+        for dept in conn.execute(select(Department.id, Department.name)):
+            entries.append((('department', dept.id), {'type': 'department', 'id': dept.id, 'label': dept.name},
+                            [(DEPARTMENT, dept.name)]))
+        return entries
+
+    # --- keeping this worker current ---
+
+    def _after_flush(self, session, flush_context):
+        doctors, departments = set(), False
+        for obj in chain(session.new, session.dirty, session.deleted):
+            if isinstance(obj, User) and obj.role == Role.DOCTOR and _changed(obj, 'name', 'is_active'):
+                doctors.add(obj.id)
+            elif isinstance(obj, DoctorProfile) and _changed(obj, 'qualification', 'department_id', 'user_id'):
+                doctors.add(obj.user_id)
+            elif isinstance(obj, Department) and _changed(obj, 'name'):
+                departments = True
+        if not doctors and not departments:
+            return
+        version = DataVersion.bump(session.connection(), VERSION_NAME)
+        pending = session.info.setdefault('directory_changes', {'base': version - 1, 'doctors': set(),
+                                                                'departments': False})
+        pending['doctors'] |= doctors
+        pending['departments'] |= departments
+        pending['version'] = version
+
+    def _after_commit(self, session):
+        pending = session.info.pop('directory_changes', None)
+        if pending is None:
+            return
+        with self._lock:
+            if self.version != pending['base'] or pending['departments']:
+                # missed someone else's change, or a rename touching many entries
+                self.version = None
+                return
+            with db.engines[None].connect() as conn:
+                rows = self._doctor_rows(conn, pending['doctors'])
+            keys = [('doctor', user_id) for user_id in pending['doctors']]
+            self.index = self.index.replace(keys, [self._doctor_entry(r) for r in rows])
+            self.version = pending['version']
+
+    def _after_rollback(self, session):
+        session.info.pop('directory_changes', None)
+
+
+directory = DoctorDirectory()
@@ -0,0 +1,123 @@
+import json
+import time
+import queue
+import logging
+import threading
+from models import db, AppointmentEvent
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, doctor_id, maxsize, after_id=0):
+        self.doctor_id = doctor_id
+        # events up to here come from the backlog query, not the queue
+        self.after_id = after_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def wants(self, event):
+        return event['id'] > self.after_id and (self.doctor_id is None or event['doctor_id'] == self.doctor_id)
+
+
+# Tails appointment_events with one query per interval per worker and fans new rows
+# out to the in-memory queues of SSE subscribers, however many are connected.
+class ChangeFeed:
+    def __init__(self, app=None):
+        self.app = None
+        self.cursor = None
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = float(app.config.get('EVENT_POLL_INTERVAL', 1.0))
+        self.batch_size = int(app.config.get('EVENT_BATCH_SIZE', 500))
+        self.queue_size = int(app.config.get('EVENT_QUEUE_SIZE', 1000))
+
+    def _start(self):
+        # runs under self.lock; started lazily so a preloading master never owns the thread
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.app.app_context():
+            self.cursor = db.session.query(db.func.max(AppointmentEvent.id)).scalar() or 0
+            db.session.remove()
+        self.thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self.thread.start()
+
+    def subscribe(self, doctor_id=None):
+        with self.lock:
+            self._start()
+            if not self.subscribers:
+                # the poll thread stops reading while nobody listens; catch up so the
+                # backlog, not the queue, covers what happened meanwhile
+                self.cursor = max(self.cursor, self.latest_id())
+            sub = Subscription(doctor_id, self.queue_size, self.cursor)
+            self.subscribers.add(sub)
+            # events after this id will be delivered through the queue
+            return sub, self.cursor
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def latest_id(self):
+        return db.session.query(db.func.max(AppointmentEvent.id)).scalar() or 0
+
+    def backlog(self, after_id, upto_id, doctor_id=None):
+        # replay for reconnecting clients (Last-Event-ID), one query per connect
+        q = AppointmentEvent.query.filter(AppointmentEvent.id > after_id, AppointmentEvent.id <= upto_id)
+        if doctor_id is not None:
+            q = q.filter(AppointmentEvent.doctor_id == doctor_id)
+        return [e.to_dict() for e in q.order_by(AppointmentEvent.id).limit(self.batch_size * 10).all()]
+
+    def _poll(self):
+        with self.app.app_context():
+            try:
+                rows = AppointmentEvent.query.filter(AppointmentEvent.id > self.cursor)\
+                    .order_by(AppointmentEvent.id).limit(self.batch_size).all()
+                return [e.to_dict() for e in rows]
+            finally:
+                db.session.remove()
+
+    def _dispatch(self, events):
+        with self.lock:
+            subscribers = list(self.subscribers)
+            if events:
+                self.cursor = max(self.cursor, events[-1]['id'])
+        for event in events:
+            for sub in list(subscribers):
+                if not sub.wants(event):
+                    continue
+                try:
+                    sub.queue.put_nowait(event)
+                except queue.Full:
+                    # slow consumer: tell it to reload instead of buffering without bound
+                    self.unsubscribe(sub)
+                    subscribers.remove(sub)
+                    with sub.queue.mutex:
+                        sub.queue.queue.clear()
+                    sub.queue.put_nowait(None)
+
+    def _run(self):
+        while True:
+            if not self.subscribers:
+                time.sleep(self.interval)
+                continue
+            try:
+                events = self._poll()
+            except Exception:
+                logger.exception('change feed poll failed')
+                events = []
+            self._dispatch(events)
+            if len(events) < self.batch_size:
+                time.sleep(self.interval)
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['kind'].lower()}\ndata: {json.dumps(event)}\n\n"
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,138 @@
+import time
+import threading
+from collections import OrderedDict
+from itertools import chain
+from flask import g
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from models import User, Role, DoctorProfile, PatientProfile, Department, DataVersion
+from models.base import RoutingSession
+
+# data_versions rows bumped when these columns change; templates put data_version(...)
+# in a fragment's key, so an edit makes every fragment built from that dataset stale.
+# (dataset, model, role for User rows, columns)
+WATCHED = [
+    ('doctors', User, Role.DOCTOR, ('name', 'is_active')),
+    ('doctors', DoctorProfile, None, ('department_id', 'qualification', 'bio', 'is_blacklisted')),
+    ('patients', User, Role.PATIENT, ('name', 'is_active')),
+    ('patients', PatientProfile, None, ('is_blacklisted',)),
+    ('departments', Department, None, ('name',)),
+]
+
+
+def _changed(obj, attrs):
+    state = inspect(obj)
+    return state.pending or state.deleted or any(state.attrs[a].history.has_changes() for a in attrs)
+
+
+def once(fn):
+    # defer a view's query until a template actually needs it; later calls reuse the result
+    result = []
+
+    def call():
+        if not result:
+            result.append(fn())
+        return result[0]
+    return call
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache key, ttl %}...{% endcache %}: the body is rendered once per distinct key
+    # and served from the worker's cache until `ttl` seconds pass or it is evicted.
+    # ttl is optional; without it an entry lives until its key stops being used.
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        ttl = parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None)
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        # the same key in two places of a template must not share an entry
+        where = nodes.Const(f'{parser.name}:{lineno}')
+        return nodes.CallBlock(self.call_method('_render', [where, key, ttl]), [], [], body).set_lineno(lineno)
+
+    def _render(self, where, key, ttl, caller):
+        return fragments.fetch((where, key), ttl, caller)
+
+
+class FragmentCache:
+    # Rendered template fragments in a per-worker LRU bounded by total size.
+    # Entries are never invalidated directly: keys carry data versions, so after an
+    # edit the next view misses, renders and stores a new entry, and the old one
+    # ages out.
+
+    def __init__(self, app=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listening = False
+        self.max_size = 0
+        self.size = 0
+        self.hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = int(app.config.get('FRAGMENT_CACHE_SIZE', 4 * 1024 * 1024))
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.globals['data_version'] = data_version
+        if not self._listening:
+            event.listen(RoutingSession, 'after_flush', self._after_flush)
+            self._listening = True
+
+    def fetch(self, key, ttl, render):
+        if self.max_size <= 0:
+            return render()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return Markup(entry[1])
+            self.misses += 1
+        # rendered outside the lock; two threads missing together both render, last one is kept
+        html = render()
+        self.store(key, html, None if ttl is None else now + ttl)
+        return html
+
+    def store(self, key, html, expires):
+        size = len(html)
+        if size > self.max_size // 4:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._entries[key] = (expires, str(html))
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _after_flush(self, session, flush_context):
+        datasets = set()
+        for obj in chain(session.new, session.dirty, session.deleted):
+            for name, model, role, attrs in WATCHED:
+                if isinstance(obj, model) and (role is None or obj.role == role) and _changed(obj, attrs):
+                    datasets.add(name)
+        for name in sorted(datasets):
+            DataVersion.bump(session.connection(), name)
+
+
+def data_version(*names):
+    # versions for a fragment key, read once per request
+    versions = g.setdefault('data_versions', {})
+    missing = [n for n in names if n not in versions]
+    if missing:
+        versions.update(DataVersion.current_many(missing))
+    return tuple(versions[n] for n in names)
+
+
+fragments = FragmentCache()
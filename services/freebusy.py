@@ -0,0 +1,219 @@
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import select, func, cast, type_coerce, Integer, String
+from models import db, User, DoctorProfile, DoctorAvailability, Appointment, AppointmentStatus
+
+MAX_DAYS = 7
+# cell states, also the characters the API uses for them
+OFF, FREE, BUSY = 0, 1, 2
+STATE_CHARS = np.frombuffer(b'-FB', dtype=np.uint8)
+STATE_NAMES = ('off', 'free', 'busy')
+STATE_LABELS = ('not available', 'free', 'booked')
+# hours shown when nothing in the grid says otherwise
+DEFAULT_HOURS = (8, 18)
+
+
+class FreeBusyError(Exception):
+    pass
+
+
+def parse_grid(day, days, at=None, minutes=None, slot_minutes=15, today=None):
+    # query-string values for a grid: start date, number of days, and an optional
+    # "who is free" window as (minute of the day, length in minutes)
+    try:
+        start = date.fromisoformat(day) if day else (today or date.today())
+    except ValueError:
+        raise FreeBusyError('date must be YYYY-MM-DD')
+    try:
+        days = int(days or 1)
+    except ValueError:
+        raise FreeBusyError('days must be a number')
+    if not 1 <= days <= MAX_DAYS:
+        raise FreeBusyError(f'days must be between 1 and {MAX_DAYS}')
+    window = None
+    if at:
+        try:
+            t = datetime.strptime(at, '%H:%M').time()
+            length = int(minutes or slot_minutes)
+        except ValueError:
+            raise FreeBusyError('at must be HH:MM and minutes a number')
+        if length <= 0 or t.hour * 60 + t.minute + length > 24 * 60:
+            raise FreeBusyError('the window must end by midnight')
+        window = (t.hour * 60 + t.minute, length)
+    return start, days, window
+
+
+def _cover(rows, lo, hi, shape):
+    # boolean (rows, slots) with [lo, hi) set in each row, from a running sum over +1/-1 marks
+    keep = lo < hi
+    rows, lo, hi = rows[keep], lo[keep], hi[keep]
+    marks = np.zeros((shape[0], shape[1] + 1), dtype=np.int32)
+    np.add.at(marks, (rows, lo), 1)
+    np.add.at(marks, (rows, hi), -1)
+    return np.cumsum(marks[:, :-1], axis=1) > 0
+
+
+class Grid:
+    # Free/busy bits for a department's doctors over 1-7 days, one bit per slot of
+    # slot_minutes. available and busy are packed (doctor, day, byte) uint8 arrays,
+    # so a 15 minute day is 12 bytes per doctor and a question about every doctor
+    # is a handful of array-wide AND/NOT operations.
+
+    def __init__(self, doctors, start, days, slot_minutes, available, busy):
+        self.doctors = doctors
+        self.start = start
+        self.days = days
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = 24 * 60 // slot_minutes
+        self.available = available
+        self.busy = busy
+
+    @property
+    def dates(self):
+        return [self.start + timedelta(days=i) for i in range(self.days)]
+
+    def free(self):
+        return self.available & ~self.busy
+
+    def window_mask(self, minute, length):
+        # packed bits of the slots a window touches
+        bits = np.zeros(self.slots_per_day, dtype=bool)
+        bits[minute // self.slot_minutes:-(-(minute + length) // self.slot_minutes)] = True
+        return np.packbits(bits)
+
+    def free_for(self, minute, length=None):
+        # (doctor, day) booleans: free for every slot of the window
+        mask = self.window_mask(minute, length or self.slot_minutes)
+        return ((self.free() & mask) == mask).all(axis=-1)
+
+    def states(self):
+        # (doctor, day, slot) OFF / FREE / BUSY; a booking outside the hours still shows busy
+        count = self.slots_per_day
+        available = np.unpackbits(self.available, axis=-1, count=count)
+        busy = np.unpackbits(self.busy, axis=-1, count=count)
+        return np.maximum(available, busy * BUSY)
+
+    def hours(self, states=None):
+        # smallest whole-hour range holding every available or booked slot
+        states = self.states() if states is None else states
+        used = np.flatnonzero(states.any(axis=(0, 1)))
+        if not used.size:
+            return DEFAULT_HOURS
+        return int(used[0]) * self.slot_minutes // 60, -(-(int(used[-1]) + 1) * self.slot_minutes // 60)
+
+    def runs(self, first_hour, last_hour, states=None):
+        # per doctor and day, [(state name, percent of the width, 'HH:MM-HH:MM state')] for the
+        # given hours: consecutive slots in the same state merged into one run
+        states = self.states() if states is None else states
+        lo = first_hour * 60 // self.slot_minutes
+        hi = last_hour * 60 // self.slot_minutes
+        cells = states[:, :, lo:hi].reshape(-1, hi - lo)
+        width = hi - lo
+        starts = np.ones(cells.shape, dtype=bool)
+        starts[:, 1:] = cells[:, 1:] != cells[:, :-1]
+        flat = np.flatnonzero(starts)
+        lengths = np.diff(np.append(flat, cells.size))
+        row, col = np.divmod(flat, width)
+        kinds = cells.reshape(-1)[flat]
+        bounds = np.searchsorted(row, np.arange(len(cells) + 1))
+
+        out = []
+        for r in range(len(cells)):
+            cell = []
+            for c, n, k in zip(col[bounds[r]:bounds[r + 1]].tolist(), lengths[bounds[r]:bounds[r + 1]].tolist(),
+                               kinds[bounds[r]:bounds[r + 1]].tolist()):
+                a, b = (lo + c) * self.slot_minutes, (lo + c + n) * self.slot_minutes
+                cell.append((STATE_NAMES[k], round(100 * n / width, 3),
+                             f'{a // 60:02d}:{a % 60:02d}-{b // 60:02d}:{b % 60:02d} {STATE_LABELS[k]}'))
+            out.append(cell)
+        return [out[i * self.days:(i + 1) * self.days] for i in range(len(self.doctors))]
+
+    def to_dict(self, window=None):
+        chars = STATE_CHARS[self.states()]
+        dates = [d.isoformat() for d in self.dates]
+        data = {
+            'start': dates[0],
+            'days': self.days,
+            'slot_minutes': self.slot_minutes,
+            'doctors': [{
+                'id': d.user_id, 'name': d.name, 'is_blacklisted': bool(d.is_blacklisted),
+                'days': [{'date': dates[j], 'slots': chars[i, j].tobytes().decode()} for j in range(self.days)],
+            } for i, d in enumerate(self.doctors)],
+        }
+        if window is not None:
+            minute, length = window
+            free = self.free_for(minute, length)
+            data['free_at'] = {
+                'time': f'{minute // 60:02d}:{minute % 60:02d}', 'minutes': length,
+                'doctors': {dates[j]: [self.doctors[i].user_id for i in np.flatnonzero(free[:, j]).tolist()]
+                            for j in range(self.days)},
+            }
+        return data
+
+
+def _offset(column, origin):
+    return cast(func.round((func.julianday(column) - func.julianday(origin)) * 1440), Integer)
+
+
+def _spans(start, end, origin):
+    # one doctor's intervals as 'from to from to ...' minutes after origin: SQLite does the
+    # date arithmetic and a department comes back as one short row per doctor
+    return func.group_concat(_offset(start, origin).concat(' ').concat(_offset(end, origin)), ' ')
+
+
+def _columns(rows, index):
+    # (doctor_id, spans) rows as (grid row, from, to) int arrays
+    rows = [(index[doctor_id], np.array(spans.split(), dtype=np.int64).reshape(-1, 2)) for doctor_id, spans in rows]
+    if not rows:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    spans = np.concatenate([s for _, s in rows])
+    return np.repeat([r for r, _ in rows], [len(s) for _, s in rows]), spans[:, 0], spans[:, 1]
+
+
+def department_doctors(department_id):
+    return db.session.execute(
+        select(DoctorProfile.id, DoctorProfile.is_blacklisted, User.id.label('user_id'), User.name)
+        .join(User, User.id == DoctorProfile.user_id)
+        .filter(DoctorProfile.department_id == department_id)
+        .order_by(User.name)).all()
+
+
+def build_grid(doctors, start, days, slot_minutes=15):
+    # Bits for `doctors` (rows of department_doctors) from two queries: their
+    # availability windows and their live appointments over the days. A slot is
+    # available when a window covers all of it and busy when a booking touches it.
+    if slot_minutes <= 0 or 60 % slot_minutes:
+        raise FreeBusyError('slot minutes must divide an hour')
+    per_day = 24 * 60 // slot_minutes
+    shape = (len(doctors), days * per_day)
+    origin = datetime.combine(start, datetime.min.time())
+    end = origin + timedelta(days=days)
+    index = {d.id: i for i, d in enumerate(doctors)}
+    ids = list(index)
+
+    windows = db.session.execute(
+        select(DoctorAvailability.doctor_id,
+               _spans(type_coerce(DoctorAvailability.date, String) + ' ' +
+                      type_coerce(DoctorAvailability.start_time, String),
+                      type_coerce(DoctorAvailability.date, String) + ' ' +
+                      type_coerce(DoctorAvailability.end_time, String), origin))
+        .filter(DoctorAvailability.doctor_id.in_(ids),
+                DoctorAvailability.date.between(start, start + timedelta(days=days - 1)))
+        .group_by(DoctorAvailability.doctor_id)).all() if ids else []
+    bookings = db.session.execute(
+        select(Appointment.doctor_id, _spans(Appointment.appointment_start, Appointment.appointment_end, origin))
+        .filter(Appointment.doctor_id.in_(ids), Appointment.status != AppointmentStatus.CANCELLED,
+                Appointment.appointment_start < end, Appointment.appointment_end > origin,
+                # no appointment runs past a day; keeps the scan of the (doctor, start) index to the days
+                Appointment.appointment_start >= origin - timedelta(days=1))
+        .group_by(Appointment.doctor_id)).all() if ids else []
+
+    rows, lo, hi = _columns(windows, index)
+    available = _cover(rows, np.clip(-(-lo // slot_minutes), 0, shape[1]),
+                       np.clip(hi // slot_minutes, 0, shape[1]), shape)
+    rows, lo, hi = _columns(bookings, index)
+    busy = _cover(rows, np.clip(lo // slot_minutes, 0, shape[1]),
+                  np.clip(-(-hi // slot_minutes), 0, shape[1]), shape)
+
+    packed = [np.packbits(bits.reshape(len(doctors), days, per_day), axis=-1) for bits in (available, busy)]
+    return Grid(doctors, start, days, slot_minutes, *packed)
@@ -0,0 +1,30 @@
+from sqlalchemy.orm import contains_eager, joinedload
+from models import db, Appointment, AppointmentStatus, DoctorProfile, Treatment
+
+# characters of the diagnosis shown on the summary card; the rest loads on demand
+EXCERPT_LENGTH = 160
+PER_PAGE = 10
+
+
+def history_stmt(patient_id, completed_only=False):
+    # summary rows only: the treatment's text columns stay unloaded apart from a
+    # diagnosis excerpt cut in SQL; doctor, user and department come in the same query
+    stmt = db.select(Appointment)\
+        .join(Appointment.treatment)\
+        .filter(Appointment.patient_id == patient_id)\
+        .options(
+            contains_eager(Appointment.treatment)
+                .load_only(Treatment.id, Treatment.appointment_id)
+                .with_expression(Treatment.diagnosis_excerpt,
+                                 db.func.substr(Treatment.diagnosis, 1, EXCERPT_LENGTH + 1)),
+            joinedload(Appointment.doctor).joinedload(DoctorProfile.user),
+            joinedload(Appointment.doctor).joinedload(DoctorProfile.department),
+        )\
+        .order_by(Appointment.appointment_start.desc(), Appointment.id.desc())
+    if completed_only:
+        stmt = stmt.filter(Appointment.status == AppointmentStatus.COMPLETED)
+    return stmt
+
+
+def history_page(patient_id, page, completed_only=False, per_page=PER_PAGE):
+    return db.paginate(history_stmt(patient_id, completed_only), page=page, per_page=per_page, error_out=False)
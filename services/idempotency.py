@@ -0,0 +1,79 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_login import current_user
+from models import db, utc_now, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# a first request that hasn't stored its response by then is taken to have died
+ABANDONED_AFTER = timedelta(seconds=60)
+
+
+def fingerprint():
+    # the same key sent with a different request is a client bug, not a retry
+    h = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.get_data()):
+        h.update(part)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def idempotent(view):
+    # Retries carrying the same Idempotency-Key header get the first response back
+    # without running the view again. Keys are per user and kept for
+    # IDEMPOTENCY_KEY_TTL hours. Server errors aren't kept, so those can be retried.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not current_user.is_authenticated:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} is longer than {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = current_user.id
+        digest = fingerprint()
+        now = utc_now()
+        ttl = timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL', 24))
+        engine = db.engines[None]
+        with engine.begin() as conn:
+            owner = IdempotencyKey.claim(conn, user_id, key, digest, now, now + ttl, now - ABANDONED_AFTER)
+            previous = None if owner else IdempotencyKey.lookup(conn, user_id, key)
+
+        if previous is not None:
+            if previous.fingerprint != digest:
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if previous.status_code is None:
+                response = jsonify({'error': 'A request with this key is still in progress'})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = current_app.response_class(previous.response, status=previous.status_code,
+                                                  mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            with engine.begin() as conn:
+                IdempotencyKey.release(conn, user_id, key)
+            raise
+        with engine.begin() as conn:
+            if response.status_code >= 500:
+                IdempotencyKey.release(conn, user_id, key)
+            else:
+                IdempotencyKey.store(conn, user_id, key, response.status_code, response.get_data(as_text=True))
+        return response
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    # deletes expired keys one short transaction per batch, so bookings never wait long
+    removed = 0
+    while True:
+        with db.engines[None].begin() as conn:
+            n = IdempotencyKey.purge(conn, utc_now(), batch_size)
+        removed += n
+        if n < batch_size:
+            return removed
@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from models import db, Job, JobStatus, Appointment, AppointmentStatus, AppointmentEvent
+
+logger = logging.getLogger(__name__)
+
+handlers = {}
+
+
+def job_handler(kind):
+    def register(fn):
+        handlers[kind] = fn
+        return fn
+    return register
+
+
+def reminder_lead():
+    return timedelta(hours=float(current_app.config.get('REMINDER_LEAD_HOURS', 24)))
+
+
+def reminder_key(appointment_id):
+    return f'reminder:{appointment_id}'
+
+
+def reminder_due(appointment):
+    # appointment times are naive local time, job times are UTC
+    due = (appointment.appointment_start - reminder_lead()).astimezone(timezone.utc)
+    return max(due, datetime.now(timezone.utc))
+
+
+def schedule_reminder(appointment):
+    return Job.enqueue_unique(
+        reminder_key(appointment.id),
+        'appointment.reminder',
+        {'appointment_id': appointment.id},
+        run_after=reminder_due(appointment)
+    )
+
+
+def scan_reminders(start, end):
+    # walks ix on appointment_start for the (start, end] window only
+    appointments = Appointment.query\
+        .filter(Appointment.appointment_start > start, Appointment.appointment_start <= end)\
+        .filter(Appointment.status == AppointmentStatus.BOOKED)\
+        .all()
+    scheduled = sum(1 for appt in appointments if schedule_reminder(appt))
+    db.session.commit()
+    return scheduled
+
+
+@job_handler('appointment.changed')
+def on_appointment_changed(job):
+    appointment = db.session.get(Appointment, job.data['appointment_id'])
+    if not appointment:
+        return
+
+    if appointment.status == AppointmentStatus.BOOKED:
+        if job.data.get('kind') == AppointmentEvent.MOVED:
+            # a pending reminder follows the appointment to its new time
+            Job.query.filter_by(dedupe_key=reminder_key(appointment.id), status=JobStatus.PENDING)\
+                .update({'run_after': reminder_due(appointment)})
+        # covers short-notice bookings inside a window the scanner has already passed
+        schedule_reminder(appointment)
+    else:
+        Job.query.filter_by(dedupe_key=reminder_key(appointment.id), status=JobStatus.PENDING)\
+            .update({'status': JobStatus.DONE, 'last_error': f'appointment {appointment.status.lower()}'})
+    db.session.commit()
+
+
+@job_handler('appointment.reminder')
+def send_reminder(job):
+    appointment = db.session.get(Appointment, job.data['appointment_id'])
+    if not appointment or appointment.status != AppointmentStatus.BOOKED:
+        return
+    if appointment.appointment_start < datetime.now():
+        return
+
+    logger.info(
+        'Reminder: %s has an appointment with %s on %s',
+        appointment.patient.user.email,
+        appointment.doctor.user.name,
+        appointment.appointment_start.strftime('%Y-%m-%d %H:%M')
+    )
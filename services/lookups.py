@@ -0,0 +1,146 @@
+import re
+from datetime import datetime
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, selectinload
+from models import db, User, Role, DoctorProfile, PatientProfile, DoctorAvailability, Appointment
+from services import booking
+
+# Many-at-once versions of the single-record GET endpoints: each kind loads any
+# number of ids with one IN (...) query and serializes exactly like its endpoint.
+MAX_BATCH = 100
+
+
+def doctors(ids):
+    users = db.session.scalars(
+        select(User).options(joinedload(User.doctor_profile).joinedload(DoctorProfile.department))
+        .filter(User.id.in_(ids), User.role == Role.DOCTOR)).unique().all()
+    return {u.id: u.to_dict() for u in users}
+
+
+def patients(ids):
+    users = db.session.scalars(
+        select(User).options(joinedload(User.patient_profile))
+        .filter(User.id.in_(ids), User.role == Role.PATIENT)).unique().all()
+    return {u.id: u.to_dict() for u in users}
+
+
+def slots(ids):
+    found = db.session.scalars(select(DoctorAvailability).filter(DoctorAvailability.id.in_(ids))).all()
+    booked = booking.slot_status(found)
+    return {s.id: s.to_dict(is_booked=booked[s.id]) for s in found}
+
+
+def doctor_slots(ids):
+    # upcoming slots per doctor user id, like /api/doctors/<id>/slots
+    profiles = dict(db.session.execute(
+        select(DoctorProfile.id, DoctorProfile.user_id).join(DoctorProfile.user)
+        .filter(DoctorProfile.user_id.in_(ids), User.role == Role.DOCTOR)).all())
+    today = datetime.now().date()
+    found = db.session.scalars(
+        select(DoctorAvailability)
+        .filter(DoctorAvailability.doctor_id.in_(profiles), DoctorAvailability.date >= today)
+        .order_by(DoctorAvailability.doctor_id, DoctorAvailability.date, DoctorAvailability.start_time)).all()
+    booked = booking.slot_status(found, today)
+    result = {user_id: [] for user_id in profiles.values()}
+    for s in found:
+        result[profiles[s.doctor_id]].append(s.to_dict(is_booked=booked[s.id]))
+    return result
+
+
+def appointments(ids):
+    found = db.session.scalars(
+        select(Appointment).options(
+            selectinload(Appointment.patient).joinedload(PatientProfile.user),
+            selectinload(Appointment.doctor).joinedload(DoctorProfile.user),
+            selectinload(Appointment.doctor).joinedload(DoctorProfile.department))
+        .filter(Appointment.id.in_(ids))).all()
+    return {a.id: a for a in found}
+
+
+def can_view_patient(user_id):
+    return current_user.role != Role.PATIENT or current_user.id == user_id
+
+
+def can_view_appointment(appointment):
+    if current_user.role == Role.PATIENT:
+        return appointment.patient_id == current_user.patient_profile.id
+    if current_user.role == Role.DOCTOR:
+        return appointment.doctor_id == current_user.doctor_profile.id
+    return current_user.role == Role.ADMIN
+
+
+def parse_ids(value):
+    # "1,2,3" -> [1, 2, 3]; None if anything isn't an id
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        return None
+    return list(dict.fromkeys(ids)) if 0 < len(ids) <= MAX_BATCH else None
+
+
+# --- /api/batch ---
+
+# (path, kind, needs login); kinds map to the loaders above
+ROUTES = [
+    (re.compile(r'^/api/doctors/(\d+)$'), 'doctor', False),
+    (re.compile(r'^/api/doctors/(\d+)/slots$'), 'doctor_slots', False),
+    (re.compile(r'^/api/patients/(\d+)$'), 'patient', True),
+    (re.compile(r'^/api/slots/(\d+)$'), 'slot', False),
+    (re.compile(r'^/api/appointments/(\d+)$'), 'appointment', True),
+]
+LOADERS = {'doctor': doctors, 'doctor_slots': doctor_slots, 'patient': patients, 'slot': slots,
+           'appointment': appointments}
+NOT_FOUND = {'doctor': 'Doctor not found', 'doctor_slots': 'Doctor not found', 'patient': 'Patient not found',
+             'slot': 'Slot not found', 'appointment': 'Appointment not found'}
+
+
+class BatchError(ValueError):
+    pass
+
+
+def _match(sub):
+    if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+        raise BatchError('each request needs a path')
+    if (sub.get('method') or 'GET').upper() != 'GET':
+        return None, None, (405, {'error': 'Only GET requests can be batched'})
+    for pattern, kind, needs_login in ROUTES:
+        m = pattern.match(sub['path'])
+        if m:
+            if needs_login and not current_user.is_authenticated:
+                return None, None, (401, {'error': 'Unauthorized'})
+            return kind, int(m.group(1)), None
+    return None, None, (404, {'error': 'Not found'})
+
+
+def run_batch(subs):
+    # [{"id": tag, "method": "GET", "path": "/api/doctors/3"}, ...] -> a response per
+    # request, in order. Requests of the same kind are loaded together.
+    if not isinstance(subs, list) or not subs:
+        raise BatchError('requests must be a non-empty list')
+    if len(subs) > MAX_BATCH:
+        raise BatchError(f'at most {MAX_BATCH} requests per batch')
+    matched = [_match(sub) for sub in subs]
+    wanted = {}
+    for kind, id, _ in matched:
+        if kind:
+            wanted.setdefault(kind, set()).add(id)
+    loaded = {kind: LOADERS[kind](ids) for kind, ids in wanted.items()}
+
+    responses = []
+    for sub, (kind, id, early) in zip(subs, matched):
+        status, body = early or _respond(kind, id, loaded[kind].get(id))
+        responses.append({'id': sub.get('id'), 'status': status, 'body': body})
+    return responses
+
+
+def _respond(kind, id, found):
+    if kind == 'patient' and not can_view_patient(id):
+        return 403, {'error': 'Access denied'}
+    if found is None:
+        return 404, {'error': NOT_FOUND[kind]}
+    if kind == 'appointment':
+        if not can_view_appointment(found):
+            return 403, {'error': 'Access denied'}
+        return 200, found.to_dict()
+    return 200, found
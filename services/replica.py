@@ -0,0 +1,123 @@
+import os
+import time
+import sqlite3
+import logging
+from functools import wraps
+from flask import g, session, has_request_context
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from models import db
+from models.base import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session_, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+# Optional read replica: a second SQLite file refreshed from the primary with the
+# backup API (`flask replica-sync`). Views marked @read_replica read from it while
+# it is fresh enough; everything else, and any user who just wrote, uses the primary.
+class Replica:
+    BIND = 'replica'
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = bool((app.config.get('SQLALCHEMY_BINDS') or {}).get(self.BIND))
+        self.max_lag = float(app.config.get('REPLICA_MAX_LAG', 5))
+        # read-your-writes: after a write the user stays on the primary this long
+        self.pin_seconds = float(app.config.get('REPLICA_PIN_SECONDS', self.max_lag))
+        self.check_interval = float(app.config.get('REPLICA_CHECK_INTERVAL', 1))
+        self._checked_at = 0.0
+        self._healthy = None
+        self.last_lag = None
+        if self.enabled:
+            app.after_request(self._pin_after_write)
+
+    def _pin_after_write(self, response):
+        if g.get('db_wrote'):
+            session['_primary_until'] = time.time() + self.pin_seconds
+        return response
+
+    def paths(self):
+        return db.engines[None].url.database, db.engines[self.BIND].url.database
+
+    def sync(self):
+        # one backup step copies a consistent snapshot; the replica is in WAL mode so
+        # requests reading it carry on while the new copy lands
+        primary, target = self.paths()
+        started = time.time()
+        src = sqlite3.connect(primary)
+        dst = sqlite3.connect(target, timeout=30)
+        try:
+            dst.execute('PRAGMA journal_mode=WAL')
+            src.backup(dst)
+            dst.execute('CREATE TABLE IF NOT EXISTS replica_meta '
+                        '(id INTEGER PRIMARY KEY CHECK (id = 1), synced_at REAL NOT NULL)')
+            dst.execute('INSERT OR REPLACE INTO replica_meta (id, synced_at) VALUES (1, ?)', (started,))
+            dst.commit()
+        finally:
+            src.close()
+            dst.close()
+        return time.time() - started
+
+    def synced_at(self):
+        try:
+            with db.engines[self.BIND].connect() as conn:
+                return conn.execute(text('SELECT synced_at FROM replica_meta WHERE id = 1')).scalar()
+        except DBAPIError:
+            return None
+
+    def primary_written_at(self):
+        primary, _ = self.paths()
+        return max(os.path.getmtime(p) for p in (primary, primary + '-wal') if os.path.exists(p))
+
+    def lag(self):
+        # seconds of primary writes the replica hasn't seen; None if it was never synced
+        synced = self.synced_at()
+        if synced is None:
+            return None
+        return 0.0 if self.primary_written_at() <= synced else time.time() - synced
+
+    def healthy(self):
+        # checked at most once per interval per worker
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            lag = self.lag()
+            healthy = lag is not None and lag <= self.max_lag
+            if healthy != self._healthy:
+                if healthy:
+                    logger.info('read replica in use (lag %.1fs)', lag)
+                else:
+                    logger.warning('read replica lag %s exceeds %.1fs; reading from primary',
+                                   'unknown' if lag is None else f'{lag:.1f}s', self.max_lag)
+            self._healthy, self.last_lag, self._checked_at = healthy, lag, now
+        return self._healthy
+
+    def use_for_request(self):
+        if not self.enabled:
+            return False
+        if session.get('_primary_until', 0) > time.time():
+            return False
+        return self.healthy()
+
+
+replica = Replica()
+
+
+def read_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if replica.use_for_request():
+            g.db_read_bind = Replica.BIND
+        return view(*args, **kwargs)
+    return wrapper
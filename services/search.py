@@ -0,0 +1,181 @@
+import re
+from datetime import timedelta
+from markupsafe import Markup, escape
+from sqlalchemy import text, select, func, bindparam, DateTime
+from models import db, DoctorProfile, PatientProfile, Treatment, Appointment, User
+from services.shards import shard_router
+
+# Full-text index over treatment records: an FTS5 table next to `treatments` in every
+# database that holds them, kept in step by triggers so any write path updates it.
+INDEX = 'treatment_search'
+SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS main.{INDEX} USING fts5("
+    "diagnosis, prescription, notes, tokenize = 'porter unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS main.treatments_search_insert AFTER INSERT ON treatments BEGIN "
+    f"INSERT INTO {INDEX} (rowid, diagnosis, prescription, notes) "
+    "VALUES (new.id, new.diagnosis, new.prescription, new.notes); END",
+    f"CREATE TRIGGER IF NOT EXISTS main.treatments_search_update "
+    "AFTER UPDATE OF id, diagnosis, prescription, notes ON treatments BEGIN "
+    f"DELETE FROM {INDEX} WHERE rowid = old.id; "
+    f"INSERT INTO {INDEX} (rowid, diagnosis, prescription, notes) "
+    "VALUES (new.id, new.diagnosis, new.prescription, new.notes); END",
+    f"CREATE TRIGGER IF NOT EXISTS main.treatments_search_delete AFTER DELETE ON treatments BEGIN "
+    f"DELETE FROM {INDEX} WHERE rowid = old.id; END",
+)
+
+# snippet() markers; the text around them is escaped before they become <mark> tags
+HIGHLIGHT_START, HIGHLIGHT_END = '\x02', '\x03'
+SNIPPET_TOKENS = 16
+TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+WORD = re.compile(r'\w+')
+
+
+class SearchError(ValueError):
+    pass
+
+
+def create_index(conn):
+    for statement in SCHEMA:
+        conn.execute(text(statement))
+
+
+def reindex(conn, first_id, last_id):
+    # re-copies a range of treatments; safe to repeat, the triggers keep it current after
+    conn.execute(text(f'DELETE FROM {INDEX} WHERE rowid BETWEEN :lo AND :hi'), {'lo': first_id, 'hi': last_id})
+    conn.execute(text(f'INSERT INTO {INDEX} (rowid, diagnosis, prescription, notes) '
+                      'SELECT id, diagnosis, prescription, notes FROM main.treatments WHERE id BETWEEN :lo AND :hi'),
+                 {'lo': first_id, 'hi': last_id})
+
+
+def match_expression(query):
+    # User input to an FTS5 MATCH string: "quoted text" is a phrase, a trailing * makes
+    # a prefix search, everything else must all match. Operators and column filters
+    # are not passed through, so no input can produce an FTS5 syntax error.
+    terms = []
+    for phrase, word in TOKEN.findall(query):
+        raw = phrase if phrase else word
+        prefix = not phrase and raw.endswith('*')
+        words = WORD.findall(raw)
+        if not words:
+            continue
+        term = '"' + ' '.join(words) + '"'
+        terms.append(term + '*' if prefix else term)
+    if not terms:
+        raise SearchError('Enter a word or "a phrase" to search for.')
+    return ' '.join(terms)
+
+
+def highlight(snippet):
+    parts = str(escape(snippet))
+    return Markup(parts.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+COLUMNS = ("SELECT t.id AS treatment_id, a.id AS appointment_id, a.patient_id, a.doctor_id, a.appointment_start, "
+           f"snippet({INDEX}, -1, :hl_start, :hl_end, '…', :tokens) AS snippet, ")
+# newest visit first; the id only breaks ties between visits that start together
+RECENT = 'a.appointment_start DESC, t.id DESC'
+# a term with at least this many matches is found on recent visits quickly, so newest-first
+# walks back from the latest appointment instead of joining and sorting every match
+COMMON_MATCHES = 20000
+RECENT_WINDOW = timedelta(days=30)
+
+
+def _search_stmt(doctor_id, order):
+    # every match joined to its appointment, then sorted: relevance, and newest-first for rare terms
+    scope = ''
+    if doctor_id is not None:
+        # the doctor's patients, including visits to other doctors
+        scope = 'AND a.patient_id IN (SELECT patient_id FROM doctor_patients WHERE doctor_id = :doctor_id) '
+    return text(
+        COLUMNS + f"{'bm25(' + INDEX + ')' if order == 'relevance' else '0'} AS rank "
+        f"FROM {INDEX} JOIN main.treatments t ON t.id = {INDEX}.rowid "
+        f"JOIN main.appointments a ON a.id = t.appointment_id "
+        f"WHERE {INDEX} MATCH :match {scope}"
+        f"ORDER BY {'rank' if order == 'relevance' else RECENT} LIMIT :limit"
+    ).columns(appointment_start=DateTime)
+
+
+def _recent_stmt(doctor_id):
+    # appointments since :since, newest first, each checked against the index (CROSS JOIN
+    # keeps that order); a doctor's scope starts from their patients' appointments
+    if doctor_id is not None:
+        source = ('FROM doctor_patients dp CROSS JOIN main.appointments a ON a.patient_id = dp.patient_id '
+                  'AND dp.doctor_id = :doctor_id ')
+    else:
+        source = 'FROM main.appointments a '
+    return text(
+        COLUMNS + "0 AS rank " + source +
+        f"CROSS JOIN main.treatments t ON t.appointment_id = a.id CROSS JOIN {INDEX} ON {INDEX}.rowid = t.id "
+        f"WHERE a.appointment_start >= :since AND a.appointment_start < :until AND {INDEX} MATCH :match "
+        f"ORDER BY {RECENT} LIMIT :limit"
+    ).bindparams(bindparam('since', type_=DateTime), bindparam('until', type_=DateTime))\
+        .columns(appointment_start=DateTime)
+
+
+def _is_common(match, bind):
+    # prefix terms expand to many words, too costly to check one row at a time
+    if '*' in match:
+        return False
+    found = db.session.execute(text(f'SELECT count(*) FROM (SELECT 1 FROM {INDEX} WHERE {INDEX} MATCH :match '
+                                    'LIMIT :n)'), {'match': match, 'n': COMMON_MATCHES}, bind_arguments=bind)
+    return found.scalar() >= COMMON_MATCHES
+
+
+def _search_recent(doctor_id, params, bind):
+    # back from the latest appointment one window at a time, each twice as long as
+    # the last, until the page is full or the first appointment is reached
+    newest, oldest = (db.session.execute(select(fn(Appointment.appointment_start)), bind_arguments=bind).scalar()
+                      for fn in (func.max, func.min))
+    if newest is None:
+        return []
+    rows, until, window = [], newest + timedelta(seconds=1), RECENT_WINDOW
+    while len(rows) < params['limit'] and until > oldest:
+        since = until - window
+        rows += db.session.execute(_recent_stmt(doctor_id),
+                                   {**params, 'since': since, 'until': until, 'limit': params['limit'] - len(rows)},
+                                   bind_arguments=bind).all()
+        until, window = since, window * 2
+    return rows
+
+
+def _search_database(match, doctor_id, order, limit):
+    # binding on Treatment picks the shard fan_out selected, or the read replica
+    bind = {'mapper': Treatment.__mapper__}
+    params = {'match': match, 'doctor_id': doctor_id, 'limit': limit, 'tokens': SNIPPET_TOKENS,
+              'hl_start': HIGHLIGHT_START, 'hl_end': HIGHLIGHT_END}
+    if order != 'relevance' and _is_common(match, bind):
+        rows = _search_recent(doctor_id, params, bind)
+    else:
+        rows = db.session.execute(_search_stmt(doctor_id, order), params, bind_arguments=bind).all()
+    return [dict(r._mapping) for r in rows]
+
+
+def search_treatments(query, doctor_id=None, order='recent', limit=50):
+    # Matching treatments as dicts, latest appointment first or by bm25 relevance. doctor_id limits
+    # results to that doctor's patients; None searches everything (admins).
+    match = match_expression(query)
+    parts = shard_router.fan_out(_search_database, match, doctor_id, order, limit)
+    rows = [row for part in parts for row in part]
+    if len(parts) > 1:
+        if order == 'relevance':
+            rows.sort(key=lambda r: r['rank'])
+        else:
+            rows.sort(key=lambda r: (r['appointment_start'], r['treatment_id']), reverse=True)
+        rows = rows[:limit]
+    _attach_names(rows)
+    for row in rows:
+        row['snippet'] = highlight(row['snippet'] or '')
+    return rows
+
+
+def _attach_names(rows):
+    # patient and doctor names for the page in two queries
+    patient_ids = {r['patient_id'] for r in rows}
+    doctor_ids = {r['doctor_id'] for r in rows}
+    patients = dict(db.session.execute(
+        select(PatientProfile.id, User.name).join(PatientProfile.user).filter(PatientProfile.id.in_(patient_ids))).all())
+    doctors = dict(db.session.execute(
+        select(DoctorProfile.id, User.name).join(DoctorProfile.user).filter(DoctorProfile.id.in_(doctor_ids))).all())
+    for row in rows:
+        row['patient_name'] = patients.get(row['patient_id'])
+        row['doctor_name'] = doctors.get(row['doctor_id'])
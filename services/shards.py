@@ -0,0 +1,399 @@
+import json
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, current_app
+from sqlalchemy import event, text, select, insert, update
+from sqlalchemy.sql import operators, functions
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList, ClauseList, UnaryExpression, Label
+from sqlalchemy.sql.util import find_tables
+from models import db, DoctorProfile, Appointment, DoctorAvailability, Treatment, AppointmentEvent, Job, JobStatus
+from models.base import RoutingSession
+from services.jobs import reminder_key
+
+# Department data (availabilities, appointments, treatments) lives in one SQLite file
+# per shard; users, profiles, departments, the change log and the job outbox stay in
+# the global database, which every shard connection ATTACHes so joins keep working.
+SHARDED_TABLES = frozenset(('doctor_availabilities', 'appointments', 'treatments'))
+SHARDED_MODELS = (DoctorAvailability, Appointment, Treatment)
+
+# row ids are seq * ID_STRIDE + shard, so any id says which file holds the row
+ID_STRIDE = 64
+
+
+class ShardRoutingError(RuntimeError):
+    pass
+
+
+def encode_id(seq, shard):
+    return seq * ID_STRIDE + shard
+
+
+def shard_of_id(row_id):
+    return row_id % ID_STRIDE
+
+
+def _conjuncts(clause):
+    if clause is None:
+        return []
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        return [c for sub in clause.clauses for c in _conjuncts(sub)]
+    return [clause]
+
+
+def _bind_values(bp, params):
+    value = params.get(bp.key, bp.effective_value) if params else bp.effective_value
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def _flatten(clauses):
+    out = []
+    for c in clauses:
+        out.extend(_flatten(c.clauses) if isinstance(c, ClauseList) and not isinstance(c, BooleanClauseList) else [c])
+    return out
+
+
+def _unlabel(col):
+    return col.element if isinstance(col, Label) else col
+
+
+def _same(a, b):
+    return _unlabel(a).compare(_unlabel(b))
+
+
+def _is_count(col):
+    return isinstance(_unlabel(col), functions.count)
+
+
+class ShardRouter:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.count = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        binds = app.config.get('SQLALCHEMY_BINDS') or {}
+        self.keys = sorted((k for k in binds if k.startswith('shard')), key=lambda k: int(k[5:]))
+        self.count = len(self.keys)
+        self.enabled = self.count > 0
+        if not self.enabled:
+            return
+        if self.count > ID_STRIDE:
+            raise ValueError(f'at most {ID_STRIDE} shards are supported')
+        self._doctor_shards = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.count, thread_name_prefix='shard')
+
+        with app.app_context():
+            global_path = db.engines[None].url.database
+            for key in self.keys:
+                event.listen(db.engines[key], 'connect', self._attach(global_path))
+
+        RoutingSession.shard_router = self
+        RoutingSession.connection_callable = _connection_for_instance
+        event.listen(RoutingSession, 'do_orm_execute', self._execute)
+        for model in SHARDED_MODELS:
+            event.listen(model, 'before_insert', self._assign_id)
+
+    @staticmethod
+    def _attach(path):
+        def attach(dbapi_conn, record):
+            dbapi_conn.execute('ATTACH DATABASE ? AS global', (path,))
+        return attach
+
+    def engine(self, shard):
+        return db.engines[self.keys[shard]]
+
+    # --- placement ---
+
+    def shard_of_department(self, department_id):
+        return (department_id or 0) % self.count
+
+    def shard_of_doctor(self, doctor_id):
+        shard = self._doctor_shards.get(doctor_id)
+        if shard is None:
+            # own connection: this can run in the middle of a flush or another query
+            with db.engines[None].connect() as conn:
+                dept = conn.execute(select(DoctorProfile.department_id).where(DoctorProfile.id == doctor_id)).scalar()
+            shard = self.shard_of_department(dept)
+            with self._lock:
+                self._doctor_shards[doctor_id] = shard
+        return shard
+
+    def shard_for_instance(self, instance):
+        if getattr(instance, 'id', None) is not None:
+            return shard_of_id(instance.id)
+        if isinstance(instance, Treatment):
+            appointment_id = instance.appointment.id if instance.appointment is not None else instance.appointment_id
+            return shard_of_id(appointment_id)
+        if instance.doctor_id is None and instance.doctor is not None:
+            return self.shard_of_department(instance.doctor.department_id)
+        return self.shard_of_doctor(instance.doctor_id)
+
+    def _assign_id(self, mapper, connection, target):
+        if target.id is None:
+            seq = connection.execute(
+                text('UPDATE shard_sequences SET next_id = next_id + 1 WHERE name = :name RETURNING next_id - 1'),
+                {'name': mapper.local_table.name}).scalar()
+            target.id = encode_id(seq, self.shard_for_instance(target))
+
+    # --- reads ---
+
+    def bind_for(self, mapper, clause):
+        table = mapper.local_table if mapper is not None else None
+        names = {table.name} if table is not None else {t.name for t in find_tables(clause)} if clause is not None else set()
+        if not names & SHARDED_TABLES:
+            return None
+        shard = g.get('db_shard')
+        if shard is None:
+            raise ShardRoutingError(f'no shard selected for {", ".join(sorted(names & SHARDED_TABLES))}')
+        return self.engine(shard)
+
+    def shards_for(self, statement, params):
+        # an explicit scope wins; otherwise narrow on id / doctor_id equality in the WHERE
+        if g.get('db_shard') is not None:
+            return [g.db_shard]
+        found = None
+        for crit in _conjuncts(getattr(statement, 'whereclause', None)):
+            if not isinstance(crit, BinaryExpression) or not isinstance(crit.right, BindParameter):
+                continue
+            if crit.operator not in (operators.eq, operators.in_op):
+                continue
+            col = crit.left
+            table = getattr(getattr(col, 'table', None), 'name', None)
+            if table not in SHARDED_TABLES:
+                continue
+            values = _bind_values(crit.right, params)
+            if not values:
+                continue
+            if col.name == 'id' or (table == 'treatments' and col.name == 'appointment_id'):
+                # ids naming a shard that doesn't exist can't match anything
+                shards = {shard_of_id(v) for v in values} & set(range(self.count))
+            elif col.name == 'doctor_id':
+                shards = {self.shard_of_doctor(v) for v in values}
+            else:
+                continue
+            found = shards if found is None else found & shards
+        return sorted(found) if found else list(range(self.count))
+
+    def _execute(self, orm_context):
+        if not (orm_context.is_select or orm_context.is_update or orm_context.is_delete):
+            return None
+        if orm_context.bind_arguments.get('bind') is not None:
+            return None
+        statement = orm_context.statement
+        if not {t.name for t in find_tables(statement, include_crud=True)} & SHARDED_TABLES:
+            return None
+
+        params = orm_context.parameters if isinstance(orm_context.parameters, dict) else {}
+        shards = self.shards_for(statement, params)
+        if len(shards) == 1:
+            return orm_context.invoke_statement(bind_arguments={'bind': self.engine(shards[0])})
+
+        if not orm_context.is_select:
+            results = [orm_context.invoke_statement(bind_arguments={'bind': self.engine(s)}) for s in shards]
+            return results[0].merge(*results[1:])
+        return self._gather(orm_context, statement, shards)
+
+    def _gather(self, orm_context, statement, shards):
+        limit, offset = statement._limit, statement._offset
+        per_shard = statement
+        if offset:
+            per_shard = statement.offset(None).limit(limit + offset if limit is not None else None)
+        results = [orm_context.invoke_statement(statement=per_shard, bind_arguments={'bind': self.engine(s)})
+                   for s in shards]
+        frozen = results[0].merge(*results[1:]).freeze()
+        # single-entity ORM results freeze as bare objects; work on rows throughout
+        rows = [(r,) for r in frozen.data] if frozen._source_supports_scalars else list(frozen.data)
+
+        columns = list(statement.selected_columns)
+        group_by = _flatten(statement._group_by_clauses)
+        if columns and any(_is_count(c) for c in columns) and all(_is_count(c) or any(_same(c, k) for k in group_by)
+                                                                 for c in columns):
+            rows = self._merge_counts(rows, columns)
+        rows = self._sort(rows, statement, columns)
+        if offset or limit is not None:
+            rows = rows[offset or 0:(offset or 0) + limit if limit is not None else None]
+        return frozen.with_new_rows(rows)()
+
+    @staticmethod
+    def _merge_counts(rows, columns):
+        # per-shard COUNT(*) / GROUP BY ... COUNT(*) rows are partial sums
+        counted = [i for i, c in enumerate(columns) if _is_count(c)]
+        merged = {}
+        for row in rows:
+            key = tuple(v for i, v in enumerate(row) if i not in counted)
+            if key not in merged:
+                merged[key] = list(row)
+            else:
+                for i in counted:
+                    merged[key][i] += row[i]
+        return [tuple(r) for r in merged.values()]
+
+    @staticmethod
+    def _sort(rows, statement, columns):
+        descs = statement.column_descriptions
+        single_entity = len(descs) == 1 and isinstance(descs[0]['expr'], type)
+        keys = []
+        for clause in _flatten(statement._order_by_clauses):
+            reverse = False
+            if isinstance(clause, UnaryExpression) and clause.modifier in (operators.desc_op, operators.asc_op):
+                reverse = clause.modifier is operators.desc_op
+                clause = clause.element
+            if single_entity and hasattr(descs[0]['expr'], getattr(clause, 'key', '') or ''):
+                keys.append((lambda row, name=clause.key: getattr(row[0], name), reverse))
+                continue
+            index = next((i for i, c in enumerate(columns) if _same(c, clause)), None)
+            if index is None:
+                # can't evaluate this ORDER BY outside SQL; keep shard order
+                return rows
+            keys.append((lambda row, i=index: row[i], reverse))
+        # stable sorts, least significant key first; NULLs sort first like SQLite
+        for getter, reverse in reversed(keys):
+            rows.sort(key=lambda row: (getter(row) is not None, getter(row)), reverse=reverse)
+        return rows
+
+    # --- explicit scopes ---
+
+    def stream(self, statement, key, reverse=False, yield_per=500):
+        # rows of an ORDER BY select fetched a batch at a time; with shards, one cursor per
+        # shard merged on `key` (the sort key), so no shard's result is ever held in full
+        statement = statement.execution_options(yield_per=yield_per)
+        if not self.enabled:
+            return db.session.scalars(statement)
+        streams = [db.session.scalars(statement, bind_arguments={'bind': self.engine(s)}) for s in range(self.count)]
+        return heapq.merge(*streams, key=key, reverse=reverse)
+
+    def fan_out(self, fn, *args):
+        # runs fn once per shard in parallel, each in its own app context and session
+        if not self.enabled:
+            return [fn(*args)]
+        app = current_app._get_current_object()
+
+        def run(shard):
+            with app.app_context():
+                g.db_shard = shard
+                try:
+                    return fn(*args)
+                finally:
+                    db.session.remove()
+        return list(self._executor.map(run, range(self.count)))
+
+    # --- setup ---
+
+    def create_tables(self):
+        tables = [db.metadata.tables[name] for name in SHARDED_TABLES]
+        for shard in range(self.count):
+            engine = self.engine(shard)
+            db.metadata.create_all(engine, tables=tables)
+            with engine.begin() as conn:
+                conn.execute(text('CREATE TABLE IF NOT EXISTS main.shard_sequences '
+                                  '(name VARCHAR(64) PRIMARY KEY, next_id INTEGER NOT NULL)'))
+                for name in SHARDED_TABLES:
+                    conn.execute(text('INSERT OR IGNORE INTO main.shard_sequences (name, next_id) VALUES (:n, 1)'),
+                                 {'n': name})
+
+    def split(self, batch_size=5000):
+        # copy department data out of the global database, re-keying ids so they
+        # encode their shard; the global copies are left in place but never read again
+        shard_of_appt = {}
+        moved = {}
+        copied = {name: 0 for name in SHARDED_TABLES}
+        with db.engines[None].connect() as src:
+            for model in (DoctorAvailability, Appointment, Treatment):
+                table = model.__table__
+                for rows in src.execute(select(table).order_by(table.c.id)).mappings().partitions(batch_size):
+                    by_shard = {}
+                    for row in rows:
+                        row = dict(row)
+                        if model is Treatment:
+                            shard = shard_of_appt.get(row['appointment_id'])
+                            if shard is None:
+                                continue
+                            row['appointment_id'] = encode_id(row['appointment_id'], shard)
+                        else:
+                            shard = self.shard_of_doctor(row['doctor_id'])
+                            if model is Appointment:
+                                shard_of_appt[row['id']] = shard
+                        row['id'] = encode_id(row['id'], shard)
+                        by_shard.setdefault(shard, []).append(row)
+                    for shard, batch in by_shard.items():
+                        with self.engine(shard).begin() as conn:
+                            if model is Appointment:
+                                # only appointments first copied by this run have references to re-key
+                                ids = [row['id'] for row in batch]
+                                seen = set(conn.execute(select(table.c.id).where(table.c.id.in_(ids))).scalars())
+                                moved.update((new // ID_STRIDE, new) for new in ids if new not in seen)
+                            conn.execute(insert(table).prefix_with('OR IGNORE').values(batch))
+                        copied[table.name] += len(batch)
+                # new rows continue after the highest copied id in every shard
+                top = src.execute(select(db.func.max(table.c.id))).scalar() or 0
+                for shard in range(self.count):
+                    with self.engine(shard).begin() as conn:
+                        conn.execute(text('UPDATE main.shard_sequences SET next_id = MAX(next_id, :n) WHERE name = :t'),
+                                     {'n': top + 1, 't': table.name})
+        return copied, self._rekey_references(moved)
+
+    @staticmethod
+    def _rekey_references(moved):
+        # the change log and the job outbox stay global and still hold the old appointment
+        # ids; rewrite them in one transaction. Each UPDATE reads every row once, so a new
+        # id that equals some other old id is never re-keyed twice.
+        events, jobs = AppointmentEvent.__table__, Job.__table__
+        rekeyed = {events.name: 0, jobs.name: 0}
+        if not moved:
+            return rekeyed
+        with db.engines[None].begin() as conn:
+            conn.execute(text('CREATE TEMP TABLE split_ids (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)'))
+            conn.execute(text('INSERT INTO temp.split_ids (old, new) VALUES (:old, :new)'),
+                         [{'old': old, 'new': new} for old, new in moved.items()])
+            rekeyed[events.name] = conn.execute(text(
+                'UPDATE appointment_events SET appointment_id = s.new, '
+                "payload = CASE WHEN json_valid(payload) THEN json_set(payload, '$.id', s.new) ELSE payload END "
+                'FROM temp.split_ids AS s WHERE s.old = appointment_events.appointment_id')).rowcount
+
+            # reminder jobs are deduped on 'reminder:<appointment id>'; keys are cleared first so
+            # a job taking a key another job is about to give up does not hit the unique index.
+            # A job for an appointment deleted before the split would now point at whichever
+            # appointment took its id, so it is retired instead.
+            taken = set(moved.values())
+            changed, retired = [], []
+            for job_id, payload, key, status in conn.execute(
+                    select(jobs.c.id, jobs.c.payload, jobs.c.dedupe_key, jobs.c.status)
+                    .where(jobs.c.payload.like('%"appointment_id"%'))):
+                data = json.loads(payload)
+                old = data.get('appointment_id')
+                if old in moved:
+                    data['appointment_id'] = moved[old]
+                    new = moved[old]
+                    changed.append((job_id, json.dumps(data), reminder_key(new) if key == reminder_key(old) else key))
+                elif old in taken:
+                    retired.append((job_id, status))
+            for job_id, status in retired:
+                values = {'dedupe_key': None}
+                if status != JobStatus.DONE:
+                    values.update(status=JobStatus.DONE, last_error='appointment deleted before the shard split')
+                conn.execute(update(jobs).where(jobs.c.id == job_id).values(**values))
+            for job_id, _, _ in changed:
+                conn.execute(update(jobs).where(jobs.c.id == job_id).values(dedupe_key=None))
+            for job_id, payload, key in changed:
+                conn.execute(update(jobs).where(jobs.c.id == job_id).values(payload=payload, dedupe_key=key))
+            rekeyed[jobs.name] = len(changed)
+            conn.execute(text('DROP TABLE temp.split_ids'))
+        return rekeyed
+
+
+def _connection_for_instance(session, mapper, instance):
+    # flush-time placement: department rows go to their shard, everything else to the primary
+    router = session.shard_router
+    if mapper.local_table.name in SHARDED_TABLES:
+        return session.connection(bind_arguments={'bind': router.engine(router.shard_for_instance(instance))})
+    return session.connection(bind_arguments={'mapper': mapper})
+
+
+shard_router = ShardRouter()
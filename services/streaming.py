@@ -0,0 +1,31 @@
+from flask import current_app, stream_template, get_flashed_messages
+
+# one socket write per this many characters of rendered HTML, instead of one per template node
+CHUNK_SIZE = 8 * 1024
+# rows fetched from the cursor at a time by listing pages; the first batch delays the first row
+ROWS_PER_FETCH = 100
+
+
+def stream_page(template_name, **context):
+    # render_template for long listings: the page chrome goes out before the first row is
+    # fetched, and rows are rendered as the cursor yields them, so memory stays flat.
+    # Flashes are popped now: the session cookie is saved before the body renders.
+    context.setdefault('flashed_messages', get_flashed_messages(with_categories=True))
+    return current_app.response_class(_buffered(stream_template(template_name, **context)),
+                                      mimetype='text/html')
+
+
+def _buffered(chunks):
+    pending, size = [], 0
+    try:
+        for chunk in chunks:
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= CHUNK_SIZE:
+                yield ''.join(pending)
+                pending, size = [], 0
+        if pending:
+            yield ''.join(pending)
+    finally:
+        # stream_with_context tears down the request (and the session) on close
+        chunks.close()
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import uuid
+import signal
+import socket
+import logging
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# Add parent dir for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, Job, JobStatus, utc_now
+from services.jobs import handlers, scan_reminders, reminder_lead
+from services.idempotency import purge_expired
+
+logger = logging.getLogger('medicall.worker')
+
+
+class Worker:
+    def __init__(self, app, batch_size=20, concurrency=4, poll_interval=1.0, lease_seconds=300,
+                 scan_interval=60, retention_days=7, max_backoff=3600):
+        self.app = app
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease_seconds)
+        self.scan_interval = scan_interval
+        self.retention = timedelta(days=retention_days)
+        self.max_backoff = max_backoff
+        self.token = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = False
+        self.scanned_until = None
+        self.next_maintenance = 0
+
+    def claim(self):
+        now = utc_now()
+        ids = [row[0] for row in db.session.query(Job.id)
+               .filter(Job.status == JobStatus.PENDING, Job.run_after <= now)
+               .order_by(Job.run_after, Job.id)
+               .limit(self.batch_size).all()]
+        if not ids:
+            db.session.rollback()
+            return []
+
+        # the status guard makes this safe against other workers claiming the same rows
+        Job.query.filter(Job.id.in_(ids), Job.status == JobStatus.PENDING).update({
+            'status': JobStatus.RUNNING,
+            'locked_by': self.token,
+            'locked_at': now,
+            'attempts': Job.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+
+        return [row[0] for row in db.session.query(Job.id)
+                .filter(Job.status == JobStatus.RUNNING, Job.locked_by == self.token).all()]
+
+    def run_one(self, job_id):
+        with self.app.app_context():
+            job = db.session.get(Job, job_id)
+            try:
+                handler = handlers.get(job.kind)
+                if handler is None:
+                    raise LookupError(f'No handler registered for {job.kind}')
+                handler(job)
+                db.session.commit()
+                self.finish(job_id)
+            except Exception:
+                db.session.rollback()
+                self.retry_or_fail(job_id, traceback.format_exc())
+            finally:
+                db.session.remove()
+
+    def finish(self, job_id):
+        Job.query.filter_by(id=job_id).update({'status': JobStatus.DONE, 'locked_by': None, 'last_error': None})
+        db.session.commit()
+
+    def retry_or_fail(self, job_id, error):
+        job = db.session.get(Job, job_id)
+        job.last_error = error[-2000:]
+        job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            job.status = JobStatus.FAILED
+            logger.error('Job %s (%s) failed permanently after %s attempts', job.id, job.kind, job.attempts)
+        else:
+            # exponential backoff: 2s, 4s, 8s ... capped
+            delay = min(2 ** job.attempts, self.max_backoff)
+            job.status = JobStatus.PENDING
+            job.run_after = utc_now() + timedelta(seconds=delay)
+            logger.warning('Job %s (%s) failed, retrying in %ss', job.id, job.kind, delay)
+        db.session.commit()
+
+    def maintain(self):
+        if time.monotonic() < self.next_maintenance:
+            return
+        self.next_maintenance = time.monotonic() + self.scan_interval
+
+        # jobs whose worker died mid-run go back to the queue once their lease expires
+        stale = Job.query.filter(Job.status == JobStatus.RUNNING, Job.locked_at < utc_now() - self.lease)\
+            .update({'status': JobStatus.PENDING, 'locked_by': None}, synchronize_session=False)
+        if stale:
+            logger.warning('Requeued %s stale jobs', stale)
+
+        Job.query.filter(Job.status == JobStatus.DONE, Job.updated_at < utc_now() - self.retention)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+        purged = purge_expired()
+        if purged:
+            logger.info('Purged %s expired idempotency keys', purged)
+
+        # scan only the slice of the schedule that entered the reminder horizon since last time
+        now = datetime.now()
+        start = self.scanned_until or now
+        end = now + reminder_lead() + timedelta(seconds=self.scan_interval)
+        scheduled = scan_reminders(start, end)
+        self.scanned_until = end
+        if scheduled:
+            logger.info('Scheduled %s reminders', scheduled)
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, once=False):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info('Worker %s started (batch=%s, concurrency=%s)', self.token, self.batch_size, self.concurrency)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while not self.stopping:
+                with self.app.app_context():
+                    self.maintain()
+                    ids = self.claim()
+                    db.session.remove()
+
+                if ids:
+                    list(pool.map(self.run_one, ids))
+                    continue
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+
+        logger.info('Worker %s stopped', self.token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run background jobs (reminders and post-commit side effects)')
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--scan-interval', type=int, default=60, help='seconds between reminder scans')
+    parser.add_argument('--once', action='store_true', help='drain the queue and exit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    from app import app
+    Worker(
+        app,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+        scan_interval=args.scan_interval
+    ).run(once=args.once)
+
+
+if __name__ == '__main__':
+    main()
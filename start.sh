@@ -1,8 +1,11 @@
 #!/usr/bin/env bash
 set -e
 
-echo "Running migrations..."
+echo "Applying schema migrations..."
+flask --app app migrate
+
+echo "Seeding demo data..."
 python migrations/migration.py
 
 echo "Starting application..."
-exec gunicorn app:app
+exec gunicorn -c gunicorn.conf.py app:app
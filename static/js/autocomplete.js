@@ -0,0 +1,70 @@
+// find a doctor: suggestions from /api/autocomplete while typing
+document.addEventListener('DOMContentLoaded', function () {
+    const input = document.querySelector('[data-autocomplete-url]');
+    if (!input) return;
+    const form = input.form;
+    const menu = document.createElement('div');
+    menu.className = 'list-group position-absolute w-100 shadow-sm d-none';
+    menu.style.zIndex = 1000;
+    input.parentElement.classList.add('position-relative');
+    input.after(menu);
+    let timer = null;
+    let latest = 0;
+
+    function hide() {
+        menu.classList.add('d-none');
+        menu.replaceChildren();
+    }
+
+    function choose(item) {
+        if (item.type === 'doctor') {
+            window.location = input.dataset.bookUrl.replace(/\/0$/, '/' + item.id);
+            return;
+        }
+        form.elements.department_id.value = item.id;
+        input.value = '';
+        form.submit();
+    }
+
+    function show(items) {
+        menu.replaceChildren();
+        items.forEach(function (item) {
+            const a = document.createElement('button');
+            a.type = 'button';
+            a.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+            const label = document.createElement('span');
+            label.textContent = item.label;
+            const detail = document.createElement('small');
+            detail.className = 'text-muted';
+            detail.textContent = item.type === 'doctor' ? (item.detail || '') : 'Department';
+            a.append(label, detail);
+            a.addEventListener('mousedown', function (e) {
+                e.preventDefault();
+                choose(item);
+            });
+            menu.append(a);
+        });
+        menu.classList.toggle('d-none', !items.length);
+    }
+
+    input.setAttribute('autocomplete', 'off');
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (!q) return hide();
+        timer = setTimeout(function () {
+            const request = ++latest;
+            fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(q))
+                .then(function (r) { return r.ok ? r.json() : []; })
+                .then(function (items) {
+                    // an older, slower response must not replace a newer one
+                    if (request === latest) show(items);
+                })
+                .catch(hide);
+        }, 120);
+    });
+    input.addEventListener('blur', hide);
+    input.addEventListener('keydown', function (e) {
+        if (e.key === 'Escape') hide();
+    });
+});
@@ -0,0 +1,57 @@
+// medical history: entries render a summary; the full treatment loads when expanded
+document.addEventListener('DOMContentLoaded', function () {
+    const sections = [
+        ['diagnosis', 'Diagnosis', 'text-primary', ''],
+        ['prescription', 'Prescription', 'text-success', ''],
+        ['notes', 'Notes', 'text-muted', 'small'],
+        ['doctor_notes', 'Private Notes', 'text-info', 'small fst-italic']
+    ];
+
+    function render(target, treatment) {
+        target.replaceChildren();
+        sections.forEach(function ([key, title, titleCls, textCls]) {
+            if (!treatment[key]) return;
+            const h = document.createElement('h6');
+            h.className = 'card-title ' + titleCls;
+            h.textContent = title;
+            const p = document.createElement('p');
+            p.className = 'card-text ' + textCls;
+            p.style.whiteSpace = 'pre-line';
+            p.textContent = treatment[key];
+            target.append(h, p);
+        });
+    }
+
+    document.querySelectorAll('[data-treatment-url]').forEach(function (btn) {
+        btn.addEventListener('click', function () {
+            const card = btn.closest('.card');
+            const summary = card.querySelector('.treatment-summary');
+            const detail = card.querySelector('.treatment-detail');
+            if (btn.dataset.loaded) {
+                const open = detail.classList.toggle('d-none');
+                summary.classList.toggle('d-none', !open);
+                btn.textContent = open ? 'Show details' : 'Hide details';
+                return;
+            }
+            btn.disabled = true;
+            fetch(btn.dataset.treatmentUrl, { credentials: 'same-origin' })
+                .then(function (r) {
+                    if (!r.ok) throw new Error(r.status);
+                    return r.json();
+                })
+                .then(function (treatment) {
+                    render(detail, treatment);
+                    btn.dataset.loaded = '1';
+                    summary.classList.add('d-none');
+                    detail.classList.remove('d-none');
+                    btn.textContent = 'Hide details';
+                })
+                .catch(function () {
+                    btn.textContent = 'Could not load details';
+                })
+                .finally(function () {
+                    btn.disabled = false;
+                });
+        });
+    });
+});
@@ -10,6 +10,12 @@ from .utils import (
     validate_length,
     sanitize_input
 )
+from .passwords import (
+    hash_password,
+    verify_password,
+    needs_rehash,
+    hash_passwords
+)
 
 __all__ = [
     'ValidationError',
@@ -21,6 +27,10 @@ __all__ = [
     'validate_time_range',
     'validate_gender',
     'validate_length',
-    'sanitize_input'
+    'sanitize_input',
+    'hash_password',
+    'verify_password',
+    'needs_rehash',
+    'hash_passwords'
 ]
 
@@ -0,0 +1,58 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+DEFAULT_HASH_METHOD = 'scrypt'
+
+# below this many passwords the pool start-up costs more than it saves
+POOL_THRESHOLD = 4
+
+
+def configured_hash_method():
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_HASH_METHOD
+    return os.getenv('PASSWORD_HASH_METHOD') or DEFAULT_HASH_METHOD
+
+
+def normalize_hash_method(method):
+    # expand werkzeug shorthands ("scrypt", "pbkdf2") to the prefix it stores in the hash
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args if args else (2 ** 15, 8, 1)
+        return f'scrypt:{int(n)}:{int(r)}:{int(p)}'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f"Invalid hash method '{method}'")
+
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method=method or configured_hash_method())
+
+
+def verify_password(pw_hash, password):
+    return check_password_hash(pw_hash, password)
+
+
+def needs_rehash(pw_hash, method=None):
+    stored = pw_hash.split('$', 1)[0] if pw_hash else ''
+    return stored != normalize_hash_method(method or configured_hash_method())
+
+
+def _hash_one(args):
+    password, method = args
+    return generate_password_hash(password, method=method)
+
+
+def hash_passwords(passwords, method=None, workers=None):
+    # bulk hashing for seeding/imports; spreads the work over a process pool
+    method = method or configured_hash_method()
+    passwords = list(passwords)
+    if len(passwords) < POOL_THRESHOLD:
+        return [generate_password_hash(p, method=method) for p in passwords]
+
+    workers = workers or min(len(passwords), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_hash_one, [(p, method) for p in passwords], chunksize=max(1, len(passwords) // (workers * 4))))